@@ -0,0 +1,17 @@
+import secrets
+from typing import Optional
+
+from fastapi import Header
+from fastapi.exceptions import HTTPException
+from starlette import status
+
+from app.core import config
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    return token is not None and secrets.compare_digest(token, str(config.ADMIN_TOKEN))
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status.HTTP_403_FORBIDDEN, "Admin token required")
@@ -0,0 +1,30 @@
+from datetime import datetime
+from typing import Optional
+
+from fastapi import Header
+from fastapi.exceptions import HTTPException
+from starlette import status
+
+
+def get_if_match(if_match: Optional[str] = Header(None)) -> Optional[datetime]:
+    """
+    `If-Match` carries the `updated_at` value of the representation the client
+    last saw. Mutations only apply while the row still has that value.
+    """
+    if if_match is None:
+        return
+
+    value = if_match.strip()
+    if value == "*":
+        return
+
+    if value.startswith("W/"):
+        value = value[2:]
+    value = value.strip('"')
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid If-Match header")
@@ -2,13 +2,23 @@ from typing import Callable, Type
 
 from databases import Database
 from fastapi import Depends
+from starlette.requests import Request
 
 from app.api.dependencies.database import get_database
+from app.core.tracing import span
 from app.db.repositories.base import BaseRepository
+from app.db.repositories.native import NATIVE_REPOSITORIES
 
 
 def get_repository(repository_type: Type[BaseRepository]) -> Callable:
-    def __get_repository(db: Database = Depends(get_database)) -> BaseRepository:
-        return repository_type(db)
+    def __get_repository(
+        request: Request, db: Database = Depends(get_database)
+    ) -> BaseRepository:
+        repository_class = repository_type
+        if request.app.state._db_backend == "asyncpg":
+            repository_class = NATIVE_REPOSITORIES.get(repository_type, repository_type)
+
+        with span("get_repository", repository=repository_class.repository_name):
+            return repository_class(db)
 
     return __get_repository
@@ -0,0 +1,146 @@
+"""
+Response compression.
+
+Responses of at least `COMPRESSION_MIN_SIZE` bytes of a compressible type (JSON,
+MessagePack, text) are compressed with brotli (when installed) or gzip,
+whichever the client's `Accept-Encoding` ranks first (brotli on ties), and marked
+`Vary: Accept-Encoding` so that HTTP caches keep one copy per coding.
+
+Compressed bodies are cached (LRU, `COMPRESSION_CACHE_SIZE` bytes per worker)
+by digest of the uncompressed body and coding: a page served again, to any
+client, is compressed once. Bodies of at least `COMPRESSION_OFFLOAD_BYTES` are
+compressed in the offload pool. Streamed responses are sent as they are.
+
+No ETag is derived from the body: `ETag`/`If-Match` values are `updated_at`
+timestamps (see `app.api.dependencies.preconditions`).
+"""
+import gzip
+from collections import OrderedDict
+from hashlib import blake2b
+from typing import Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.api.negotiation import choose_encoding
+from app.core import config
+from app.core.metrics import Counter
+from app.core.offload import run_offloaded
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# server preference order
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+COMPRESSIBLE_TYPES = ("application/json", "application/msgpack", "text/")
+
+COMPRESSED_RESPONSES = Counter(
+    "http_compressed_responses_total",
+    "Compressed responses by content coding and whether the body was cached",
+    ("encoding", "cache"),
+)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=config.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=config.COMPRESSION_GZIP_LEVEL)
+
+
+class CompressedBodies:
+    """
+    LRU of compressed bodies by (digest of the body, coding), bounded in bytes
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._bodies: "OrderedDict[Tuple[bytes, str], bytes]" = OrderedDict()
+
+    def get(self, key: Tuple[bytes, str]) -> Optional[bytes]:
+        body = self._bodies.get(key)
+        if body is not None:
+            self._bodies.move_to_end(key)
+        return body
+
+    def put(self, key: Tuple[bytes, str], body: bytes) -> None:
+        if len(body) > self.max_bytes or key in self._bodies:
+            return
+
+        self._bodies[key] = body
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, evicted = self._bodies.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.cache = CompressedBodies(config.COMPRESSION_CACHE_SIZE)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not config.COMPRESSION_MIN_SIZE:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(
+            Headers(scope=scope).get("accept-encoding"), ENCODINGS
+        )
+        response_start: Optional[Message] = None
+        body_started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_start, body_started
+            if message["type"] == "http.response.start":
+                response_start = message
+                return
+            if body_started or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body_started = True
+            if message.get("more_body", False):
+                await send(response_start)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            response_start, body = await self._compress(response_start, body, encoding)
+            await send(response_start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _compress(
+        self, response_start: Message, body: bytes, encoding: Optional[str]
+    ) -> Tuple[Message, bytes]:
+        headers = MutableHeaders(raw=list(response_start.get("headers", [])))
+        if (
+            len(body) < config.COMPRESSION_MIN_SIZE
+            or "content-encoding" in headers
+            or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+        ):
+            return response_start, body
+
+        headers.add_vary_header("Accept-Encoding")
+        if encoding is not None:
+            key = (blake2b(body, digest_size=16).digest(), encoding)
+            compressed = self.cache.get(key)
+            COMPRESSED_RESPONSES.labels(
+                encoding, "miss" if compressed is None else "hit"
+            ).inc()
+            if compressed is None:
+                if len(body) >= config.COMPRESSION_OFFLOAD_BYTES:
+                    compressed = await run_offloaded(compress, body, encoding)
+                else:
+                    compressed = compress(body, encoding)
+                self.cache.put(key, compressed)
+
+            body = compressed
+            headers["content-encoding"] = encoding
+            headers["content-length"] = str(len(body))
+
+        return dict(response_start, headers=headers.raw), body
@@ -0,0 +1,49 @@
+import json
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.api.dependencies.auth import is_admin_token
+from app.db.instrumentation import current_query_plans
+
+DEBUG_EXPLAIN_HEADER = "x-debug-explain"
+QUERY_PLANS_HEADER = b"x-query-plans"
+
+
+class ExplainMiddleware:
+    """
+    Admins sending `X-Debug-Explain: 1` get, in the `X-Query-Plans` response
+    header, a JSON list with every statement of the request and the
+    `EXPLAIN (ANALYZE, BUFFERS)` plan of the read-only ones
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        if DEBUG_EXPLAIN_HEADER not in headers or not is_admin_token(
+            headers.get("x-admin-token")
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        plans = []
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (QUERY_PLANS_HEADER, json.dumps(plans, default=str).encode())
+                ]
+            await send(message)
+
+        token = current_query_plans.set(plans)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_query_plans.reset(token)
@@ -0,0 +1,68 @@
+from time import perf_counter
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.metrics import Counter, Gauge, Histogram
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests by route, method and status code",
+    ("route", "method", "status"),
+)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ("route", "method"),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served"
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "HTTP response body size by route",
+    ("route",),
+    buckets=(100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000),
+)
+
+# requests no route matched (404/405), kept apart so raw paths never become labels
+UNMATCHED_ROUTE = "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Request metrics labelled by route name (set in the scope by
+    `app.api.routing.APIRoute` once the router matched)
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        response_size = 0
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec()
+
+            route = scope.get("route_name", UNMATCHED_ROUTE)
+            method = scope["method"]
+            REQUESTS.labels(route, method, str(status_code)).inc()
+            REQUEST_DURATION.labels(route, method).observe(elapsed)
+            RESPONSE_SIZE.labels(route).observe(response_size)
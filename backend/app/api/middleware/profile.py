@@ -0,0 +1,71 @@
+import uuid
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.api.dependencies.auth import is_admin_token
+from app.api.middleware.metrics import UNMATCHED_ROUTE
+from app.core import config
+from app.core.offload import run_offloaded
+from app.core.profiling import TaskProfiler, request_task, store_profile
+
+PROFILE_HEADER = "x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+
+
+class ProfileMiddleware:
+    """
+    Admins sending `X-Profile: 1` get the request run under the sampling
+    profiler; the profile id comes back in the `X-Profile-Id` response header
+    and the profile is downloaded from `GET /api/admin/profiles/{id}`.
+
+    Every request task is also marked for the continuous profiler.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with request_task():
+            await self._call(scope, receive, send)
+
+    async def _call(self, scope: Scope, receive: Receive, send: Send) -> None:
+        headers = Headers(scope=scope)
+        if headers.get(PROFILE_HEADER) != "1" or not is_admin_token(
+            headers.get("x-admin-token")
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (PROFILE_ID_HEADER, profile_id.encode())
+                ]
+            await send(message)
+
+        profiler = TaskProfiler(interval=config.PROFILE_INTERVAL)
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            stacks = profiler.stop()
+            await run_offloaded(
+                store_profile,
+                config.PROFILE_DIR,
+                profile_id,
+                dict(
+                    name=f"{scope['method']} {scope.get('route_name', UNMATCHED_ROUTE)}",
+                    path=scope["path"],
+                    interval=profiler.interval,
+                    duration=profiler.duration,
+                    stacks=stacks,
+                ),
+                keep=config.PROFILES_KEPT,
+            )
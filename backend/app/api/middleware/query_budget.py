@@ -0,0 +1,127 @@
+import logging
+from typing import List, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.api.middleware.metrics import UNMATCHED_ROUTE
+from app.core import config
+from app.core.metrics import Counter, Histogram
+from app.db.instrumentation import RequestStats, current_request_stats
+
+logger = logging.getLogger(__name__)
+
+# routes running many statements by design (0: no budget, no N+1 detection)
+DEFAULT_QUERY_BUDGETS = {
+    "batch:execute": 0,
+}
+
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Database round trips per request by route",
+    ("route",),
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100, 200),
+)
+REQUEST_ROWS = Histogram(
+    "http_request_db_rows",
+    "Rows fetched per request by route",
+    ("route",),
+    buckets=(0, 1, 10, 100, 1_000, 10_000, 100_000),
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_seconds",
+    "Time spent in database statements per request by route",
+    ("route",),
+)
+BUDGET_VIOLATIONS = Counter(
+    "query_budget_violations_total",
+    "Requests over their query budget or repeating a statement (N+1)",
+    ("route", "kind"),
+)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def get_query_budget(route: str) -> int:
+    budgets = {**DEFAULT_QUERY_BUDGETS, **config.QUERY_BUDGETS}
+    return budgets.get(route, config.QUERY_BUDGET)
+
+
+def check_query_budget(route: str, stats: RequestStats) -> List[str]:
+    budget = get_query_budget(route)
+    if not budget:
+        return []
+
+    violations = []
+    if stats.queries > budget:
+        BUDGET_VIOLATIONS.labels(route, "budget").inc()
+        violations.append(f"{stats.queries} queries (budget: {budget})")
+
+    for call_site, count in stats.call_sites.items():
+        if count >= config.N_PLUS_ONE_THRESHOLD:
+            BUDGET_VIOLATIONS.labels(route, "n_plus_one").inc()
+            violations.append(f"N+1: {call_site} ran {count} times")
+
+    return violations
+
+
+class QueryBudgetMiddleware:
+    """
+    Counts the statements, rows and database time of each request and checks
+    them against the route budget (`QUERY_BUDGET`/`QUERY_BUDGETS`) once the
+    response starts (statements of a streamed body are only counted).
+
+    Violations are logged, or raised before the response is sent when the
+    application has `state.query_budget_raise` set (the test suite does) so
+    that N+1 patterns fail the tests.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        checked = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal checked
+            if message["type"] == "http.response.start":
+                checked = True
+                self.check(scope, stats)
+            await send(message)
+
+        token = current_request_stats.set(stats)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request_stats.reset(token)
+
+            route = scope.get("route_name", UNMATCHED_ROUTE)
+            REQUEST_QUERIES.labels(route).observe(stats.queries)
+            REQUEST_ROWS.labels(route).observe(stats.rows)
+            REQUEST_DB_TIME.labels(route).observe(stats.db_time)
+
+        if not checked:
+            self.check(scope, stats)
+
+    @staticmethod
+    def check(scope: Scope, stats: RequestStats) -> None:
+        route = scope.get("route_name", UNMATCHED_ROUTE)
+        violations = check_query_budget(route, stats)
+        if not violations:
+            return
+
+        message = f"{scope['method']} {route}: {'; '.join(violations)}"
+        if _raise_on_violation(scope):
+            raise QueryBudgetExceeded(message)
+        logger.warning("query budget exceeded: %s", message)
+
+
+def _raise_on_violation(scope: Scope) -> Optional[bool]:
+    app = scope.get("app")
+    return getattr(app.state, "query_budget_raise", False) if app else False
@@ -0,0 +1,57 @@
+import json
+import logging
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.api.middleware.metrics import UNMATCHED_ROUTE
+from app.core import config
+from app.core.timing import (
+    RequestTimings,
+    current_request_timings,
+    server_timing_header,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ServerTimingMiddleware:
+    """
+    With `SERVER_TIMING` enabled, adds a `Server-Timing` header breaking the
+    request into pool wait, db, validation, app and serialization phases, and
+    logs the same breakdown
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not config.SERVER_TIMING:
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                phases = timings.phases()
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", server_timing_header(phases).encode())
+                ]
+                logger.info(
+                    "server-timing %s",
+                    json.dumps(
+                        dict(
+                            method=scope["method"],
+                            route=scope.get("route_name", UNMATCHED_ROUTE),
+                            status=message["status"],
+                            **{name: round(s * 1000, 3) for name, s in phases.items()},
+                        )
+                    ),
+                )
+            await send(message)
+
+        token = current_request_timings.set(timings)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request_timings.reset(token)
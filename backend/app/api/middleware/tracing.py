@@ -0,0 +1,52 @@
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.api.middleware.metrics import UNMATCHED_ROUTE
+from app.core.tracing import current_span, exporter, start_trace
+
+
+class TracingMiddleware:
+    """
+    Opens the root span of sampled requests, continuing the caller's trace when
+    it sends a `traceparent` header, and returns the request span in a
+    `traceparent` response header
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not exporter.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        root = start_trace(
+            Headers(scope=scope).get("traceparent"),
+            scope["method"],
+            **{"http.method": scope["method"], "http.target": scope["path"]},
+        )
+        if root is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                route = scope.get("route_name", UNMATCHED_ROUTE)
+                root.name = f"{scope['method']} {route}"
+                root.set_attribute("http.route", route)
+                root.set_attribute("http.status_code", message["status"])
+                root.error = message["status"] >= 500
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"traceparent", root.traceparent.encode())
+                ]
+            await send(message)
+
+        token = current_span.set(root)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException:
+            root.error = True
+            raise
+        finally:
+            current_span.reset(token)
+            root.finish()
@@ -0,0 +1,69 @@
+"""
+Content negotiation: `Accept` (JSON or MessagePack) and `Accept-Encoding`.
+"""
+from typing import List, Optional, Sequence, Tuple
+
+JSON_MEDIA_RANGES = ("application/json", "application/*", "*/*")
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def quality_values(header: str) -> List[Tuple[str, float]]:
+    """
+    `(value, q)` of each element of an `Accept*` header, in header order
+    """
+    values = []
+    for element in header.split(","):
+        value, *parameters = element.split(";")
+        value = value.strip().lower()
+        if not value:
+            continue
+
+        q = 1.0
+        for parameter in parameters:
+            name, _, q_value = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(q_value)
+                except ValueError:
+                    q = 0.0
+        values.append((value, q))
+    return values
+
+
+def prefers_msgpack(accept: Optional[str]) -> bool:
+    """
+    Whether `accept` ranks MessagePack above JSON: higher q, or the same q and
+    listed first (wildcards lose ties)
+    """
+    if not accept or "msgpack" not in accept:
+        return False
+
+    msgpack_rank = json_rank = (0.0, 0, 0)
+    for position, (media_type, q) in enumerate(reversed(quality_values(accept))):
+        if media_type in MSGPACK_MEDIA_TYPES:
+            msgpack_rank = max(msgpack_rank, (q, 1, position))
+        elif media_type in JSON_MEDIA_RANGES:
+            specific = int(media_type == "application/json")
+            json_rank = max(json_rank, (q, specific, position))
+
+    return msgpack_rank[0] > 0 and msgpack_rank > json_rank
+
+
+def choose_encoding(
+    accept_encoding: Optional[str], encodings: Sequence[str]
+) -> Optional[str]:
+    """
+    The content coding of `encodings` (server preference order, used for ties)
+    ranked first by `accept_encoding`; None to send the body as it is
+    """
+    if not accept_encoding:
+        return
+
+    accepted = dict(quality_values(accept_encoding))
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = accepted.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
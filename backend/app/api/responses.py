@@ -0,0 +1,143 @@
+"""
+orjson-backed JSON responses, and MessagePack ones.
+
+`jsonable_encoder` walks every value of a response in Python before the
+standard library encodes the result again; here validated models are only
+turned into dicts (`BaseModel.dict()`) and orjson encodes everything else
+natively, producing the same JSON: timezone-aware datetimes in ISO 8601 with
+their offset, `Decimal`s as numbers, enums by value, non-string keys as strings.
+
+MessagePack responses carry the same values, datetimes and UUIDs as the same
+strings as in JSON; they are only offered when `msgpack` is installed.
+"""
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
+from types import GeneratorType
+from typing import Any
+from uuid import UUID
+
+import orjson
+from pydantic import BaseModel
+from starlette.responses import JSONResponse, Response
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, BaseModel):
+        # only for content that did not go through `to_content`
+        return value.dict(by_alias=True)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value
+    return _default(value)
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+loads = orjson.loads
+
+
+def to_content(
+    value: Any,
+    *,
+    include=None,
+    exclude=None,
+    by_alias: bool = True,
+    exclude_unset: bool = False,
+    exclude_defaults: bool = False,
+    exclude_none: bool = False,
+) -> Any:
+    """
+    What `jsonable_encoder` makes of `value`, as far as orjson needs it: models
+    are turned into dicts with the same options wherever they are nested, so
+    that none is left for `_default`
+    """
+    if include is not None and not isinstance(include, set):
+        include = set(include)
+    if exclude is not None and not isinstance(exclude, set):
+        exclude = set(exclude)
+
+    if isinstance(value, BaseModel):
+        return value.dict(
+            include=include,
+            exclude=exclude,
+            by_alias=by_alias,
+            exclude_unset=exclude_unset,
+            exclude_defaults=exclude_defaults,
+            exclude_none=exclude_none,
+        )
+    if isinstance(value, (list, tuple, set, frozenset, GeneratorType)):
+        return [
+            to_content(
+                item,
+                include=include,
+                exclude=exclude,
+                by_alias=by_alias,
+                exclude_unset=exclude_unset,
+                exclude_defaults=exclude_defaults,
+                exclude_none=exclude_none,
+            )
+            for item in value
+        ]
+    if isinstance(value, dict):
+        # as jsonable_encoder: include and exclude filter the keys of this dict
+        # only (include winning), exclude_defaults is not passed on to values
+        return {
+            key: to_content(
+                item,
+                by_alias=by_alias,
+                exclude_unset=exclude_unset,
+                exclude_none=exclude_none,
+            )
+            for key, item in value.items()
+            if (not exclude_none or item is not None)
+            and ((include and key in include) or not exclude or key not in exclude)
+        }
+    return value
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    Default response class of the API routes (see `app.api.routing`)
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class MsgPackResponse(Response):
+    """
+    Sent instead of an `ORJSONResponse` to clients preferring MessagePack (see
+    `app.api.routing`)
+    """
+
+    media_type = "application/msgpack"
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content, default=_msgpack_default, use_bin_type=True)
+
+
+class RenderedJSONResponse(Response):
+    """
+    JSON rendered elsewhere (e.g. by the database), sent as it is
+    """
+
+    media_type = "application/json"
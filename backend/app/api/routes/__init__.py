@@ -1,7 +1,16 @@
-from app.api.routes import customers, products, orders
-from fastapi import APIRouter
+from app.api.dependencies.auth import require_admin
+from app.api.routing import APIRoute
+from app.api.routes import admin, batch, customers, products, orders
+from fastapi import APIRouter, Depends
 
-router = APIRouter()
+router = APIRouter(route_class=APIRoute)
 router.include_router(products.router, prefix="/products", tags=["Products"])
 router.include_router(customers.router, prefix="/customers", tags=["Customers"])
 router.include_router(orders.router, prefix="/orders", tags=["Orders"])
+router.include_router(batch.router, prefix="/batch", tags=["Batch"])
+router.include_router(
+    admin.router,
+    prefix="/admin",
+    tags=["Admin"],
+    dependencies=[Depends(require_admin)],
+)
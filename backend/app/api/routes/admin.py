@@ -0,0 +1,176 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, Path, Query
+from fastapi.exceptions import HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from starlette import status
+from starlette.requests import Request
+
+from app.api.dependencies.repositories import get_repository
+from app.api.routing import APIRoute
+from app.core import config
+from app.core.loop_monitor import loop_blocks
+from app.core.profiling import Stacks, load_profile, to_collapsed, to_speedscope
+from app.db.instrumentation import slow_query_plans
+from app.db.recompute import start_order_totals_recompute
+from app.db.repositories.customers import CustomersRepository
+from app.db.repositories.orders import OrdersRepository
+from app.models.customer import CustomerNamePropagationLag
+from app.models.loop import LoopBlock
+from app.models.order import OrderTotalsRecompute, OrderTotalsRecomputeJob
+from app.models.query import QueryPlan
+
+router = APIRouter(route_class=APIRoute)
+
+
+@router.post(
+    "/orders/recompute-totals",
+    response_model=OrderTotalsRecomputeJob,
+    name="admin:recompute-order-totals",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Recompute order totals",
+    description="""Starts recomputing the total of every order matching the filters from its items, chunk by chunk, in the background: the job comes back right away, its progress at the URL of the `Location` header.
+
+Chunks hold **chunk_size** consecutive matching orders, each one a short transaction of its own. By default only orders whose stored total differs are touched (**only_mismatched**).""",
+)
+async def recompute_order_totals(
+    recompute: OrderTotalsRecompute,
+    request: Request,
+    response: Response,
+    orders_repo: OrdersRepository = Depends(get_repository(OrdersRepository)),
+):
+    job = await orders_repo.create_order_totals_recompute()
+    start_order_totals_recompute(request.app, job, recompute)
+
+    response.headers["Location"] = request.app.url_path_for(
+        "admin:get-order-totals-recompute", job_id=str(job.id)
+    )
+    return job
+
+
+@router.get(
+    "/orders/recompute-totals/{job_id}",
+    response_model=OrderTotalsRecomputeJob,
+    name="admin:get-order-totals-recompute",
+    summary="Order totals recompute progress",
+    description="""Status (**running**, **done** or **failed**) of a recompute job, the range of order ids it covers, the last one processed, and the chunks and orders updated so far.""",
+)
+async def get_order_totals_recompute(
+    job_id: int = Path(..., ge=1),
+    orders_repo: OrdersRepository = Depends(get_repository(OrdersRepository)),
+):
+    job = await orders_repo.get_order_totals_recompute(job_id=job_id)
+    if job is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Recompute job not found")
+    return job
+
+
+@router.get(
+    "/customers/name-propagation",
+    response_model=CustomerNamePropagationLag,
+    name="admin:customer-name-propagation",
+    summary="Customer rename propagation lag",
+    description="""Reports the customer renames not yet copied to their orders: pending jobs, orders still to be visited and the age of the oldest job (**lag**, in seconds).""",
+)
+async def get_customer_name_propagation(
+    customers_repo: CustomersRepository = Depends(get_repository(CustomersRepository)),
+):
+    return await customers_repo.get_customer_name_propagation_lag()
+
+
+@router.get(
+    "/slow-queries",
+    response_model=List[QueryPlan],
+    name="admin:slow-queries",
+    summary="Latest explained slow queries",
+    description="""The latest statements slower than **SLOW_QUERY_THRESHOLD** that were sampled (**SLOW_QUERY_EXPLAIN_RATE**) for an `EXPLAIN (ANALYZE, BUFFERS)`, newest first.
+
+The plan of every statement of a single request can be obtained by sending it with the `X-Debug-Explain: 1` and `X-Admin-Token` headers: the plans come back in the `X-Query-Plans` response header.""",
+)
+async def get_slow_queries():
+    return list(reversed(slow_query_plans))
+
+
+@router.get(
+    "/loop-blocks",
+    response_model=List[LoopBlock],
+    name="admin:loop-blocks",
+    summary="Latest event loop blocks",
+    description="""The latest steps that kept the event loop of the worker serving this request busy for longer than **LOOP_BLOCK_THRESHOLD**, newest first: the task running, its stack (innermost frame first) when the block was detected, and how long the loop was blocked.
+
+Event loop lag is also exported in the `event_loop_lag_seconds` histogram.""",
+)
+async def get_loop_blocks():
+    return list(reversed(loop_blocks))
+
+
+@router.get(
+    "/profiles/{profile_id}",
+    name="admin:get-profile",
+    summary="Download a request profile",
+    description="""Profile of a request sent with the `X-Profile: 1` and `X-Admin-Token` headers, whose id came back in the `X-Profile-Id` response header.
+
+As a [speedscope](https://www.speedscope.app) file (default) or as collapsed stacks (**format=collapsed**) for flamegraph tools. Frames ending in `[await]` are time spent suspended (database I/O...).""",
+    response_class=Response,
+)
+async def get_profile(
+    profile_id: str = Path(..., regex="^[0-9a-f]{32}$"),
+    format: str = Query("speedscope", regex="^(speedscope|collapsed)$"),
+):
+    profile = load_profile(config.PROFILE_DIR, profile_id)
+    if profile is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Profile not found")
+
+    return _profile_response(
+        profile["stacks"],
+        format=format,
+        name=profile["name"],
+        interval=profile["interval"],
+        filename=profile_id,
+    )
+
+
+@router.get(
+    "/profiler",
+    name="admin:get-profiler-stacks",
+    summary="Continuous profiler stacks",
+    description="""Stacks sampled by the continuous profiler of the worker serving this request (**PROFILER_ENABLED**) over the last **minutes**, as a [speedscope](https://www.speedscope.app) file (default) or as collapsed stacks (**format=collapsed**) for flamegraph tools.
+
+Every sample has the running stack (`[idle]` when the event loop waits) and the stack of every suspended request task, ending in `[await]`.""",
+    response_class=Response,
+)
+async def get_profiler_stacks(
+    request: Request,
+    minutes: float = Query(5, gt=0),
+    format: str = Query("speedscope", regex="^(speedscope|collapsed)$"),
+):
+    profiler = request.app.state._profiler
+    if profiler is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Profiler is disabled")
+
+    return _profile_response(
+        profiler.stacks(minutes * 60),
+        format=format,
+        name=f"last {minutes:g} minutes",
+        interval=profiler.interval,
+        filename=f"profiler-{minutes:g}m",
+    )
+
+
+def _profile_response(
+    stacks: Stacks, *, format: str, name: str, interval: float, filename: str
+) -> Response:
+    if format == "collapsed":
+        return PlainTextResponse(
+            to_collapsed(stacks),
+            headers={
+                "Content-Disposition": f'attachment; filename="{filename}.collapsed.txt"'
+            },
+        )
+
+    return JSONResponse(
+        to_speedscope(stacks, name=name, interval=interval),
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}.speedscope.json"'
+        },
+    )
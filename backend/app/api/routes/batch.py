@@ -0,0 +1,250 @@
+import asyncio
+import json
+import logging
+from typing import List
+
+from databases import Database
+from fastapi import APIRouter, Depends
+from fastapi.exception_handlers import (
+    http_exception_handler,
+    request_validation_exception_handler,
+)
+from fastapi.exceptions import HTTPException, RequestValidationError
+from starlette import status
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.requests import Request
+from starlette.routing import Match
+
+from app.api.dependencies.database import get_database
+from app.api.middleware.metrics import MetricsMiddleware
+from app.api.routing import APIRoute
+from app.core import config
+from app.models.batch import BatchRequest, BatchSubRequest, BatchSubResponse
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=APIRoute)
+
+DEFAULT_EXCEPTION_HANDLERS = {
+    StarletteHTTPException: http_exception_handler,
+    RequestValidationError: request_validation_exception_handler,
+}
+
+
+_NOT_BATCHABLE = BatchSubResponse(
+    status=status.HTTP_400_BAD_REQUEST,
+    body={"detail": "Only API calls (except batches) can be batched"},
+)
+
+
+class _RollbackBatch(Exception):
+    pass
+
+
+@router.post(
+    "",
+    response_model=List[BatchSubResponse],
+    name="batch:execute",
+    summary="Execute many API calls at once",
+    description="""Runs a list of API calls in a single round trip and returns their statuses and bodies, in the same order.
+
+Consecutive **GET** calls run concurrently, every other call runs alone and in order.
+
+With **transaction** enabled all calls run one after the other inside a single database transaction, and the first failing call rolls back the whole batch (the remaining calls are reported as **424**).
+
+Calls go straight to their routes: each one is counted in the request metrics (**http_requests_total**...) under its own route, but the rest of the middleware applies to the batch as a whole (query budget, tracing spans, Server-Timing, profiling, compression of the batch response). Batches can not be nested.""",
+)
+async def execute_batch(
+    batch: BatchRequest,
+    request: Request,
+    db: Database = Depends(get_database),
+):
+    if len(batch.requests) > config.BATCH_MAX_REQUESTS:
+        raise HTTPException(
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            f"a batch can not have more than {config.BATCH_MAX_REQUESTS} requests",
+        )
+
+    if batch.transaction:
+        return await _execute_in_transaction(request, db, batch.requests)
+
+    return await _execute(request, batch.requests)
+
+
+async def _execute(
+    request: Request, sub_requests: List[BatchSubRequest]
+) -> List[BatchSubResponse]:
+    semaphore = asyncio.Semaphore(config.BATCH_MAX_CONCURRENCY)
+
+    async def dispatch(sub_request: BatchSubRequest) -> BatchSubResponse:
+        async with semaphore:
+            return await _dispatch(request, sub_request)
+
+    # every call gets its own task (and so its own pooled connection), even the
+    # writes which are awaited one at a time
+    responses: List[BatchSubResponse] = []
+    reads: List[BatchSubRequest] = []
+
+    for sub_request in sub_requests:
+        if sub_request.method == "GET":
+            reads.append(sub_request)
+            continue
+
+        if reads:
+            responses.extend(await asyncio.gather(*map(dispatch, reads)))
+            reads = []
+        responses.append(await asyncio.ensure_future(dispatch(sub_request)))
+
+    if reads:
+        responses.extend(await asyncio.gather(*map(dispatch, reads)))
+
+    return responses
+
+
+async def _execute_in_transaction(
+    request: Request, db: Database, sub_requests: List[BatchSubRequest]
+) -> List[BatchSubResponse]:
+    # everything runs in this task, so every repository shares the connection
+    # (and the transaction) bound to it
+    responses: List[BatchSubResponse] = []
+
+    try:
+        async with db.transaction():
+            for sub_request in sub_requests:
+                response = await _dispatch(request, sub_request)
+                responses.append(response)
+
+                if response.status >= 400:
+                    raise _RollbackBatch()
+    except _RollbackBatch:
+        responses.extend(
+            BatchSubResponse(
+                status=status.HTTP_424_FAILED_DEPENDENCY,
+                body={"detail": "Not executed: a previous request failed"},
+            )
+            for _ in sub_requests[len(responses) :]
+        )
+
+    return responses
+
+
+async def _dispatch(request: Request, sub_request: BatchSubRequest) -> BatchSubResponse:
+    """
+    Run a single call straight through the matching route, skipping the
+    server, the middleware stack (but the request metrics) and the HTTP
+    (de)serialization of the batch
+    """
+    path, _, query_string = sub_request.path.partition("?")
+
+    if not path.startswith(config.API_PREFIX + "/"):
+        return _NOT_BATCHABLE
+
+    headers = {"content-type": "application/json"}
+    headers.update({k.lower(): v for k, v in (sub_request.headers or {}).items()})
+    # sub-responses are embedded in the JSON batch response
+    headers["accept"] = "application/json"
+
+    scope = {
+        "type": "http",
+        "http_version": request.scope.get("http_version", "1.1"),
+        "method": sub_request.method,
+        "scheme": request.scope.get("scheme", "http"),
+        "server": request.scope.get("server"),
+        "client": request.scope.get("client"),
+        "root_path": request.scope.get("root_path", ""),
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string.encode(),
+        "headers": [
+            (k.encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()
+        ],
+        "app": request.app,
+    }
+
+    route = None
+    for candidate in request.app.router.routes:
+        match, child_scope = candidate.matches(scope)
+        if match == Match.FULL:
+            route = candidate
+            scope.update(child_scope)
+            break
+        if match == Match.PARTIAL and route is None:
+            route = False
+
+    if route is None:
+        return BatchSubResponse(
+            status=status.HTTP_404_NOT_FOUND, body={"detail": "Not Found"}
+        )
+    if route is False:
+        return BatchSubResponse(
+            status=status.HTTP_405_METHOD_NOT_ALLOWED,
+            body={"detail": "Method Not Allowed"},
+        )
+    if getattr(route, "endpoint", None) is execute_batch:
+        return _NOT_BATCHABLE
+
+    body = b"" if sub_request.body is None else json.dumps(sub_request.body).encode()
+    body_sent = False
+
+    async def receive():
+        nonlocal body_sent
+        if body_sent:
+            return {"type": "http.disconnect"}
+        body_sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    response_status = status.HTTP_500_INTERNAL_SERVER_ERROR
+    response_headers = {}
+    response_body = []
+
+    async def send(message):
+        nonlocal response_status, response_headers
+        if message["type"] == "http.response.start":
+            response_status = message["status"]
+            response_headers = dict(message.get("headers", []))
+        elif message["type"] == "http.response.body":
+            response_body.append(message.get("body", b""))
+
+    async def call_route(scope, receive, send):
+        try:
+            await route.app(scope, receive, send)
+        except Exception as exc:
+            handler = _lookup_exception_handler(request, exc)
+            if handler is None:
+                raise
+
+            response = handler(Request(scope, receive), exc)
+            if asyncio.iscoroutine(response):
+                response = await response
+            await response(scope, receive, send)
+
+    try:
+        await MetricsMiddleware(call_route)(scope, receive, send)
+    except Exception:
+        logger.exception("batch: %s %s failed", sub_request.method, path)
+        return BatchSubResponse(
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            body={"detail": "Internal Server Error"},
+        )
+
+    return BatchSubResponse(
+        status=response_status,
+        body=_decode_body(b"".join(response_body), response_headers),
+    )
+
+
+def _lookup_exception_handler(request: Request, exc: Exception):
+    handlers = {**DEFAULT_EXCEPTION_HANDLERS, **request.app.exception_handlers}
+    for cls in type(exc).__mro__:
+        if cls in handlers:
+            return handlers[cls]
+
+
+def _decode_body(body: bytes, headers: dict):
+    if not body:
+        return None
+
+    if headers.get(b"content-type", b"").startswith(b"application/json"):
+        return json.loads(body)
+
+    return body.decode("utf-8", errors="replace")
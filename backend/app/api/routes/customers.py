@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends
@@ -5,13 +6,17 @@ from fastapi.exceptions import HTTPException
 from pydantic.types import PositiveInt
 from starlette import status
 
+from app.api.dependencies.preconditions import get_if_match
 from app.api.dependencies.repositories import get_repository
+from app.api.responses import RenderedJSONResponse
+from app.api.routing import APIRoute
+from app.core import config
 from app.db.repositories.customers import CustomersRepository
 from app.models.pagination import Pagination
 from app.models.customer import Customer, CustomerCreateUpdate, CustomerUpdate
 
 
-router = APIRouter()
+router = APIRouter(route_class=APIRoute)
 
 
 @router.get(
@@ -26,6 +31,12 @@ async def get_all_customers(
     pagination: Pagination = Depends(),
     customers_repo: CustomersRepository = Depends(get_repository(CustomersRepository)),
 ):
+    if config.DB_RENDERED_JSON:
+        page = await customers_repo.get_all_customers_json(
+            search=search, pagination=pagination
+        )
+        return RenderedJSONResponse(page)
+
     customers = await customers_repo.get_all_customers(
         search=search, pagination=pagination
     )
@@ -76,10 +87,14 @@ If you need to update only a few fields, please use the **PATCH** method.""",
 async def full_update_customer(
     customer_update: CustomerCreateUpdate,
     customer_id: PositiveInt,
+    expected_updated_at: Optional[datetime] = Depends(get_if_match),
     customers_repo: CustomersRepository = Depends(get_repository(CustomersRepository)),
 ):
     updated_customer = await customers_repo.update_customer(
-        customer_id=customer_id, customer_update=customer_update, patching=False
+        customer_id=customer_id,
+        customer_update=customer_update,
+        patching=False,
+        expected_updated_at=expected_updated_at,
     )
     if updated_customer is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Customer not found")
@@ -97,13 +112,17 @@ async def full_update_customer(
 async def partial_update_customer(
     customer_update: CustomerUpdate,
     customer_id: PositiveInt,
+    expected_updated_at: Optional[datetime] = Depends(get_if_match),
     customers_repo: CustomersRepository = Depends(get_repository(CustomersRepository)),
 ):
     if not customer_update.dict(exclude_unset=True):
         raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, "empty payload")
 
     updated_customer = await customers_repo.update_customer(
-        customer_id=customer_id, customer_update=customer_update, patching=True
+        customer_id=customer_id,
+        customer_update=customer_update,
+        patching=True,
+        expected_updated_at=expected_updated_at,
     )
     if updated_customer is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Customer not found")
@@ -118,9 +137,12 @@ async def partial_update_customer(
 )
 async def delete_customer_by_id(
     customer_id: PositiveInt,
+    expected_updated_at: Optional[datetime] = Depends(get_if_match),
     customers_repo: CustomersRepository = Depends(get_repository(CustomersRepository)),
 ):
-    customer = await customers_repo.delete_customer_by_id(customer_id=customer_id)
+    customer = await customers_repo.delete_customer_by_id(
+        customer_id=customer_id, expected_updated_at=expected_updated_at
+    )
 
     if customer is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Customer not found")
@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Dict, List, Optional
 
 from fastapi import APIRouter, Depends
@@ -5,14 +6,18 @@ from fastapi.exceptions import HTTPException
 from pydantic.types import PositiveInt
 from starlette import status
 
+from app.api.dependencies.preconditions import get_if_match
 from app.api.dependencies.repositories import get_repository
+from app.api.responses import RenderedJSONResponse
+from app.api.routing import APIRoute
+from app.core import config
 
 from app.db.repositories.orders import OrdersRepository
 from app.models.pagination import Pagination
 from app.models.order import OrderWithItems, OrderCreateUpdate, OrderUpdate, Order
 from app.models.order_item import OrderItemCreateUpdate, OrderItemUpdate, OrderItem
 
-router = APIRouter()
+router = APIRouter(route_class=APIRoute)
 
 
 @router.get(
@@ -25,6 +30,10 @@ async def get_all_orders(
     pagination: Pagination = Depends(),
     orders_repo: OrdersRepository = Depends(get_repository(OrdersRepository)),
 ):
+    if config.DB_RENDERED_JSON:
+        page = await orders_repo.get_all_orders_json(pagination=pagination)
+        return RenderedJSONResponse(page)
+
     orders = await orders_repo.get_all_orders(pagination=pagination)
     return orders
 
@@ -112,9 +121,12 @@ async def partial_update_order(
 )
 async def delete_order_by_id(
     order_id: PositiveInt,
+    expected_updated_at: Optional[datetime] = Depends(get_if_match),
     orders_repo: OrdersRepository = Depends(get_repository(OrdersRepository)),
 ):
-    order = await orders_repo.delete_order_by_id(order_id=order_id)
+    order = await orders_repo.delete_order_by_id(
+        order_id=order_id, expected_updated_at=expected_updated_at
+    )
 
     if order is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Order not found")
@@ -192,6 +204,7 @@ async def full_update_order_item(
     order_id: PositiveInt,
     order_item_id: PositiveInt,
     order_item_update: OrderItemCreateUpdate,
+    expected_updated_at: Optional[datetime] = Depends(get_if_match),
     orders_repo: OrdersRepository = Depends(get_repository(OrdersRepository)),
 ):
     updated_order_item = await orders_repo.update_order_item(
@@ -199,7 +212,10 @@ async def full_update_order_item(
         order_item_id=order_item_id,
         order_item_update=order_item_update,
         patching=False,
+        expected_updated_at=expected_updated_at,
     )
+    if updated_order_item is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "OrderItem not found")
     return updated_order_item
 
 
@@ -214,6 +230,7 @@ async def partial_update_order_item(
     order_id: PositiveInt,
     order_item_id: PositiveInt,
     order_item_update: OrderItemUpdate,
+    expected_updated_at: Optional[datetime] = Depends(get_if_match),
     orders_repo: OrdersRepository = Depends(get_repository(OrdersRepository)),
 ):
     # raise Exception(order_update.dict(exclude_unset=True))
@@ -225,7 +242,10 @@ async def partial_update_order_item(
         order_item_id=order_item_id,
         order_item_update=order_item_update,
         patching=True,
+        expected_updated_at=expected_updated_at,
     )
+    if updated_order_item is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "OrderItem not found")
 
     return updated_order_item
 
@@ -239,10 +259,13 @@ async def partial_update_order_item(
 async def delete_order_item_by_id(
     order_id: PositiveInt,
     order_item_id: PositiveInt,
+    expected_updated_at: Optional[datetime] = Depends(get_if_match),
     orders_repo: OrdersRepository = Depends(get_repository(OrdersRepository)),
 ):
     order_item = await orders_repo.delete_order_item_by_id(
-        order_id=order_id, order_item_id=order_item_id
+        order_id=order_id,
+        order_item_id=order_item_id,
+        expected_updated_at=expected_updated_at,
     )
 
     if order_item is None:
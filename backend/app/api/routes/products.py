@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends
@@ -5,12 +6,16 @@ from fastapi.exceptions import HTTPException
 from pydantic.types import PositiveInt
 from starlette import status
 
+from app.api.dependencies.preconditions import get_if_match
 from app.api.dependencies.repositories import get_repository
+from app.api.responses import RenderedJSONResponse
+from app.api.routing import APIRoute
+from app.core import config
 from app.db.repositories.products import ProductsRepository
 from app.models.pagination import Pagination
 from app.models.product import Product, ProductCreateUpdate, ProductUpdate
 
-router = APIRouter()
+router = APIRouter(route_class=APIRoute)
 
 
 @router.get(
@@ -25,6 +30,12 @@ async def get_all_products(
     pagination: Pagination = Depends(),
     products_repo: ProductsRepository = Depends(get_repository(ProductsRepository)),
 ):
+    if config.DB_RENDERED_JSON:
+        page = await products_repo.get_all_products_json(
+            search=search, pagination=pagination
+        )
+        return RenderedJSONResponse(page)
+
     products = await products_repo.get_all_products(
         search=search, pagination=pagination
     )
@@ -75,10 +86,14 @@ If you need to update only a few fields, please use the **PATCH** method.""",
 async def full_update_product(
     product_update: ProductCreateUpdate,
     product_id: PositiveInt,
+    expected_updated_at: Optional[datetime] = Depends(get_if_match),
     products_repo: ProductsRepository = Depends(get_repository(ProductsRepository)),
 ):
     updated_product = await products_repo.update_product(
-        product_id=product_id, product_update=product_update, patching=False
+        product_id=product_id,
+        product_update=product_update,
+        patching=False,
+        expected_updated_at=expected_updated_at,
     )
     if updated_product is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Product not found")
@@ -96,13 +111,17 @@ async def full_update_product(
 async def partial_update_product(
     product_update: ProductUpdate,
     product_id: PositiveInt,
+    expected_updated_at: Optional[datetime] = Depends(get_if_match),
     products_repo: ProductsRepository = Depends(get_repository(ProductsRepository)),
 ):
     if not product_update.dict(exclude_unset=True):
         raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, "empty payload")
 
     updated_product = await products_repo.update_product(
-        product_id=product_id, product_update=product_update, patching=True
+        product_id=product_id,
+        product_update=product_update,
+        patching=True,
+        expected_updated_at=expected_updated_at,
     )
     if updated_product is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Product not found")
@@ -117,9 +136,12 @@ async def partial_update_product(
 )
 async def delete_product_by_id(
     product_id: PositiveInt,
+    expected_updated_at: Optional[datetime] = Depends(get_if_match),
     products_repo: ProductsRepository = Depends(get_repository(ProductsRepository)),
 ):
-    product = await products_repo.delete_product_by_id(product_id=product_id)
+    product = await products_repo.delete_product_by_id(
+        product_id=product_id, expected_updated_at=expected_updated_at
+    )
 
     if product is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Product not found")
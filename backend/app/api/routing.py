@@ -0,0 +1,316 @@
+import asyncio
+import functools
+import json
+from functools import lru_cache
+from time import perf_counter
+from typing import Any, Callable, Tuple
+
+from fastapi import params, routing
+from fastapi.dependencies.utils import get_flat_dependant, solve_dependencies
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import _prepare_response_content, run_endpoint_function
+from pydantic import BaseModel, ValidationError
+from pydantic.error_wrappers import ErrorWrapper
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON, ModelField
+from pydantic.utils import lenient_issubclass
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Match
+from starlette.types import Scope
+
+from app.api import responses
+from app.api.negotiation import prefers_msgpack
+from app.api.responses import MsgPackResponse, ORJSONResponse
+from app.core import config
+from app.core.offload import run_offloaded
+from app.core.timing import current_request_timings
+from app.core.tracing import span
+from app.models.core import DBModelMixin
+
+
+class APIRoute(routing.APIRoute):
+    """
+    Route class of every API router.
+
+    Exposes the matched route name (`orders:create-order`...) in the ASGI scope
+    as `route_name`, so middleware can label requests without high cardinality
+    raw paths, and marks where the endpoint starts and ends for the request
+    timings (what comes before is request validation, what comes after is
+    response serialization). Handlers and endpoints are traced as spans.
+
+    Bodies are decoded and responses encoded with orjson (`ORJSONResponse` is the
+    default response class) or MessagePack when the client prefers it, large
+    payloads in the offload pool (see `get_request_handler`).
+    """
+
+    def matches(self, scope: Scope) -> Tuple[Match, Scope]:
+        match, child_scope = super().matches(scope)
+        if match != Match.NONE:
+            child_scope["route_name"] = self.name
+        return match, child_scope
+
+    def get_route_handler(self) -> Callable:
+        self.dependant.call = _timed_endpoint(self.dependant.call)
+        handler = get_request_handler(self)
+        route_name = self.name
+
+        async def timed_handler(request: Request) -> Response:
+            with span("handler", **{"http.route": route_name}):
+                timings = current_request_timings.get()
+                # batched calls run inside the batch request: only time the outer one
+                if timings is None or timings.handler_start is not None:
+                    return await handler(request)
+
+                timings.handler_start = perf_counter()
+                response = await handler(request)
+                timings.handler_end = perf_counter()
+                return response
+
+        return timed_handler
+
+
+def _timed_endpoint(endpoint: Callable) -> Callable:
+    def start():
+        timings = current_request_timings.get()
+        if timings is not None and timings.endpoint_start is None:
+            timings.endpoint_start = perf_counter()
+            return timings
+
+    if asyncio.iscoroutinefunction(endpoint):
+
+        @functools.wraps(endpoint)
+        async def timed_endpoint(*args, **kwargs):
+            timings = start()
+            try:
+                with span("endpoint", function=endpoint.__name__):
+                    return await endpoint(*args, **kwargs)
+            finally:
+                if timings is not None:
+                    timings.endpoint_end = perf_counter()
+
+    else:
+
+        @functools.wraps(endpoint)
+        def timed_endpoint(*args, **kwargs):
+            timings = start()
+            try:
+                with span("endpoint", function=endpoint.__name__):
+                    return endpoint(*args, **kwargs)
+            finally:
+                if timings is not None:
+                    timings.endpoint_end = perf_counter()
+
+    return timed_endpoint
+
+
+def _payload_items(content: Any) -> int:
+    """
+    Rough size of an endpoint result: list items, its own or a model's lists'
+    """
+    if isinstance(content, (list, tuple)):
+        return len(content)
+    if isinstance(content, BaseModel):
+        return sum(
+            len(value) for value in content.__dict__.values() if isinstance(value, list)
+        )
+    return 0
+
+
+@lru_cache(maxsize=None)
+def _same_fields(model, response_model) -> bool:
+    """
+    Whether `model` has the fields of `response_model`, in the same order and
+    of the same types, and nested models do too
+    """
+    fields, response_fields = model.__fields__, response_model.__fields__
+    if list(fields) != list(response_fields):
+        return False
+
+    for name, response_field in response_fields.items():
+        field = fields[name]
+        if lenient_issubclass(response_field.type_, BaseModel):
+            if (
+                field.shape != response_field.shape
+                or not lenient_issubclass(field.type_, BaseModel)
+                or not _same_fields(field.type_, response_field.type_)
+            ):
+                return False
+        elif (
+            field.outer_type_ != response_field.outer_type_
+            or field.type_ != response_field.type_
+        ):
+            return False
+    return True
+
+
+def _is_trusted(content: Any, response_field: ModelField) -> bool:
+    """
+    Whether the endpoint result is made of models built from our own rows (see
+    `DBModelMixin.from_db`) shaped like the response model: they would come out
+    of response validation unchanged
+    """
+    if config.VALIDATE_DB_ROWS:
+        return False
+
+    response_model = response_field.type_
+    if response_field.shape == SHAPE_SINGLETON:
+        return isinstance(content, DBModelMixin) and _same_fields(
+            type(content), response_model
+        )
+    if response_field.shape == SHAPE_LIST and isinstance(content, list):
+        return all(
+            isinstance(item, DBModelMixin) and _same_fields(type(item), response_model)
+            for item in content
+        )
+    return False
+
+
+def get_request_handler(route: APIRoute) -> Callable:
+    """
+    `fastapi.routing.get_request_handler` decoding bodies with orjson, encoding
+    `ORJSONResponse`s without `jsonable_encoder` (as `MsgPackResponse`s for
+    clients preferring `application/msgpack`), and with a size-aware path:
+    JSON bodies of at least `OFFLOAD_REQUEST_BYTES` are decoded (and validated,
+    when the body is a single model) and results of at least
+    `OFFLOAD_RESPONSE_ITEMS` items validated and encoded in the offload pool;
+    smaller payloads stay inline. Results built from database rows are not
+    validated again.
+    """
+    dependant = route.dependant
+    body_field = route.body_field
+    response_field = route.secure_cloned_response_field
+    response_class = route.response_class or ORJSONResponse
+    # validated models are encoded by orjson itself
+    encode = (
+        responses.to_content
+        if issubclass(response_class, ORJSONResponse)
+        else jsonable_encoder
+    )
+    encode_options = dict(
+        include=route.response_model_include,
+        exclude=route.response_model_exclude,
+        by_alias=route.response_model_by_alias,
+        exclude_unset=route.response_model_exclude_unset,
+        exclude_defaults=route.response_model_exclude_defaults,
+        exclude_none=route.response_model_exclude_none,
+    )
+    # the same content can be sent as MessagePack (`Vary: Accept`)
+    negotiable = (
+        issubclass(response_class, ORJSONResponse) and responses.msgpack is not None
+    )
+    is_coroutine = asyncio.iscoroutinefunction(dependant.call)
+    is_body_form = body_field and isinstance(body_field.field_info, params.Form)
+
+    # a model body, neither embedded nor next to other body parameters, once
+    # validated ahead is only copied by `solve_dependencies`
+    body_model = None
+    body_params = get_flat_dependant(dependant).body_params
+    if (
+        body_field
+        and not is_body_form
+        and len({param.name for param in body_params}) == 1
+        and not getattr(body_params[0].field_info, "embed", None)
+        and body_field.shape == SHAPE_SINGLETON
+        and lenient_issubclass(body_field.type_, BaseModel)
+    ):
+        body_model = body_field.type_
+
+    def decode_body(body_bytes: bytes) -> Any:
+        body = responses.loads(body_bytes)
+        if body_model is not None and isinstance(body, dict):
+            try:
+                return body_model(**body)
+            except ValidationError:
+                # reported by `solve_dependencies`, as usual
+                pass
+        return body
+
+    def serialize(content: Any) -> Any:
+        if not response_field:
+            return encode(content)
+        if _is_trusted(content, response_field):
+            return encode(content, **encode_options)
+
+        content = _prepare_response_content(
+            content,
+            exclude_unset=route.response_model_exclude_unset,
+            exclude_defaults=route.response_model_exclude_defaults,
+            exclude_none=route.response_model_exclude_none,
+        )
+        value, errors_ = response_field.validate(content, {}, loc=("response",))
+        if errors_:
+            errors = errors_ if isinstance(errors_, list) else [errors_]
+            raise ValidationError(errors, response_field.type_)
+        return encode(value, **encode_options)
+
+    def build_response(content: Any, background, use_msgpack: bool) -> Response:
+        response = (MsgPackResponse if use_msgpack else response_class)(
+            content=serialize(content),
+            status_code=route.status_code,
+            background=background,
+        )
+        if negotiable:
+            response.headers.add_vary_header("Accept")
+        return response
+
+    async def app(request: Request) -> Response:
+        try:
+            body = None
+            if body_field:
+                if is_body_form:
+                    body = await request.form()
+                else:
+                    body_bytes = await request.body()
+                    threshold = config.OFFLOAD_REQUEST_BYTES
+                    if threshold and len(body_bytes) >= threshold:
+                        body = await run_offloaded(decode_body, body_bytes)
+                    elif body_bytes:
+                        body = responses.loads(body_bytes)
+        except json.JSONDecodeError as e:
+            raise RequestValidationError([ErrorWrapper(e, ("body", e.pos))], body=e.doc)
+        except Exception as e:
+            raise HTTPException(
+                status_code=400, detail="There was an error parsing the body"
+            ) from e
+
+        solved_result = await solve_dependencies(
+            request=request,
+            dependant=dependant,
+            body=body,
+            dependency_overrides_provider=route.dependency_overrides_provider,
+        )
+        values, errors, background_tasks, sub_response, _ = solved_result
+        if errors:
+            raise RequestValidationError(errors, body=body)
+
+        raw_response = await run_endpoint_function(
+            dependant=dependant, values=values, is_coroutine=is_coroutine
+        )
+        if isinstance(raw_response, Response):
+            if raw_response.background is None:
+                raw_response.background = background_tasks
+            return raw_response
+
+        use_msgpack = negotiable and prefers_msgpack(request.headers.get("accept"))
+        threshold = config.OFFLOAD_RESPONSE_ITEMS
+        if threshold and _payload_items(raw_response) >= threshold:
+            response = await run_offloaded(
+                build_response, raw_response, background_tasks, use_msgpack
+            )
+        elif is_coroutine:
+            response = build_response(raw_response, background_tasks, use_msgpack)
+        else:
+            # as FastAPI does, sync endpoints results are validated off the loop
+            response = await run_in_threadpool(
+                build_response, raw_response, background_tasks, use_msgpack
+            )
+
+        response.headers.raw.extend(sub_response.headers.raw)
+        if sub_response.status_code:
+            response.status_code = sub_response.status_code
+        return response
+
+    return app
@@ -1,10 +1,20 @@
+from app.api.middleware.compression import CompressionMiddleware
+from app.api.middleware.explain import ExplainMiddleware
+from app.api.middleware.metrics import MetricsMiddleware
+from app.api.middleware.profile import ProfileMiddleware
+from app.api.middleware.query_budget import QueryBudgetMiddleware
+from app.api.middleware.server_timing import ServerTimingMiddleware
+from app.api.middleware.tracing import TracingMiddleware
 from app.api.routes import router as api_router
+from app.api.routing import APIRoute
 from app.core import config, tasks
+from app.core.metrics import CONTENT_TYPE_LATEST, generate_latest
+from app.db.pool import PoolAcquireTimeout
 from fastapi import APIRouter, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, Response
 
-router = APIRouter()
+router = APIRouter(route_class=APIRoute)
 
 
 async def not_implemented_exception_handler(*_):
@@ -14,6 +24,14 @@ async def not_implemented_exception_handler(*_):
     )
 
 
+async def pool_acquire_timeout_exception_handler(*_):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database is busy, try again later"},
+        headers={"Retry-After": "1"},
+    )
+
+
 @router.get("/", response_class=HTMLResponse, include_in_schema=False)
 async def home():
     return """<!DOCTYPE html>
@@ -38,6 +56,17 @@ async def home():
 """
 
 
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(
+        generate_latest(
+            snapshot_dir=config.METRICS_SNAPSHOT_DIR,
+            stale_after=3 * config.METRICS_SNAPSHOT_INTERVAL,
+        ),
+        media_type=CONTENT_TYPE_LATEST,
+    )
+
+
 def get_application():
     app = FastAPI(title=config.PROJECT_NAME, version=config.VERSION)
     app.add_middleware(
@@ -47,11 +76,21 @@ def get_application():
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    app.add_middleware(CompressionMiddleware)
+    app.add_middleware(ExplainMiddleware)
+    app.add_middleware(QueryBudgetMiddleware)
+    app.add_middleware(ServerTimingMiddleware)
+    app.add_middleware(TracingMiddleware)
+    app.add_middleware(ProfileMiddleware)
+    app.add_middleware(MetricsMiddleware)
 
     app.add_event_handler("startup", tasks.create_start_app_handler(app))
     app.add_event_handler("shutdown", tasks.create_stop_app_handler(app))
 
     app.add_exception_handler(NotImplementedError, not_implemented_exception_handler)
+    app.add_exception_handler(
+        PoolAcquireTimeout, pool_acquire_timeout_exception_handler
+    )
 
     app.include_router(router)
     app.include_router(api_router, prefix=config.API_PREFIX)
@@ -1,8 +1,10 @@
+import os
 import secrets
+import tempfile
 
 from databases import DatabaseURL
 from starlette.config import Config
-from starlette.datastructures import Secret
+from starlette.datastructures import CommaSeparatedStrings, Secret
 
 config = Config(".env")
 
@@ -22,3 +24,191 @@ DATABASE_URL = config(
     cast=DatabaseURL,
     default=f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}",
 )
+
+# POST /api/batch
+BATCH_MAX_REQUESTS = config("BATCH_MAX_REQUESTS", cast=int, default=50)
+BATCH_MAX_CONCURRENCY = config("BATCH_MAX_CONCURRENCY", cast=int, default=8)
+
+# how item mutations of the same order are serialized:
+#   "none"     - rely on the row lock taken by update_order_total
+#   "local"    - per-order asyncio locks, taken before a connection is checked out
+#   "advisory" - "local", then postgres transaction-level advisory locks
+#                (multi-worker setups)
+ORDER_LOCK_MODE = config("ORDER_LOCK_MODE", cast=str, default="none")
+# retries (with jittered exponential backoff) on serialization failures/deadlocks
+DB_CONFLICT_RETRIES = config("DB_CONFLICT_RETRIES", cast=int, default=3)
+DB_CONFLICT_RETRY_BASE_DELAY = config(
+    "DB_CONFLICT_RETRY_BASE_DELAY", cast=float, default=0.05
+)
+DB_CONFLICT_RETRY_MAX_DELAY = config("DB_CONFLICT_RETRY_MAX_DELAY", cast=float, default=1.0)
+
+# admin endpoints require this value in the X-Admin-Token header (random when
+# unset, i.e. the admin endpoints can't be used)
+ADMIN_TOKEN = config("ADMIN_TOKEN", cast=Secret, default=secrets.token_hex())
+
+# orders per statement when recomputing totals in bulk
+ORDER_TOTALS_CHUNK_SIZE = config("ORDER_TOTALS_CHUNK_SIZE", cast=int, default=5000)
+
+# background propagation of customer renames to orders.customer_name
+CUSTOMER_NAME_PROPAGATION_ENABLED = config(
+    "CUSTOMER_NAME_PROPAGATION_ENABLED", cast=bool, default=True
+)
+# orders per transaction
+CUSTOMER_NAME_PROPAGATION_CHUNK_SIZE = config(
+    "CUSTOMER_NAME_PROPAGATION_CHUNK_SIZE", cast=int, default=500
+)
+# seconds between polls for new jobs
+CUSTOMER_NAME_PROPAGATION_INTERVAL = config(
+    "CUSTOMER_NAME_PROPAGATION_INTERVAL", cast=float, default=1.0
+)
+
+# connection pool (per worker process)
+DB_MIN_SIZE = config("DB_MIN_SIZE", cast=int, default=2)
+DB_MAX_SIZE = config("DB_MAX_SIZE", cast=int, default=10)
+# seconds to wait for a free connection before answering 503 (0 waits forever)
+DB_ACQUIRE_TIMEOUT = config("DB_ACQUIRE_TIMEOUT", cast=float, default=10.0)
+# seconds after which connections are recycled, even busy ones (0 disables)
+DB_MAX_LIFETIME = config("DB_MAX_LIFETIME", cast=float, default=1800.0)
+# seconds after which idle connections above min size are closed (0 disables)
+DB_MAX_INACTIVE_LIFETIME = config("DB_MAX_INACTIVE_LIFETIME", cast=float, default=300.0)
+# prepared statements cached per connection (0 disables the cache)
+DB_STATEMENT_CACHE_SIZE = config("DB_STATEMENT_CACHE_SIZE", cast=int, default=100)
+# seconds a single statement may run (0 disables)
+DB_COMMAND_TIMEOUT = config("DB_COMMAND_TIMEOUT", cast=float, default=0)
+# startup connection attempts (exponential backoff) before giving up
+DB_CONNECT_RETRIES = config("DB_CONNECT_RETRIES", cast=int, default=5)
+DB_CONNECT_RETRY_DELAY = config("DB_CONNECT_RETRY_DELAY", cast=float, default=1.0)
+# connections shared by all the workers of a server (gunicorn.conf.py): each
+# worker's pool gets DB_POOL_BUDGET / workers of them instead of DB_MAX_SIZE
+# (0 disables)
+DB_POOL_BUDGET = config("DB_POOL_BUDGET", cast=int, default=0)
+# "asyncpg": the hottest repository methods run on asyncpg directly, bypassing
+# databases and SQLAlchemy (see app.db.repositories.native)
+DB_BACKEND = config("DB_BACKEND", cast=str, default="databases")
+
+# connect through PgBouncer in transaction pooling mode (no prepared statement
+# cache, no session state); migrations still connect to postgres directly
+DB_PGBOUNCER = config("DB_PGBOUNCER", cast=bool, default=False)
+PGBOUNCER_HOST = config("PGBOUNCER_HOST", cast=str, default="pgbouncer")
+PGBOUNCER_PORT = config("PGBOUNCER_PORT", cast=int, default=6432)
+
+# production server (gunicorn.conf.py): WEB_CONCURRENCY workers, or one per CPU
+# up to MAX_WORKERS
+SERVER_BIND = config("SERVER_BIND", cast=str, default="0.0.0.0:8000")
+WEB_CONCURRENCY = config("WEB_CONCURRENCY", cast=int, default=0)
+MAX_WORKERS = config("MAX_WORKERS", cast=int, default=8)
+# workers are recycled after WORKER_MAX_REQUESTS requests (plus up to
+# WORKER_MAX_REQUESTS_JITTER, so they don't all restart at once) or above
+# WORKER_MAX_MEMORY MiB of resident memory (0 disables either)
+WORKER_MAX_REQUESTS = config("WORKER_MAX_REQUESTS", cast=int, default=10000)
+WORKER_MAX_REQUESTS_JITTER = config(
+    "WORKER_MAX_REQUESTS_JITTER", cast=int, default=1000
+)
+WORKER_MAX_MEMORY = config("WORKER_MAX_MEMORY", cast=int, default=512)
+WORKER_MEMORY_CHECK_INTERVAL = config(
+    "WORKER_MEMORY_CHECK_INTERVAL", cast=float, default=10.0
+)
+# seconds a stopping worker has to finish its requests and shutdown handlers
+WORKER_GRACEFUL_TIMEOUT = config("WORKER_GRACEFUL_TIMEOUT", cast=int, default=30)
+
+# multi-worker deployments: every worker dumps its metrics in this (shared,
+# per-deployment) directory every METRICS_SNAPSHOT_INTERVAL seconds and /metrics
+# adds them up; leave empty with a single worker
+METRICS_SNAPSHOT_DIR = config("METRICS_SNAPSHOT_DIR", cast=str, default="")
+METRICS_SNAPSHOT_INTERVAL = config("METRICS_SNAPSHOT_INTERVAL", cast=float, default=5.0)
+
+# statements slower than this (seconds) are logged, 0 disables the slow-query log
+SLOW_QUERY_THRESHOLD = config("SLOW_QUERY_THRESHOLD", cast=float, default=0.5)
+# fraction of the slow read-only statements run again under EXPLAIN ANALYZE (one
+# at a time, in the background, on a connection of their own)
+SLOW_QUERY_EXPLAIN_RATE = config("SLOW_QUERY_EXPLAIN_RATE", cast=float, default=0.0)
+# explained slow statements kept in memory (GET /api/admin/slow-queries)
+SLOW_QUERY_PLANS_KEPT = config("SLOW_QUERY_PLANS_KEPT", cast=int, default=50)
+
+# statements allowed per request (0: unlimited), and per route overrides as
+# "route-name=budget" pairs, e.g. "orders:create-order=6,orders:get-all-orders=2"
+QUERY_BUDGET = config("QUERY_BUDGET", cast=int, default=20)
+QUERY_BUDGETS = {
+    route.strip(): int(budget)
+    for route, _, budget in (
+        pair.partition("=")
+        for pair in config("QUERY_BUDGETS", cast=CommaSeparatedStrings, default="")
+    )
+}
+# a request running the same statement (same call site) this many times is an N+1
+N_PLUS_ONE_THRESHOLD = config("N_PLUS_ONE_THRESHOLD", cast=int, default=5)
+
+# add a Server-Timing header (and a log line) with the phases of each request
+SERVER_TIMING = config("SERVER_TIMING", cast=bool, default=False)
+
+# request tracing: "none", "file" (JSON lines in TRACING_FILE) or "otlp" (OTLP/HTTP
+# JSON posted to TRACING_OTLP_ENDPOINT, e.g. a local OpenTelemetry collector)
+TRACING_EXPORTER = config("TRACING_EXPORTER", cast=str, default="none")
+TRACING_FILE = config("TRACING_FILE", cast=str, default="traces.jsonl")
+TRACING_OTLP_ENDPOINT = config(
+    "TRACING_OTLP_ENDPOINT", cast=str, default="http://localhost:4318/v1/traces"
+)
+TRACING_SERVICE_NAME = config("TRACING_SERVICE_NAME", cast=str, default=PROJECT_NAME)
+# fraction of the requests traced, unless an incoming traceparent header decides
+TRACING_SAMPLE_RATE = config("TRACING_SAMPLE_RATE", cast=float, default=0.01)
+# spans are exported every TRACING_EXPORT_INTERVAL seconds, TRACING_BATCH_SIZE at
+# a time; past TRACING_MAX_QUEUE_SIZE pending spans the oldest are dropped
+TRACING_EXPORT_INTERVAL = config("TRACING_EXPORT_INTERVAL", cast=float, default=2.0)
+TRACING_BATCH_SIZE = config("TRACING_BATCH_SIZE", cast=int, default=512)
+TRACING_MAX_QUEUE_SIZE = config("TRACING_MAX_QUEUE_SIZE", cast=int, default=10000)
+
+# admins sending "X-Profile: 1" get the request profiled, the profile is kept in
+# PROFILE_DIR (the PROFILES_KEPT latest ones) for GET /api/admin/profiles/{id}
+PROFILE_DIR = config(
+    "PROFILE_DIR",
+    cast=str,
+    default=os.path.join(tempfile.gettempdir(), "online-store-profiles"),
+)
+PROFILES_KEPT = config("PROFILES_KEPT", cast=int, default=100)
+# seconds between two stack samples of a profiled request
+PROFILE_INTERVAL = config("PROFILE_INTERVAL", cast=float, default=0.002)
+
+# continuous sampling profiler of each worker (GET /api/admin/profiler): a sample
+# every PROFILER_INTERVAL seconds, rolled into PROFILER_WINDOW seconds windows of
+# which the PROFILER_WINDOWS latest are kept
+PROFILER_ENABLED = config("PROFILER_ENABLED", cast=bool, default=False)
+PROFILER_INTERVAL = config("PROFILER_INTERVAL", cast=float, default=0.05)
+PROFILER_WINDOW = config("PROFILER_WINDOW", cast=float, default=60.0)
+PROFILER_WINDOWS = config("PROFILER_WINDOWS", cast=int, default=30)
+
+# event loop monitor: lag measured every LOOP_LAG_INTERVAL seconds, the stack of
+# steps blocking the loop longer than LOOP_BLOCK_THRESHOLD seconds is captured
+# (the LOOP_BLOCKS_KEPT latest ones are kept for GET /api/admin/loop-blocks)
+LOOP_MONITOR_ENABLED = config("LOOP_MONITOR_ENABLED", cast=bool, default=True)
+LOOP_LAG_INTERVAL = config("LOOP_LAG_INTERVAL", cast=float, default=0.1)
+LOOP_BLOCK_THRESHOLD = config("LOOP_BLOCK_THRESHOLD", cast=float, default=0.1)
+LOOP_BLOCKS_KEPT = config("LOOP_BLOCKS_KEPT", cast=int, default=50)
+
+# request bodies of at least OFFLOAD_REQUEST_BYTES bytes are decoded and
+# validated, responses of at least OFFLOAD_RESPONSE_ITEMS list items encoded,
+# in a pool of OFFLOAD_WORKERS threads instead of on the event loop (0 disables)
+OFFLOAD_REQUEST_BYTES = config("OFFLOAD_REQUEST_BYTES", cast=int, default=65536)
+OFFLOAD_RESPONSE_ITEMS = config("OFFLOAD_RESPONSE_ITEMS", cast=int, default=200)
+OFFLOAD_WORKERS = config("OFFLOAD_WORKERS", cast=int, default=2)
+
+# validate database rows (and endpoint results built from them) like any other
+# input instead of trusting our own schema; enabled by the tests
+VALIDATE_DB_ROWS = config("VALIDATE_DB_ROWS", cast=bool, default=False)
+
+# GET /api/products/, /api/customers/ and /api/orders/ pages rendered as JSON by
+# postgres and sent as they are (see app.db.rendering)
+DB_RENDERED_JSON = config("DB_RENDERED_JSON", cast=bool, default=False)
+
+# responses of at least COMPRESSION_MIN_SIZE bytes (0 disables) are compressed
+# with brotli or gzip as negotiated by Accept-Encoding; compressed bodies are
+# cached (COMPRESSION_CACHE_SIZE bytes per worker, 0 disables), and compressed in
+# the offload pool from COMPRESSION_OFFLOAD_BYTES bytes
+COMPRESSION_MIN_SIZE = config("COMPRESSION_MIN_SIZE", cast=int, default=1024)
+COMPRESSION_GZIP_LEVEL = config("COMPRESSION_GZIP_LEVEL", cast=int, default=6)
+COMPRESSION_BROTLI_QUALITY = config("COMPRESSION_BROTLI_QUALITY", cast=int, default=4)
+COMPRESSION_CACHE_SIZE = config(
+    "COMPRESSION_CACHE_SIZE", cast=int, default=32 * 1024 * 1024
+)
+COMPRESSION_OFFLOAD_BYTES = config(
+    "COMPRESSION_OFFLOAD_BYTES", cast=int, default=262144
+)
@@ -0,0 +1,117 @@
+"""
+Event loop lag monitor.
+
+A callback scheduled every `interval` seconds measures how late the loop runs it
+(`event_loop_lag_seconds`) and leaves a heartbeat. A watchdog thread watches the
+heartbeat: when the loop has not come back for `threshold` seconds, some step
+(a coroutine running between two awaits, a callback...) is blocking it, and the
+stack of the loop thread is captured while it still blocks. Blocks are logged,
+counted and kept in `loop_blocks` (GET /api/admin/loop-blocks).
+"""
+import asyncio
+import logging
+import sys
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from time import monotonic
+from typing import Any, Deque, Dict, Optional
+
+from app.core import config
+from app.core.metrics import Counter, Histogram
+from app.core.profiling import frame_stack
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Delay of the event loop in running a callback scheduled on time",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+LOOP_BLOCKS = Counter(
+    "event_loop_blocks_total",
+    "Event loop steps blocking longer than LOOP_BLOCK_THRESHOLD",
+)
+
+# latest blocking steps, newest last
+loop_blocks: Deque[Dict[str, Any]] = deque(maxlen=config.LOOP_BLOCKS_KEPT)
+
+
+class LoopMonitor:
+    def __init__(self, *, interval: float, threshold: float) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id = 0
+        self._heartbeat = 0.0
+        self._handle: Optional[asyncio.TimerHandle] = None
+        # the block being reported, completed once the loop is back
+        self._block: Optional[Dict[str, Any]] = None
+        self._stopped = threading.Event()
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+
+    def start(self) -> None:
+        """
+        Called from the event loop thread
+        """
+        self._loop = asyncio.get_event_loop()
+        self._thread_id = threading.get_ident()
+        self._heartbeat = monotonic()
+        self._schedule(self._heartbeat)
+        self._watchdog.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._handle is not None:
+            self._handle.cancel()
+        self._watchdog.join()
+
+    def _schedule(self, now: float) -> None:
+        self._handle = self._loop.call_later(self.interval, self._tick, now + self.interval)
+
+    def _tick(self, expected: float) -> None:
+        now = monotonic()
+        lag = max(now - expected, 0.0)
+        LOOP_LAG.observe(lag)
+
+        block = self._block
+        if block is not None:
+            block["blocked_for"] = lag
+            self._block = None
+            logger.warning(
+                "event loop blocked for %.1f ms in %s:\n  %s",
+                lag * 1000,
+                block["task"],
+                "\n  ".join(block["stack"]),
+            )
+
+        self._heartbeat = now
+        self._schedule(now)
+
+    def _watch(self) -> None:
+        reported = None
+        while not self._stopped.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            # the next heartbeat is due `interval` after the last one
+            late = monotonic() - heartbeat - self.interval
+            if late < self.threshold or heartbeat == reported:
+                continue
+
+            reported = heartbeat
+            self._block = self._capture(late)
+
+    def _capture(self, late: float) -> Dict[str, Any]:
+        frame = sys._current_frames().get(self._thread_id)
+        task = asyncio.current_task(self._loop)
+
+        block = dict(
+            task=None if task is None else task.get_coro().__qualname__,
+            stack=[] if frame is None else frame_stack(frame)[::-1],
+            blocked_for=late,
+            captured_at=datetime.now(timezone.utc),
+        )
+        LOOP_BLOCKS.inc()
+        loop_blocks.append(block)
+        return block
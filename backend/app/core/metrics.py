@@ -0,0 +1,422 @@
+"""
+Minimal in-process metrics with a Prometheus text exposition.
+
+Metrics are plain Python objects updated from the event loop thread, so no
+locking is involved; `generate_latest()` renders them when `/metrics` is scraped.
+
+With several worker processes each one periodically dumps its samples to
+`<snapshot_dir>/<pid>.json` (`write_snapshots()`), and the worker answering the
+scrape adds up the other workers' snapshots with its own live values. A worker
+that exits folds its counters and histograms into `dead-workers.json`; so does
+the next scrape for workers that were killed.
+"""
+import asyncio
+import fcntl
+import glob
+import json
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4"
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+Sample = Tuple[str, Dict[str, str], float]
+
+# counters and histograms of the workers that exited, so that the added up
+# values never go down when a worker is recycled
+DEAD_WORKERS_SNAPSHOT = "dead-workers.json"
+CUMULATIVE_TYPES = ("counter", "histogram")
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, "Metric"] = {}
+
+    def register(self, metric: "Metric") -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicated metric: {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def __iter__(self) -> Iterator["Metric"]:
+        return iter(list(self._metrics.values()))
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Registry = REGISTRY,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        registry.register(self)
+
+    def labels(self, *labelvalues):
+        child = self._children.get(labelvalues)
+        if child is None:
+            if len(labelvalues) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[labelvalues] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> List[Sample]:
+        samples = []
+        for labelvalues, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, labelvalues))
+            for suffix, extra_labels, value in child.samples():
+                samples.append((self.name + suffix, {**labels, **extra_labels}, value))
+        return samples
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def samples(self):
+        return (("", {}, self.value),)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """
+        Evaluate `function` at scrape time instead of tracking a value
+        """
+        self.function = function
+
+    def samples(self):
+        value = self.value if self.function is None else self.function()
+        return (("", {}, value),)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.labels().set_function(function)
+
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]) -> None:
+        self.upper_bounds = upper_bounds
+        # one extra slot for +Inf
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        samples = []
+        cumulative = 0
+        for upper_bound, count in zip(self.upper_bounds, self.counts):
+            cumulative += count
+            samples.append(("_bucket", {"le": _format_value(upper_bound)}, cumulative))
+        cumulative += self.counts[-1]
+        samples.append(("_bucket", {"le": "+Inf"}, cumulative))
+        samples.append(("_count", {}, cumulative))
+        samples.append(("_sum", {}, self.sum))
+        return samples
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: Registry = REGISTRY,
+    ) -> None:
+        self.upper_bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+
+def snapshot(registry: Registry = REGISTRY) -> Dict[str, Dict[str, Any]]:
+    return {
+        metric.name: dict(
+            type=metric.type,
+            documentation=metric.documentation,
+            samples=metric.samples(),
+        )
+        for metric in registry
+    }
+
+
+def _read_snapshot(path: str) -> Dict[str, Dict[str, Any]]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_snapshot(path: str, metrics: Dict[str, Dict[str, Any]]) -> None:
+    with open(path + ".tmp", "w") as f:
+        json.dump(metrics, f)
+    # readers never see a partially written file
+    os.replace(path + ".tmp", path)
+
+
+def write_snapshot(directory: str, registry: Registry = REGISTRY) -> None:
+    _write_snapshot(os.path.join(directory, f"{os.getpid()}.json"), snapshot(registry))
+
+
+@contextmanager
+def _snapshots_lock(directory: str, operation: int) -> Iterator[None]:
+    """
+    Serializes retiring snapshots (exclusive) with adding them up (shared)
+    """
+    with open(os.path.join(directory, ".lock"), "a") as f:
+        fcntl.flock(f, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _retire(directory: str, pid: int, metrics: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Folds a finished worker's counters and histograms into the dead workers'
+    snapshot and removes its own; call with the exclusive lock held
+    """
+    dead_workers_path = os.path.join(directory, DEAD_WORKERS_SNAPSHOT)
+    try:
+        dead_workers = _read_snapshot(dead_workers_path)
+    except (OSError, ValueError):
+        dead_workers = {}
+
+    _merge_snapshot(
+        dead_workers,
+        {
+            name: metric
+            for name, metric in metrics.items()
+            if metric["type"] in CUMULATIVE_TYPES
+        },
+    )
+    _write_snapshot(dead_workers_path, dead_workers)
+
+    try:
+        os.remove(os.path.join(directory, f"{pid}.json"))
+    except FileNotFoundError:
+        pass
+
+
+def retire_snapshot(directory: str, registry: Registry = REGISTRY) -> None:
+    with _snapshots_lock(directory, fcntl.LOCK_EX):
+        _retire(directory, os.getpid(), snapshot(registry))
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _worker_snapshots(directory: str) -> Iterator[Tuple[int, str]]:
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        name = os.path.basename(path)[: -len(".json")]
+        if name.isdigit():
+            yield int(name), path
+
+
+def reap_snapshots(directory: str, *, include_own: bool = False) -> None:
+    """
+    Retires the snapshots left by workers that did not exit gracefully (killed
+    after a timeout, crashed), and with `include_own` the one left by an earlier
+    process with our pid
+    """
+    own_pid = os.getpid()
+    dead = [
+        (pid, path)
+        for pid, path in _worker_snapshots(directory)
+        if (pid == own_pid and include_own) or (pid != own_pid and not _is_alive(pid))
+    ]
+    if not dead:
+        return
+
+    with _snapshots_lock(directory, fcntl.LOCK_EX):
+        for pid, path in dead:
+            try:
+                metrics = _read_snapshot(path)
+            except (OSError, ValueError):
+                # already retired by another worker
+                continue
+            _retire(directory, pid, metrics)
+
+
+async def write_snapshots(directory: str, interval: float) -> None:
+    os.makedirs(directory, exist_ok=True)
+    reap_snapshots(directory, include_own=True)
+    try:
+        while True:
+            write_snapshot(directory)
+            await asyncio.sleep(interval)
+    finally:
+        retire_snapshot(directory)
+
+
+def _merge_snapshot(
+    merged: Dict[str, Dict[str, Any]], other: Dict[str, Dict[str, Any]]
+) -> None:
+    for metric_name, metric in other.items():
+        target = merged.setdefault(metric_name, dict(metric, samples=[]))
+        index = {
+            (name, tuple(sorted(labels.items()))): position
+            for position, (name, labels, _) in enumerate(target["samples"])
+        }
+        for name, labels, value in metric["samples"]:
+            position = index.get((name, tuple(sorted(labels.items()))))
+            if position is None:
+                target["samples"].append((name, labels, value))
+            else:
+                sample = target["samples"][position]
+                target["samples"][position] = (sample[0], sample[1], sample[2] + value)
+
+
+def generate_latest(
+    registry: Registry = REGISTRY,
+    snapshot_dir: Optional[str] = None,
+    stale_after: Optional[float] = None,
+) -> str:
+    """
+    With `snapshot_dir`, adds up the other workers' snapshots and the dead
+    workers' counters; gauges of snapshots older than `stale_after` seconds are
+    left out
+    """
+    metrics = snapshot(registry)
+
+    if snapshot_dir:
+        reap_snapshots(snapshot_dir)
+        now = time.time()
+        with _snapshots_lock(snapshot_dir, fcntl.LOCK_SH):
+            paths = [os.path.join(snapshot_dir, DEAD_WORKERS_SNAPSHOT)]
+            paths.extend(
+                path
+                for pid, path in _worker_snapshots(snapshot_dir)
+                if pid != os.getpid()
+            )
+            for path in paths:
+                try:
+                    other = _read_snapshot(path)
+                    age = now - os.stat(path).st_mtime
+                except (OSError, ValueError):
+                    # no dead worker yet, or the worker went away meanwhile
+                    continue
+                if stale_after is not None and age > stale_after:
+                    other = {
+                        name: metric
+                        for name, metric in other.items()
+                        if metric["type"] in CUMULATIVE_TYPES
+                    }
+                _merge_snapshot(metrics, other)
+
+    lines = []
+    for metric_name, metric in metrics.items():
+        lines.append(f"# HELP {metric_name} {metric['documentation']}")
+        lines.append(f"# TYPE {metric_name} {metric['type']}")
+        for name, labels, value in metric["samples"]:
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = (
+        '{}="{}"'.format(
+            k, str(v).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+        )
+        for k, v in labels.items()
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
@@ -0,0 +1,42 @@
+"""
+Worker threads for CPU-bound work on large payloads.
+
+Decoding, validating and encoding a big payload holds the event loop for tens
+of milliseconds; run in this pool, the loop keeps serving the other requests in
+between (the interpreter switches threads every few milliseconds). A dedicated
+pool, so that big payloads never wait behind the sync dependencies and
+endpoints of Starlette's threadpool (nor the other way around).
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.core import config
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+async def run_offloaded(function: Callable, *args, **kwargs) -> Any:
+    """
+    Run `function` in the pool, in a copy of the caller's context (request
+    timings and stats, tracing span...)
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=config.OFFLOAD_WORKERS, thread_name_prefix="offload"
+        )
+
+    context = contextvars.copy_context()
+    return await asyncio.get_event_loop().run_in_executor(
+        _executor, functools.partial(context.run, function, *args, **kwargs)
+    )
+
+
+def shutdown_offload_pool() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
@@ -0,0 +1,269 @@
+"""
+Sampling profiler.
+
+A `TaskProfiler` thread wakes up every `interval` seconds and records the stack
+of one asyncio task: the Python stack of the event loop thread when the task is
+the one running, the chain of suspended coroutines otherwise (marked with a
+trailing `[await]` frame, e.g. while it waits for the database). Being
+statistical, it costs nothing to the profiled code but a share of the GIL.
+
+Stacks are aggregated as `{"root;...;leaf": samples}` and rendered as collapsed
+stacks (flamegraph.pl, speedscope, inferno...) or as a speedscope JSON file.
+Profiles are stored as `{"name", "interval", "duration", "stacks"}` JSON files.
+
+`ContinuousProfiler` does the same for a whole event loop: the running stack
+(or `[idle]`) and the stack of every suspended request task (see
+`request_task()`), rolled into time windows. Background tasks only show up while
+they actually run.
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from time import monotonic, perf_counter
+from typing import Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+AWAIT_FRAME = "[await]"
+IDLE_FRAME = "[idle]"
+
+Stacks = Dict[str, int]
+
+# tasks serving a request, the only suspended tasks the continuous profiler samples
+_request_tasks: Set[asyncio.Task] = set()
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def frame_stack(frame, stop_code=None) -> List[str]:
+    """
+    Frames from the root to `frame`, starting at `stop_code` when it is found
+    """
+    stack = []
+    while frame is not None:
+        stack.append(_frame_name(frame.f_code))
+        if frame.f_code is stop_code:
+            break
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def coroutine_stack(coroutine) -> List[str]:
+    """
+    Frames of a suspended coroutine, following what each one awaits
+    """
+    stack = []
+    while coroutine is not None:
+        frame = getattr(coroutine, "cr_frame", None) or getattr(
+            coroutine, "gi_frame", None
+        )
+        if frame is None:
+            break
+        stack.append(_frame_name(frame.f_code))
+        coroutine = getattr(coroutine, "cr_await", None) or getattr(
+            coroutine, "gi_yieldfrom", None
+        )
+    stack.append(AWAIT_FRAME)
+    return stack
+
+
+def task_stack(task: asyncio.Task, loop: asyncio.AbstractEventLoop, thread_id: int):
+    """
+    Current stack of `task`, None when it is done
+    """
+    if task.done():
+        return
+
+    coroutine = task.get_coro()
+    if asyncio.current_task(loop) is task:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            return frame_stack(frame, stop_code=getattr(coroutine, "cr_code", None))
+
+    return coroutine_stack(coroutine)
+
+
+@contextmanager
+def request_task() -> Iterator[None]:
+    """
+    Marks the current task as serving a request until the block exits
+    """
+    task = asyncio.current_task()
+    _request_tasks.add(task)
+    try:
+        yield
+    finally:
+        _request_tasks.discard(task)
+
+
+def to_collapsed(stacks: Stacks) -> str:
+    return "".join(f"{stack} {samples}\n" for stack, samples in sorted(stacks.items()))
+
+
+def to_speedscope(stacks: Stacks, *, name: str, interval: float) -> Dict:
+    frames: List[Dict] = []
+    frame_index: Dict[str, int] = {}
+    samples, weights = [], []
+
+    for stack, count in stacks.items():
+        sample = []
+        for frame in stack.split(";"):
+            if frame not in frame_index:
+                frame_index[frame] = len(frames)
+                frames.append(dict(name=frame))
+            sample.append(frame_index[frame])
+        samples.append(sample)
+        weights.append(count * interval)
+
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "app.core.profiling",
+        "shared": dict(frames=frames),
+        "profiles": [
+            dict(
+                type="sampled",
+                name=name,
+                unit="seconds",
+                startValue=0,
+                endValue=sum(weights),
+                samples=samples,
+                weights=weights,
+            )
+        ],
+    }
+
+
+class TaskProfiler(threading.Thread):
+    """
+    Samples the stack of one task until `stop()`ed; used from its event loop
+    """
+
+    def __init__(self, task: Optional[asyncio.Task] = None, *, interval: float) -> None:
+        super().__init__(name="task-profiler", daemon=True)
+        self.task = task or asyncio.current_task()
+        self.interval = interval
+        self.stacks: Stacks = Counter()
+        self.duration = 0.0
+        self._loop = asyncio.get_event_loop()
+        self._thread_id = threading.get_ident()
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        start = perf_counter()
+        while not self._stopped.wait(self.interval):
+            stack = task_stack(self.task, self._loop, self._thread_id)
+            if stack:
+                self.stacks[";".join(stack)] += 1
+        self.duration = perf_counter() - start
+
+    def stop(self) -> Stacks:
+        self._stopped.set()
+        self.join()
+        return self.stacks
+
+
+class ContinuousProfiler(threading.Thread):
+    """
+    Samples the running stack and the suspended request tasks of an event loop,
+    `interval` seconds apart, into windows of `window` seconds (the `windows`
+    latest ones are kept); started from the event loop thread
+    """
+
+    def __init__(self, *, interval: float, window: float, windows: int) -> None:
+        super().__init__(name="continuous-profiler", daemon=True)
+        self.interval = interval
+        self.window = window
+        self._windows: Deque[Tuple[float, Stacks]] = deque(maxlen=windows)
+        self._lock = threading.Lock()
+        self._loop = asyncio.get_event_loop()
+        self._thread_id = threading.get_ident()
+        self._stopped = threading.Event()
+
+    def _tasks(self) -> List[asyncio.Task]:
+        # copying a set is atomic, while the loop thread adds and removes tasks
+        return [
+            task for task in _request_tasks.copy() if task.get_loop() is self._loop
+        ]
+
+    def sample(self) -> Stacks:
+        stacks: Stacks = Counter()
+        running = asyncio.current_task(self._loop)
+
+        if running is None:
+            stacks[IDLE_FRAME] += 1
+        else:
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                stacks[";".join(frame_stack(frame))] += 1
+
+        for task in self._tasks():
+            if task is not running and not task.done():
+                stacks[";".join(coroutine_stack(task.get_coro()))] += 1
+
+        return stacks
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            stacks = self.sample()
+            now = monotonic()
+            with self._lock:
+                if not self._windows or now - self._windows[-1][0] >= self.window:
+                    self._windows.append((now, Counter()))
+                self._windows[-1][1].update(stacks)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+    def stacks(self, seconds: float) -> Stacks:
+        """
+        Stacks of the windows overlapping the last `seconds`
+        """
+        since = monotonic() - seconds
+        stacks: Stacks = Counter()
+        with self._lock:
+            windows = list(self._windows)
+        for start, window_stacks in windows:
+            if start + self.window > since:
+                stacks.update(window_stacks)
+        return stacks
+
+
+def store_profile(directory: str, profile_id: str, profile: Dict, *, keep: int) -> None:
+    """
+    Save `profile` as `<profile_id>.json`, keeping the `keep` latest ones
+    (blocking: run it off the event loop)
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f"{profile_id}.json"), "w") as f:
+        json.dump(profile, f)
+
+    profiles = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(".json"):
+            try:
+                profiles.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                # pruned by another worker meanwhile
+                continue
+    profiles.sort()
+
+    for _, path in profiles[:-keep]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def load_profile(directory: str, profile_id: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(directory, f"{profile_id}.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return
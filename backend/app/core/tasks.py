@@ -1,18 +1,75 @@
+import asyncio
 from typing import Callable
 from fastapi import FastAPI
 
+from app.core import config
+from app.core.loop_monitor import LoopMonitor
+from app.core.metrics import write_snapshots
+from app.core.offload import shutdown_offload_pool
+from app.core.profiling import ContinuousProfiler
+from app.core.tracing import exporter
+from app.db.propagation import (
+    start_customer_name_propagation,
+    stop_customer_name_propagation,
+)
+from app.db.recompute import stop_order_totals_recomputes
 from app.db.tasks import connect_to_db, close_db_connection
 
 
 def create_start_app_handler(app: FastAPI) -> Callable:
     async def start_app() -> None:
+        app.state._span_exporter = exporter.start()
         await connect_to_db(app)
+        start_customer_name_propagation(app)
+        app.state._order_totals_recomputes = set()
+
+        if config.METRICS_SNAPSHOT_DIR:
+            app.state._metrics_snapshots = asyncio.ensure_future(
+                write_snapshots(
+                    config.METRICS_SNAPSHOT_DIR, config.METRICS_SNAPSHOT_INTERVAL
+                )
+            )
+
+        app.state._profiler = None
+        if config.PROFILER_ENABLED:
+            app.state._profiler = ContinuousProfiler(
+                interval=config.PROFILER_INTERVAL,
+                window=config.PROFILER_WINDOW,
+                windows=config.PROFILER_WINDOWS,
+            )
+            app.state._profiler.start()
+
+        app.state._loop_monitor = None
+        if config.LOOP_MONITOR_ENABLED:
+            app.state._loop_monitor = LoopMonitor(
+                interval=config.LOOP_LAG_INTERVAL,
+                threshold=config.LOOP_BLOCK_THRESHOLD,
+            )
+            app.state._loop_monitor.start()
 
     return start_app
 
 
 def create_stop_app_handler(app: FastAPI) -> Callable:
     async def stop_app() -> None:
+        metrics_snapshots = getattr(app.state, "_metrics_snapshots", None)
+        if metrics_snapshots is not None:
+            metrics_snapshots.cancel()
+
+        if app.state._profiler is not None:
+            app.state._profiler.stop()
+
+        if app.state._loop_monitor is not None:
+            app.state._loop_monitor.stop()
+
+        await stop_customer_name_propagation(app)
+        await stop_order_totals_recomputes(app)
         await close_db_connection(app)
+        shutdown_offload_pool()
+
+        # exports the spans still queued
+        span_exporter = app.state._span_exporter
+        span_exporter.cancel()
+        await asyncio.gather(span_exporter, return_exceptions=True)
 
     return stop_app
@@ -0,0 +1,72 @@
+"""
+Per-request phase timings, rendered as a `Server-Timing` header.
+
+While a request is served with `SERVER_TIMING` enabled, `current_request_timings`
+holds a `RequestTimings` that the pool, the query instrumentation, the
+repositories and the API route class add their monotonic timers to.
+"""
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, Optional
+
+current_request_timings: ContextVar = ContextVar(
+    "current_request_timings", default=None
+)
+
+
+class RequestTimings:
+    __slots__ = (
+        "start",
+        "pool",
+        "db",
+        "repository",
+        "handler_start",
+        "endpoint_start",
+        "endpoint_end",
+        "handler_end",
+    )
+
+    def __init__(self) -> None:
+        self.start = perf_counter()
+        # waiting for a pool connection
+        self.pool = 0.0
+        # running statements (pool waits excluded)
+        self.db = 0.0
+        # inside (outermost) repository methods, pool and statements included
+        self.repository = 0.0
+        self.handler_start: Optional[float] = None
+        self.endpoint_start: Optional[float] = None
+        self.endpoint_end: Optional[float] = None
+        self.handler_end: Optional[float] = None
+
+    def phases(self) -> Dict[str, float]:
+        """
+        Seconds spent in each phase:
+
+        - pool: waiting for a database connection
+        - db: running statements
+        - validation: parsing/validating the request and building the models
+          in the repositories (`adapt_order_flatten_to_model`...)
+        - app: the rest of the route handler
+        - serialization: validating and rendering the response
+        - total: the whole request, as seen by the middleware
+        """
+        phases = dict(pool=self.pool, db=self.db)
+
+        if self.endpoint_start is not None and self.endpoint_end is not None:
+            models = max(self.repository - self.pool - self.db, 0.0)
+            phases["validation"] = self.endpoint_start - self.handler_start + models
+            phases["app"] = max(
+                self.endpoint_end - self.endpoint_start - self.repository, 0.0
+            )
+        if self.handler_end is not None and self.endpoint_end is not None:
+            phases["serialization"] = self.handler_end - self.endpoint_end
+
+        phases["total"] = perf_counter() - self.start
+        return phases
+
+
+def server_timing_header(phases: Dict[str, float]) -> str:
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.3f}" for name, seconds in phases.items()
+    )
@@ -0,0 +1,324 @@
+"""
+Lightweight in-process tracing.
+
+`TracingMiddleware` opens a root span per request, continuing the trace of an
+incoming W3C `traceparent` header. Whether a trace is recorded is decided once,
+at its root (head-based sampling): the parent's decision when there is one,
+`TRACING_SAMPLE_RATE` otherwise. Below the root, spans are opened around route
+handlers, dependencies, repository methods, transactions and statements; in an
+unsampled request each of those costs little more than a context variable
+lookup.
+
+Finished spans are queued and exported in batches by a background task, as
+JSON lines to `TRACING_FILE` or as OTLP/HTTP JSON to `TRACING_OTLP_ENDPOINT`
+(an OpenTelemetry collector, or anything accepting that payload).
+"""
+import asyncio
+import json
+import logging
+import random
+import re
+import urllib.request
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import time_ns
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.core import config
+from app.core.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+TRACING_EXPORTERS = ("none", "file", "otlp")
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_FLAG_SAMPLED = 0x01
+
+# OTLP span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+DROPPED_SPANS = Counter(
+    "tracing_dropped_spans_total", "Finished spans dropped from a full export queue"
+)
+
+# the span new spans are children of (None: not tracing or not sampled)
+current_span: ContextVar = ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = (
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "name",
+        "kind",
+        "start",
+        "end",
+        "attributes",
+        "error",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        trace_id: str,
+        parent_id: Optional[str] = None,
+        kind: int = SPAN_KIND_INTERNAL,
+        attributes: Optional[Dict[str, Any]] = None,
+        start: Optional[int] = None,
+    ) -> None:
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time_ns() if start is None else start
+        self.end: Optional[int] = None
+        self.attributes = attributes or {}
+        self.error = False
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def finish(self, end: Optional[int] = None) -> None:
+        self.end = time_ns() if end is None else end
+        exporter.enqueue(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(
+            trace_id=self.trace_id,
+            span_id=self.span_id,
+            parent_id=self.parent_id,
+            name=self.name,
+            kind=self.kind,
+            start=self.start,
+            end=self.end,
+            duration_ms=(self.end - self.start) / 1e6,
+            attributes=self.attributes,
+            error=self.error,
+        )
+
+    def to_otlp(self) -> Dict[str, Any]:
+        otlp = dict(
+            traceId=self.trace_id,
+            spanId=self.span_id,
+            name=self.name,
+            kind=self.kind,
+            startTimeUnixNano=str(self.start),
+            endTimeUnixNano=str(self.end),
+            attributes=_otlp_attributes(self.attributes),
+            status=dict(code=2 if self.error else 1),
+        )
+        if self.parent_id:
+            otlp["parentSpanId"] = self.parent_id
+        return otlp
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """
+    (trace id, parent span id, sampled) of a valid `traceparent` header
+    """
+    if not value:
+        return
+
+    match = _TRACEPARENT.match(value.strip().lower())
+    if match is None:
+        return
+
+    trace_id, parent_id, flags = match.groups()
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return
+
+    return trace_id, parent_id, bool(int(flags, 16) & _FLAG_SAMPLED)
+
+
+def start_trace(traceparent: Optional[str], name: str, **attributes) -> Optional[Span]:
+    """
+    The root span of a request, or None when the trace is not sampled
+    """
+    parent = parse_traceparent(traceparent)
+    if parent is not None:
+        trace_id, parent_id, sampled = parent
+    else:
+        trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+        sampled = random.random() < config.TRACING_SAMPLE_RATE
+
+    if not sampled:
+        return
+
+    return Span(
+        name,
+        trace_id=trace_id,
+        parent_id=parent_id,
+        kind=SPAN_KIND_SERVER,
+        attributes=attributes,
+    )
+
+
+def start_span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes) -> Optional[Span]:
+    """
+    A child of the current span (not made current), None when not tracing
+    """
+    parent = current_span.get()
+    if parent is None:
+        return
+
+    return Span(
+        name,
+        trace_id=parent.trace_id,
+        parent_id=parent.span_id,
+        kind=kind,
+        attributes=attributes,
+    )
+
+
+@contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes):
+    """
+    Run the block inside a child span of the current span (if any)
+    """
+    child = start_span(name, kind, **attributes)
+    if child is None:
+        yield None
+        return
+
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException:
+        child.error = True
+        raise
+    finally:
+        current_span.reset(token)
+        child.finish()
+
+
+def record_span(
+    name: str,
+    start: int,
+    end: int,
+    kind: int = SPAN_KIND_INTERNAL,
+    **attributes,
+) -> None:
+    """
+    Record an already finished child of the current span (e.g. a statement)
+    """
+    child = start_span(name, kind, **attributes)
+    if child is not None:
+        child.start = start
+        child.finish(end)
+
+
+class SpanExporter:
+    """
+    Bounded queue of finished spans, flushed in batches once `start()`ed.
+
+    When the queue is full the oldest spans are dropped: tracing never blocks
+    nor grows without limit.
+    """
+
+    def __init__(self) -> None:
+        self._queue: Deque[Span] = deque(maxlen=config.TRACING_MAX_QUEUE_SIZE)
+        self._enabled = False
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    def enqueue(self, span: Span) -> None:
+        if not self._enabled:
+            return
+        if len(self._queue) == self._queue.maxlen:
+            DROPPED_SPANS.inc()
+        self._queue.append(span)
+
+    def _drain(self) -> List[Span]:
+        spans = []
+        while self._queue and len(spans) < config.TRACING_BATCH_SIZE:
+            spans.append(self._queue.popleft())
+        return spans
+
+    async def flush(self) -> None:
+        loop = asyncio.get_event_loop()
+        while self._queue:
+            spans = self._drain()
+            try:
+                # file/network I/O stays off the event loop
+                await loop.run_in_executor(None, self._export, spans)
+            except Exception as e:
+                logger.warning("tracing: could not export %s spans: %s", len(spans), e)
+
+    def _export(self, spans: List[Span]) -> None:
+        if config.TRACING_EXPORTER == "file":
+            with open(config.TRACING_FILE, "a") as f:
+                for span in spans:
+                    f.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+        elif config.TRACING_EXPORTER == "otlp":
+            payload = dict(
+                resourceSpans=[
+                    dict(
+                        resource=dict(
+                            attributes=_otlp_attributes(
+                                {"service.name": config.TRACING_SERVICE_NAME}
+                            )
+                        ),
+                        scopeSpans=[
+                            dict(
+                                scope=dict(name="app"),
+                                spans=[span.to_otlp() for span in spans],
+                            )
+                        ],
+                    )
+                ]
+            )
+            request = urllib.request.Request(
+                config.TRACING_OTLP_ENDPOINT,
+                data=json.dumps(payload, default=str).encode(),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            with urllib.request.urlopen(request, timeout=5):
+                pass
+
+    def start(self) -> asyncio.Future:
+        if config.TRACING_EXPORTER not in TRACING_EXPORTERS:
+            raise RuntimeError(f"Invalid TRACING_EXPORTER: {config.TRACING_EXPORTER}")
+
+        self._enabled = config.TRACING_EXPORTER != "none"
+        return asyncio.ensure_future(self._run())
+
+    async def _run(self) -> None:
+        try:
+            while self._enabled:
+                await asyncio.sleep(config.TRACING_EXPORT_INTERVAL)
+                await self.flush()
+        finally:
+            self._enabled = False
+            await self.flush()
+
+
+exporter = SpanExporter()
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    otlp = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            otlp_value = dict(boolValue=value)
+        elif isinstance(value, int):
+            otlp_value = dict(intValue=str(value))
+        elif isinstance(value, float):
+            otlp_value = dict(doubleValue=value)
+        else:
+            otlp_value = dict(stringValue=str(value))
+        otlp.append(dict(key=key, value=otlp_value))
+    return otlp
@@ -0,0 +1,55 @@
+"""
+Gunicorn worker class of the production server (see `gunicorn.conf.py`).
+
+Uvicorn on uvloop and httptools. Gunicorn recycles a worker after `max_requests`
+requests (uvicorn stops accepting, drains its connections and runs the app
+shutdown); this worker also recycles itself, the same way, once its resident
+memory goes above `WORKER_MAX_MEMORY` MiB (where /proc tells the current
+resident memory).
+"""
+import asyncio
+import logging
+
+from uvicorn.main import Server
+from uvicorn.workers import UvicornWorker as BaseUvicornWorker
+
+from app.core import config
+from app.core.workers import rss_bytes
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class UvicornWorker(BaseUvicornWorker):
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+
+    def run(self) -> None:
+        self.config.app = self.wsgi
+        server = Server(config=self.config)
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(self._serve(server))
+
+    async def _serve(self, server: Server) -> None:
+        watchdog = None
+        if config.WORKER_MAX_MEMORY and rss_bytes() is not None:
+            watchdog = asyncio.ensure_future(self._watch_memory(server))
+        try:
+            await server.serve(sockets=self.sockets)
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+
+    async def _watch_memory(self, server: Server) -> None:
+        limit = config.WORKER_MAX_MEMORY * 1024 * 1024
+        while not server.should_exit:
+            await asyncio.sleep(config.WORKER_MEMORY_CHECK_INTERVAL)
+            rss = rss_bytes()
+            if rss > limit:
+                logger.warning(
+                    "worker %s uses %.0f MiB (limit %s MiB): recycling it",
+                    self.pid,
+                    rss / 1024 / 1024,
+                    config.WORKER_MAX_MEMORY,
+                )
+                # same graceful shutdown as on SIGTERM
+                server.should_exit = True
+                return
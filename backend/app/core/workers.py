@@ -0,0 +1,45 @@
+"""
+Server worker processes (see `gunicorn.conf.py` and `app.core.uvicorn_worker`).
+"""
+import os
+from typing import Optional
+
+from app.core import config
+
+# set by the gunicorn master (gunicorn.conf.py) to the number of workers it runs,
+# which `-w`/`--workers` may have overridden
+WORKERS_ENV = "SERVER_WORKERS"
+
+
+def cpu_count() -> int:
+    """
+    CPUs this process may run on (a container's cpuset, not the whole host's)
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def worker_count() -> int:
+    """
+    Workers of the running server, or how many it would run: `WEB_CONCURRENCY`,
+    or one per CPU, at most `MAX_WORKERS`
+    """
+    workers = os.environ.get(WORKERS_ENV)
+    if workers:
+        return int(workers)
+    if config.WEB_CONCURRENCY:
+        return config.WEB_CONCURRENCY
+    return max(min(cpu_count(), config.MAX_WORKERS), 1)
+
+
+def rss_bytes() -> Optional[int]:
+    """
+    Current resident memory of this process, None where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return
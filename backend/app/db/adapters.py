@@ -0,0 +1,66 @@
+"""
+Row adapters compiled from table metadata.
+
+Tables store nested model fields flattened into prefixed columns
+(`billing_address.city` -> `billing_city`). A `FlattenedRowAdapter` works out
+once, from the table columns, which column feeds which (nested) field, so that
+adapting a row or a model is a loop over fixed `(field, column)` pairs.
+"""
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy import Table
+
+
+class FlattenedRowAdapter:
+    def __init__(
+        self,
+        table: Table,
+        *,
+        fields: Tuple[str, ...],
+        nested: Dict[str, str],
+    ) -> None:
+        """
+        `fields`: columns copied as they are, `nested`: prefix of the columns
+        of each nested field
+        """
+        self.fields = tuple(column.name for column in table.columns if column.name in fields)
+        self.nested: List[Tuple[str, Tuple[Tuple[str, str], ...]]] = [
+            (
+                field,
+                tuple(
+                    (column.name[len(prefix) :], column.name)
+                    for column in table.columns
+                    if column.name.startswith(prefix)
+                ),
+            )
+            for field, prefix in nested.items()
+        ]
+        # nested field -> its (key, column) pairs
+        self._nested_columns = dict(self.nested)
+
+    def to_model(self, row: Mapping) -> Dict[str, Any]:
+        """
+        Model values of a table row
+        """
+        values = {field: row[field] for field in self.fields}
+        for field, columns in self.nested:
+            values[field] = {key: row[column] for key, column in columns}
+        return values
+
+    def to_row(
+        self, model: BaseModel, *, exclude: Optional[set] = None, exclude_unset=False
+    ) -> Dict[str, Any]:
+        """
+        Column values of a model (nested fields missing or None are left out)
+        """
+        row = {}
+        for field, value in model.dict(exclude=exclude, exclude_unset=exclude_unset).items():
+            columns = self._nested_columns.get(field)
+            if columns is None:
+                row[field] = value
+            elif value is not None:
+                for key, column in columns:
+                    if key in value:
+                        row[column] = value[key]
+        return row
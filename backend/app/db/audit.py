@@ -0,0 +1,185 @@
+"""
+Order totals auditor.
+
+Proves that every `orders.total` equals the sum of its items and that every item
+total equals `price * qty`. Orders are split in id-range partitions scanned
+concurrently (one pooled connection each), chunk by chunk, with grouped
+aggregate queries. Mismatches are streamed as JSON lines and optionally repaired.
+
+    python -m app.db.audit --concurrency 4 --rate 50000 --report audit.jsonl [--repair]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from time import monotonic
+from typing import Optional, TextIO
+
+from databases import Database
+
+from app.db.pool import detached_task
+from app.db.repositories.orders import OrdersRepository
+from app.db.tasks import get_database_url
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Paces callers (shared by every partition) to `rate` order ids per second
+    """
+
+    def __init__(self, rate: Optional[float]) -> None:
+        self.rate = rate
+        self._next_slot = monotonic()
+
+    async def acquire(self, amount: int) -> None:
+        if not self.rate:
+            return
+
+        now = monotonic()
+        slot = max(self._next_slot, now)
+        self._next_slot = slot + amount / self.rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class AuditSummary:
+    def __init__(self) -> None:
+        self.scanned_ids = 0
+        self.mismatched_orders = 0
+        self.bad_items = 0
+        self.repaired_orders = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"<AuditSummary scanned_ids={self.scanned_ids} "
+            f"mismatched_orders={self.mismatched_orders} bad_items={self.bad_items} "
+            f"repaired_orders={self.repaired_orders}>"
+        )
+
+
+async def audit_order_totals(
+    db: Database,
+    *,
+    report: TextIO,
+    id_from: Optional[int] = None,
+    id_to: Optional[int] = None,
+    concurrency: int = 4,
+    chunk_size: int = 10000,
+    rate: Optional[float] = None,
+    repair: bool = False,
+) -> AuditSummary:
+    summary = AuditSummary()
+    limiter = RateLimiter(rate)
+
+    bounds = await db.fetch_one(
+        query="select min(id) as first_id, max(id) as last_id from orders"
+    )
+    if bounds["first_id"] is None:
+        return summary
+
+    first_id, last_id = bounds["first_id"], bounds["last_id"]
+    if id_from is not None:
+        first_id = max(first_id, id_from)
+    if id_to is not None:
+        last_id = min(last_id, id_to)
+    if first_id > last_id:
+        return summary
+
+    partition_size = -(-(last_id - first_id + 1) // concurrency)
+
+    async def audit_partition(partition_from: int, partition_to: int) -> None:
+        orders_repo = OrdersRepository(db)
+
+        for chunk_from in range(partition_from, partition_to, chunk_size):
+            chunk_to = min(chunk_from + chunk_size, partition_to)
+            await limiter.acquire(chunk_to - chunk_from)
+
+            mismatches = await orders_repo.find_order_total_mismatches(
+                id_from=chunk_from, id_to=chunk_to
+            )
+            summary.scanned_ids += chunk_to - chunk_from
+
+            if not mismatches:
+                continue
+
+            summary.mismatched_orders += len(mismatches)
+            for mismatch in mismatches:
+                summary.bad_items += mismatch["bad_items"]
+                report.write(
+                    json.dumps(
+                        dict(
+                            order_id=mismatch["order_id"],
+                            stored_total=str(mismatch["stored_total"]),
+                            items_total=str(mismatch["items_total"]),
+                            expected_total=str(mismatch["expected_total"]),
+                            bad_items=mismatch["bad_items"],
+                            repaired=repair,
+                        )
+                    )
+                    + "\n"
+                )
+
+            if repair:
+                summary.repaired_orders += await orders_repo.repair_order_totals(
+                    order_ids=[mismatch["order_id"] for mismatch in mismatches]
+                )
+
+        logger.info("audit: orders %s..%s done", partition_from, partition_to - 1)
+
+    # each partition on its own connection, even when the caller holds one
+    await asyncio.gather(
+        *(
+            detached_task(
+                audit_partition(start, min(start + partition_size, last_id + 1))
+            )
+            for start in range(first_id, last_id + 1, partition_size)
+        )
+    )
+    report.flush()
+
+    return summary
+
+
+async def main(args: argparse.Namespace) -> AuditSummary:
+    database = Database(
+        get_database_url(), min_size=args.concurrency, max_size=args.concurrency
+    )
+    await database.connect()
+
+    report = open(args.report, "w") if args.report else sys.stdout
+    try:
+        return await audit_order_totals(
+            database,
+            report=report,
+            id_from=args.id_from,
+            id_to=args.id_to,
+            concurrency=args.concurrency,
+            chunk_size=args.chunk_size,
+            rate=args.rate,
+            repair=args.repair,
+        )
+    finally:
+        if report is not sys.stdout:
+            report.close()
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Audit (and repair) order totals")
+    parser.add_argument("--id-from", type=int)
+    parser.add_argument("--id-to", type=int)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument(
+        "--rate", type=float, help="max order ids scanned per second (all partitions)"
+    )
+    parser.add_argument("--repair", action="store_true")
+    parser.add_argument("--report", help="JSON lines file (default: stdout)")
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    summary = asyncio.run(main(parser.parse_args()))
+    logger.info("audit: %r", summary)
+    sys.exit(1 if summary.mismatched_orders and not summary.repaired_orders else 0)
@@ -0,0 +1,140 @@
+import asyncio
+import functools
+import logging
+import random
+from contextlib import asynccontextmanager
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from databases import Database
+
+from app.core import config
+from app.core.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+ORDER_LOCK_MODES = ("none", "local", "advisory")
+
+# first key of the two-key advisory locks, so orders don't collide with other lock users
+ADVISORY_LOCK_ORDERS = 1
+
+# serialization_failure, deadlock_detected
+RETRYABLE_SQLSTATES = ("40001", "40P01")
+
+ORDER_LOCK_WAIT = Histogram(
+    "order_lock_wait_seconds",
+    "Time spent waiting for the per-order mutation lock",
+    ("mode",),
+)
+DB_CONFLICT_RETRIES = Counter(
+    "db_conflict_retries_total",
+    "Order mutations retried after a serialization failure or deadlock",
+    ("sqlstate",),
+)
+
+
+class OrderLocks:
+    """
+    One asyncio lock per order being mutated, dropped once nobody holds or waits for it
+    """
+
+    def __init__(self) -> None:
+        self._locks: Dict[int, List] = {}
+
+    @asynccontextmanager
+    async def hold(self, order_id: int):
+        entry = self._locks.get(order_id)
+        if entry is None:
+            entry = self._locks[order_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+
+        try:
+            start = perf_counter()
+            async with entry[0]:
+                ORDER_LOCK_WAIT.labels("local").observe(perf_counter() - start)
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[order_id]
+
+
+order_locks = OrderLocks()
+
+
+async def run_order_mutation(
+    db: Database, order_id: int, mutation: Callable[[], Awaitable]
+):
+    """
+    Run `mutation` (which must be transactional itself) serialized with the other
+    mutations of the same order, retrying it on serialization failures and deadlocks
+    """
+    mode = config.ORDER_LOCK_MODE
+    if mode not in ORDER_LOCK_MODES:
+        raise RuntimeError(f"Invalid ORDER_LOCK_MODE: {mode}")
+
+    attempt = 0
+    while True:
+        try:
+            if mode == "local":
+                async with order_locks.hold(order_id):
+                    return await mutation()
+
+            if mode == "advisory":
+                # requests of this worker queue in process, without a connection;
+                # the advisory lock only waits for the other workers
+                async with order_locks.hold(order_id), db.transaction():
+                    start = perf_counter()
+                    await db.execute(
+                        query="select pg_advisory_xact_lock(:lock_class, :order_id)",
+                        values=dict(lock_class=ADVISORY_LOCK_ORDERS, order_id=order_id),
+                    )
+                    ORDER_LOCK_WAIT.labels("advisory").observe(perf_counter() - start)
+                    return await mutation()
+
+            return await mutation()
+
+        except Exception as e:
+            sqlstate = _retryable_sqlstate(e)
+            if sqlstate is None or attempt >= config.DB_CONFLICT_RETRIES:
+                raise
+
+            DB_CONFLICT_RETRIES.labels(sqlstate).inc()
+            delay = _backoff(attempt)
+            logger.info(
+                "order %s: retrying mutation in %.3fs (sqlstate %s)",
+                order_id,
+                delay,
+                sqlstate,
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+def serialized_by_order(method):
+    """
+    Decorator for repository methods taking a keyword `order_id`
+    """
+
+    @functools.wraps(method)
+    async def wrapper(self, *, order_id: int, **kwargs):
+        return await run_order_mutation(
+            self.db, order_id, lambda: method(self, order_id=order_id, **kwargs)
+        )
+
+    return wrapper
+
+
+def _retryable_sqlstate(e: Exception) -> Optional[str]:
+    sqlstate = getattr(e, "sqlstate", None)
+    if sqlstate in RETRYABLE_SQLSTATES:
+        return sqlstate
+
+
+def _backoff(attempt: int) -> float:
+    # "full jitter": uniformly random up to the exponential ceiling
+    ceiling = min(
+        config.DB_CONFLICT_RETRY_MAX_DELAY,
+        config.DB_CONFLICT_RETRY_BASE_DELAY * 2 ** attempt,
+    )
+    return random.uniform(0, ceiling)
@@ -0,0 +1,372 @@
+"""
+Query instrumentation.
+
+`connect_to_db` wraps the application `Database` in `InstrumentedDatabase`, so
+every statement issued through it (repositories, unit of work, background
+workers...) is timed and labelled with the repository method running it (see
+`app.db.repositories.base.current_repository_method`).
+
+Statements slower than `SLOW_QUERY_THRESHOLD` are logged (normalized SQL,
+parameter shapes, never values) and a sample of the read-only ones is run again
+under `EXPLAIN (ANALYZE, BUFFERS)`, in a background task on a connection of its
+own, the plans being kept in `slow_query_plans`. While `current_query_plans`
+holds a list (see `app.api.middleware.explain`) every read-only statement is
+explained into it, inline. Plans run in read-only transactions, rolled back.
+
+While `current_request_stats` holds a `RequestStats` (see
+`app.api.middleware.query_budget`) statements are counted into it, by call site.
+
+In traced requests (see `app.core.tracing`) transactions and statements are
+recorded as spans.
+"""
+import asyncio
+import logging
+import os
+import random
+import re
+import sys
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from time import perf_counter, time_ns
+from typing import Any, AsyncIterator, Deque, Dict, List, Mapping, Optional, Tuple
+
+from databases import Database
+from sqlalchemy.dialects import postgresql
+
+from app.core import config
+from app.core.metrics import Counter, Histogram
+from app.core.timing import current_request_timings
+from app.core.tracing import SPAN_KIND_CLIENT, current_span, record_span, start_span
+from app.db.pool import detached_task
+from app.db.repositories.base import current_repository_method
+
+logger = logging.getLogger(__name__)
+
+# statements issued outside of any repository method
+NO_REPOSITORY_METHOD = "none"
+
+# plans of the latest explained slow statements, newest last
+slow_query_plans: Deque[Dict[str, Any]] = deque(maxlen=config.SLOW_QUERY_PLANS_KEPT)
+
+# a list collecting the plans of every statement of the current request
+current_query_plans: ContextVar = ContextVar("current_query_plans", default=None)
+
+# `RequestStats` of the request being served
+current_request_stats: ContextVar = ContextVar("current_request_stats", default=None)
+
+# statements that can be executed again without side effects
+_READ_ONLY_SQL = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+_DATA_MODIFYING_SQL = re.compile(r"\b(insert|update|delete)\b", re.IGNORECASE)
+# functions with side effects a read-only transaction allows (locks, sequences,
+# signals...)
+_SIDE_EFFECT_FUNCTIONS = re.compile(
+    r"\b(pg_\w+|nextval|setval|lo_\w+|dblink\w*|set_config)\s*\(", re.IGNORECASE
+)
+
+# renders `:name` placeholders, as expected by text queries
+_EXPLAIN_DIALECT = postgresql.dialect(paramstyle="named")
+
+QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Database statement latency by repository method",
+    ("method",),
+)
+SLOW_QUERIES = Counter(
+    "db_slow_queries_total",
+    "Statements slower than SLOW_QUERY_THRESHOLD by repository method",
+    ("method",),
+)
+QUERY_ROWS = Histogram(
+    "db_query_rows",
+    "Rows returned per statement by repository method",
+    ("method",),
+    buckets=(0, 1, 5, 10, 50, 100, 500, 1_000, 5_000, 10_000),
+)
+TRANSACTION_DURATION = Histogram(
+    "db_transaction_duration_seconds",
+    "Transaction (and savepoint) duration by repository method and outcome",
+    ("method", "outcome"),
+)
+
+
+def _repository_method() -> str:
+    return current_repository_method.get() or NO_REPOSITORY_METHOD
+
+
+def _pool_wait() -> float:
+    timings = current_request_timings.get()
+    return 0.0 if timings is None else timings.pool
+
+
+def _compile(query, values: Optional[dict]) -> Tuple[str, Dict[str, Any]]:
+    if isinstance(query, str):
+        return query, dict(values or {})
+
+    compiled = query.compile(dialect=_EXPLAIN_DIALECT)
+    params = dict(compiled.params)
+    params.update(values or {})
+    return str(compiled), params
+
+
+def normalize_sql(sql: str) -> str:
+    return " ".join(sql.split())
+
+
+def parameter_shapes(params: Mapping[str, Any]) -> Dict[str, str]:
+    """
+    Type (and length of lists) of each bound parameter, values are not logged
+    """
+    shapes = {}
+    for name, value in params.items():
+        if isinstance(value, (list, tuple, set)):
+            shapes[name] = f"{type(value).__name__}[{len(value)}]"
+        else:
+            shapes[name] = type(value).__name__
+    return shapes
+
+
+def is_read_only(sql: str) -> bool:
+    return (
+        bool(_READ_ONLY_SQL.match(sql))
+        and not _DATA_MODIFYING_SQL.search(sql)
+        and not _SIDE_EFFECT_FUNCTIONS.search(sql)
+    )
+
+
+class RequestStats:
+    __slots__ = ("queries", "rows", "db_time", "call_sites")
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.rows = 0
+        self.db_time = 0.0
+        # statements per "Repository.method (file:line)" issuing them
+        self.call_sites: Dict[str, int] = {}
+
+    def record(self, elapsed: float, rows: int, call_site: str) -> None:
+        self.queries += 1
+        self.rows += rows
+        self.db_time += elapsed
+        self.call_sites[call_site] = self.call_sites.get(call_site, 0) + 1
+
+
+class InstrumentedTransaction:
+    def __init__(self, transaction) -> None:
+        self._transaction = transaction
+        self._method = _repository_method()
+        self._start = 0.0
+        self._span = None
+
+    def _begin(self) -> None:
+        self._start = perf_counter()
+        self._span = start_span("transaction", method=self._method)
+
+    def _observe(self, outcome: str) -> None:
+        TRANSACTION_DURATION.labels(self._method, outcome).observe(
+            perf_counter() - self._start
+        )
+        if self._span is not None:
+            self._span.set_attribute("outcome", outcome)
+            self._span.error = outcome == "rollback"
+            self._span.finish()
+
+    async def __aenter__(self) -> "InstrumentedTransaction":
+        self._begin()
+        # statements of the block are children of the transaction span
+        self._span_token = None if self._span is None else current_span.set(self._span)
+        await self._transaction.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            await self._transaction.__aexit__(exc_type, exc_value, traceback)
+        finally:
+            if self._span_token is not None:
+                current_span.reset(self._span_token)
+            self._observe("commit" if exc_type is None else "rollback")
+
+    async def start(self) -> "InstrumentedTransaction":
+        self._begin()
+        await self._transaction.start()
+        return self
+
+    async def commit(self) -> None:
+        try:
+            await self._transaction.commit()
+        finally:
+            self._observe("commit")
+
+    async def rollback(self) -> None:
+        try:
+            await self._transaction.rollback()
+        finally:
+            self._observe("rollback")
+
+
+class InstrumentedDatabase:
+    """
+    Stands in for `databases.Database`, anything not instrumented is delegated
+    """
+
+    def __init__(self, database: Database) -> None:
+        self._database = database
+        # at most one slow statement explained at a time, on its own connection
+        self._slow_query_explain: Optional[asyncio.Task] = None
+
+    def __getattr__(self, name: str):
+        return getattr(self._database, name)
+
+    async def _observe(
+        self, start: float, pool_wait: float, rows: int, query, values
+    ) -> None:
+        elapsed = perf_counter() - start
+        method = _repository_method()
+        QUERY_DURATION.labels(method).observe(elapsed)
+        QUERY_ROWS.labels(method).observe(rows)
+
+        timings = current_request_timings.get()
+        if timings is not None:
+            # the statement may have waited for its connection first
+            timings.db += elapsed - (timings.pool - pool_wait)
+
+        stats = current_request_stats.get()
+        if stats is not None:
+            # 0: here, 1: fetch_*/execute*, 2: whoever issued the statement
+            caller = sys._getframe(2)
+            stats.record(
+                elapsed,
+                rows,
+                f"{method} ({os.path.basename(caller.f_code.co_filename)}:{caller.f_lineno})",
+            )
+
+        if current_span.get() is not None:
+            end = time_ns()
+            record_span(
+                "statement",
+                end - int(elapsed * 1e9),
+                end,
+                SPAN_KIND_CLIENT,
+                **{
+                    "db.system": "postgresql",
+                    "db.statement": normalize_sql(_compile(query, values)[0]),
+                    "db.rows": rows,
+                    "method": method,
+                },
+            )
+
+        threshold = config.SLOW_QUERY_THRESHOLD
+        is_slow = threshold and elapsed >= threshold
+        request_plans = current_query_plans.get()
+        if is_slow or request_plans is not None:
+            await self._on_query(method, elapsed, query, values, is_slow, request_plans)
+
+    async def _on_query(
+        self, method, elapsed, query, values, is_slow, request_plans
+    ) -> None:
+        """
+        Only for slow statements and requests asking for plans
+        """
+        sql, params = _compile(query, values)
+        explain = request_plans is not None or (
+            is_slow and random.random() < config.SLOW_QUERY_EXPLAIN_RATE
+        )
+
+        entry = dict(
+            method=method,
+            sql=normalize_sql(sql),
+            parameters=parameter_shapes(params),
+            duration=elapsed,
+            captured_at=datetime.now(timezone.utc),
+            plan=None,
+        )
+
+        if is_slow:
+            SLOW_QUERIES.labels(method).inc()
+            logger.warning(
+                "slow query (%.1f ms) in %s: %s parameters=%s",
+                elapsed * 1000,
+                method,
+                entry["sql"],
+                entry["parameters"],
+            )
+
+        if explain and is_read_only(sql):
+            if request_plans is not None:
+                # the plan goes in the response of this request
+                entry["plan"] = await self.explain(sql, params)
+                if is_slow:
+                    slow_query_plans.append(entry)
+            elif self._slow_query_explain is None or self._slow_query_explain.done():
+                self._slow_query_explain = detached_task(
+                    self._explain_slow_query(entry, sql, params)
+                )
+
+        if request_plans is not None:
+            request_plans.append(entry)
+
+    async def _explain_slow_query(
+        self, entry: Dict[str, Any], sql: str, params: Dict[str, Any]
+    ) -> None:
+        entry["plan"] = await self.explain(sql, params)
+        slow_query_plans.append(entry)
+
+    async def explain(self, sql: str, params: Dict[str, Any]) -> Optional[str]:
+        # inside a read-only transaction (a savepoint if one is running) always
+        # rolled back, so the statement can't write when it runs again and a
+        # failing EXPLAIN can't abort the caller's transaction
+        transaction = await self._database.transaction().start()
+        try:
+            await self._database.execute(query="SET TRANSACTION READ ONLY")
+            rows = await self._database.fetch_all(
+                query=f"EXPLAIN (ANALYZE, BUFFERS) {sql}", values=params
+            )
+            return "\n".join(row["QUERY PLAN"] for row in rows)
+        except Exception as e:
+            logger.warning("could not explain %s: %s", normalize_sql(sql), e)
+        finally:
+            await transaction.rollback()
+
+    async def fetch_all(self, query, values: Optional[dict] = None) -> List[Mapping]:
+        start, pool_wait = perf_counter(), _pool_wait()
+        rows = await self._database.fetch_all(query=query, values=values)
+        await self._observe(start, pool_wait, len(rows), query, values)
+        return rows
+
+    async def fetch_one(self, query, values: Optional[dict] = None) -> Optional[Mapping]:
+        start, pool_wait = perf_counter(), _pool_wait()
+        row = await self._database.fetch_one(query=query, values=values)
+        await self._observe(start, pool_wait, 0 if row is None else 1, query, values)
+        return row
+
+    async def fetch_val(
+        self, query, values: Optional[dict] = None, column: Any = 0
+    ) -> Any:
+        start, pool_wait = perf_counter(), _pool_wait()
+        value = await self._database.fetch_val(query=query, values=values, column=column)
+        await self._observe(start, pool_wait, 1, query, values)
+        return value
+
+    async def execute(self, query, values: Optional[dict] = None) -> Any:
+        start, pool_wait = perf_counter(), _pool_wait()
+        result = await self._database.execute(query=query, values=values)
+        await self._observe(start, pool_wait, 0, query, values)
+        return result
+
+    async def execute_many(self, query, values: list) -> None:
+        start, pool_wait = perf_counter(), _pool_wait()
+        await self._database.execute_many(query=query, values=values)
+        await self._observe(start, pool_wait, 0, query, None)
+
+    async def iterate(self, query, values: Optional[dict] = None) -> AsyncIterator[Mapping]:
+        start, pool_wait = perf_counter(), _pool_wait()
+        rows = 0
+        try:
+            async for row in self._database.iterate(query=query, values=values):
+                rows += 1
+                yield row
+        finally:
+            await self._observe(start, pool_wait, rows, query, values)
+
+    def transaction(self, *args, **kwargs) -> InstrumentedTransaction:
+        return InstrumentedTransaction(self._database.transaction(*args, **kwargs))
@@ -0,0 +1,25 @@
+"""add order_items.order_id index
+
+Revision ID: 5b1c0e7a9d24
+Revises: ed740be9cd97
+Create Date: 2026-10-19 10:03:17.402519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic
+revision = "5b1c0e7a9d24"
+down_revision = "ed740be9cd97"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # item lookups/aggregations by order (totals, audits) were sequential scans
+    op.create_index("ix_order_items_order_id", "order_items", ["order_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_order_items_order_id", table_name="order_items")
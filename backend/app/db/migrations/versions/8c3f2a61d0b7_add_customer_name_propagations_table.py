@@ -0,0 +1,46 @@
+"""add customer_name_propagations table
+
+Revision ID: 8c3f2a61d0b7
+Revises: 5b1c0e7a9d24
+Create Date: 2026-10-19 11:24:52.218734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic
+revision = "8c3f2a61d0b7"
+down_revision = "5b1c0e7a9d24"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # one pending job per customer: a rename while a job is running restarts it
+    # with the newest name, `last_order_id` is the keyset cursor over its orders
+    op.create_table(
+        "customer_name_propagations",
+        sa.Column(
+            "customer_id",
+            sa.Integer,
+            sa.ForeignKey("customers.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("customer_name", sa.String, nullable=False),
+        sa.Column("last_order_id", sa.Integer, nullable=False, server_default="0"),
+        sa.Column(
+            "enqueued_at",
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+    )
+
+    # keyset walk over the orders of a customer
+    op.create_index("ix_orders_customer_id_id", "orders", ["customer_id", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_orders_customer_id_id", table_name="orders")
+    op.drop_table("customer_name_propagations")
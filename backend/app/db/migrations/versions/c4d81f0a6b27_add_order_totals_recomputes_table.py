@@ -0,0 +1,49 @@
+"""add order_totals_recomputes table
+
+Revision ID: c4d81f0a6b27
+Revises: 8c3f2a61d0b7
+Create Date: 2026-10-19 16:05:31.402917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic
+revision = "c4d81f0a6b27"
+down_revision = "8c3f2a61d0b7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # one row per bulk recompute of order totals, updated in the transaction of
+    # each chunk: its progress can be read from any worker
+    op.create_table(
+        "order_totals_recomputes",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("status", sa.String, nullable=False, server_default="running"),
+        sa.Column("first_id", sa.Integer),
+        sa.Column("last_id", sa.Integer),
+        sa.Column("last_processed_id", sa.Integer),
+        sa.Column("chunks", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("updated_orders", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("error", sa.String),
+        sa.Column(
+            "created_at",
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+        sa.Column("finished_at", sa.TIMESTAMP(timezone=True)),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("order_totals_recomputes")
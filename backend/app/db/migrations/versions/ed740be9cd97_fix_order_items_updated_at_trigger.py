@@ -0,0 +1,42 @@
+"""fix order_items updated_at trigger
+
+Revision ID: ed740be9cd97
+Revises: df72542f1ecd
+Create Date: 2026-10-19 09:12:40.118212
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic
+revision = "ed740be9cd97"
+down_revision = "df72542f1ecd"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # the trigger was created on `orders`, so order items never refreshed
+    # their `updated_at` (which If-Match preconditions rely on)
+    op.execute("DROP TRIGGER tr_order_items_update_timestamp ON orders")
+    op.execute(
+        """
+        CREATE TRIGGER tr_order_items_update_timestamp
+        BEFORE UPDATE ON order_items
+        FOR EACH ROW
+        EXECUTE PROCEDURE update_updated_at();
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER tr_order_items_update_timestamp ON order_items")
+    op.execute(
+        """
+        CREATE TRIGGER tr_order_items_update_timestamp
+        BEFORE UPDATE ON orders
+        FOR EACH ROW
+        EXECUTE PROCEDURE update_updated_at();
+        """
+    )
@@ -0,0 +1,83 @@
+"""
+Native asyncpg statements.
+
+Repositories of the "asyncpg" backend (`DB_BACKEND`, see
+`app.db.repositories.native`) run their hot statements straight on the asyncpg
+connection: no SQLAlchemy compilation, no `databases` Record wrapping, and
+asyncpg's statement cache prepares each statement once per connection (unnamed
+statements with `DB_PGBOUNCER`, see `app.db.pool`).
+
+The connection is the one `databases` holds for the current task, so native
+statements run in the transactions opened with `db.transaction()`, and they are
+instrumented like any other statement (`InstrumentedDatabase._observe`).
+"""
+import re
+from contextlib import asynccontextmanager
+from time import perf_counter
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+import asyncpg
+
+from app.db.instrumentation import InstrumentedDatabase, _pool_wait
+
+
+class NativeQuery:
+    """
+    A statement written with `:name` placeholders, like every SQL_* constant,
+    run by asyncpg with `$n` ones: `params` are the names in positional order
+    """
+
+    __slots__ = ("named_sql", "params", "sql")
+
+    def __init__(self, sql: str, *params: str) -> None:
+        # the named form is what the slow query log, EXPLAIN and traces get
+        self.named_sql = sql
+        self.params = params
+        for position, name in enumerate(params, 1):
+            sql = re.sub(rf"(?<!:):{name}\b", f"${position}", sql)
+        self.sql = sql
+
+    def values(self, args: Sequence[Any]) -> Dict[str, Any]:
+        return dict(zip(self.params, args))
+
+
+class NativeConnection:
+    def __init__(self, db: InstrumentedDatabase, connection) -> None:
+        self._db = db
+        self._connection = connection
+        self._raw: asyncpg.Connection = connection.raw_connection
+
+    async def fetch(self, query: NativeQuery, *args) -> List[asyncpg.Record]:
+        start, pool_wait = perf_counter(), _pool_wait()
+        # `databases` serializes the statements of a shared connection
+        async with self._connection._query_lock:
+            rows = await self._raw.fetch(query.sql, *args)
+        await self._db._observe(
+            start, pool_wait, len(rows), query.named_sql, query.values(args)
+        )
+        return rows
+
+    async def fetchrow(self, query: NativeQuery, *args) -> Optional[asyncpg.Record]:
+        start, pool_wait = perf_counter(), _pool_wait()
+        async with self._connection._query_lock:
+            row = await self._raw.fetchrow(query.sql, *args)
+        await self._db._observe(
+            start, pool_wait, 0 if row is None else 1, query.named_sql, query.values(args)
+        )
+        return row
+
+    async def fetchval(self, query: NativeQuery, *args) -> Any:
+        start, pool_wait = perf_counter(), _pool_wait()
+        async with self._connection._query_lock:
+            value = await self._raw.fetchval(query.sql, *args)
+        await self._db._observe(start, pool_wait, 1, query.named_sql, query.values(args))
+        return value
+
+
+@asynccontextmanager
+async def native_connection(db: InstrumentedDatabase) -> AsyncIterator[NativeConnection]:
+    """
+    The asyncpg connection of the current task (checked out if needed)
+    """
+    async with db.connection() as connection:
+        yield NativeConnection(db, connection)
@@ -0,0 +1,208 @@
+"""
+Connection pool configuration and instrumentation.
+
+`databases` hands its keyword options straight to `asyncpg.create_pool`, so the
+pool is sized and tuned from `app.core.config` through `get_pool_options()`.
+Once connected, the asyncpg pool is wrapped by `InstrumentedPool` which adds an
+acquire timeout and the `db_pool_*` metrics.
+
+With `DB_PGBOUNCER` the pool talks to PgBouncer in transaction pooling mode:
+consecutive transactions of one client connection may run on different server
+connections, so nothing may outlive a transaction (named prepared statements,
+session settings, session-level locks, LISTEN).
+"""
+import asyncio
+import contextvars
+import logging
+from time import perf_counter
+from typing import Any, Coroutine, Dict, Optional
+
+import asyncpg
+from databases import Database
+
+from app.core import config
+from app.core.metrics import Counter, Gauge, Histogram
+from app.core.timing import current_request_timings
+from app.core.workers import worker_count
+
+logger = logging.getLogger(__name__)
+
+POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Open pool connections by state",
+    ("state",),
+)
+POOL_MAX_SIZE = Gauge("db_pool_max_size", "Maximum number of pool connections")
+POOL_WAITERS = Gauge(
+    "db_pool_waiters", "Tasks waiting for a connection to be checked out"
+)
+POOL_ACQUIRE_WAIT = Histogram(
+    "db_pool_acquire_seconds", "Time spent checking out a pool connection"
+)
+POOL_ACQUIRE_TIMEOUTS = Counter(
+    "db_pool_acquire_timeouts_total",
+    "Connection checkouts that gave up after DB_ACQUIRE_TIMEOUT",
+)
+
+
+class PoolAcquireTimeout(Exception):
+    """
+    No connection became available within `DB_ACQUIRE_TIMEOUT`
+    """
+
+
+class PgBouncerConnection(asyncpg.Connection):
+    """
+    A released connection only needs to be out of any transaction: the session
+    reset asyncpg runs by default (`RESET ALL`, `UNLISTEN *`, unlocking advisory
+    locks...) would be sent to whatever server connection PgBouncer picks
+    """
+
+    async def reset(self, *, timeout=None) -> None:
+        if self.is_in_transaction():
+            await self.execute("ROLLBACK", timeout=timeout)
+
+
+def pool_max_size() -> int:
+    """
+    `DB_MAX_SIZE`, or this worker's share of `DB_POOL_BUDGET`
+    """
+    if config.DB_POOL_BUDGET:
+        return max(config.DB_POOL_BUDGET // worker_count(), 1)
+    return config.DB_MAX_SIZE
+
+
+def get_pool_options() -> Dict[str, Any]:
+    """
+    asyncpg pool options from the `DB_*` settings
+    """
+    max_size = pool_max_size()
+    options = dict(
+        min_size=min(config.DB_MIN_SIZE, max_size),
+        max_size=max_size,
+        max_inactive_connection_lifetime=config.DB_MAX_INACTIVE_LIFETIME,
+        statement_cache_size=config.DB_STATEMENT_CACHE_SIZE,
+        command_timeout=config.DB_COMMAND_TIMEOUT or None,
+    )
+
+    if config.DB_PGBOUNCER:
+        # unnamed statements only: a named one would be prepared on one server
+        # connection and executed on another
+        options.update(statement_cache_size=0, connection_class=PgBouncerConnection)
+
+    return options
+
+
+class InstrumentedPool:
+    """
+    Stands in for the asyncpg pool used by the `databases` backend
+    """
+
+    def __init__(self, pool, *, acquire_timeout: Optional[float]) -> None:
+        self._pool = pool
+        self.acquire_timeout = acquire_timeout
+        self.in_use = 0
+        self.waiters = 0
+
+    def __getattr__(self, name: str):
+        return getattr(self._pool, name)
+
+    @property
+    def size(self) -> int:
+        return self._pool.get_size()
+
+    @property
+    def idle(self) -> int:
+        return max(self.size - self.in_use, 0)
+
+    async def acquire(self):
+        self.waiters += 1
+        start = perf_counter()
+        try:
+            connection = await self._pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            POOL_ACQUIRE_TIMEOUTS.inc()
+            raise PoolAcquireTimeout(
+                f"no database connection available after {self.acquire_timeout}s"
+            )
+        finally:
+            self.waiters -= 1
+            wait = perf_counter() - start
+            POOL_ACQUIRE_WAIT.observe(wait)
+            timings = current_request_timings.get()
+            if timings is not None:
+                timings.pool += wait
+
+        self.in_use += 1
+        return connection
+
+    async def release(self, connection) -> None:
+        self.in_use -= 1
+        await self._pool.release(connection)
+
+
+def instrument_pool(database: Database) -> InstrumentedPool:
+    backend = database._backend
+    pool = backend._pool = InstrumentedPool(
+        backend._pool, acquire_timeout=config.DB_ACQUIRE_TIMEOUT or None
+    )
+
+    POOL_CONNECTIONS.labels("in_use").set_function(lambda: pool.in_use)
+    POOL_CONNECTIONS.labels("idle").set_function(lambda: pool.idle)
+    POOL_MAX_SIZE.set(pool_max_size())
+    POOL_WAITERS.set_function(lambda: pool.waiters)
+
+    return pool
+
+
+def detached_task(coroutine: Coroutine) -> asyncio.Task:
+    """
+    A task running `coroutine` in an empty context: `databases` binds a
+    connection to the context of the task that first uses it, which child tasks
+    inherit, so this one checks out a connection of its own (and sees the
+    defaults of every other context variable)
+    """
+    return contextvars.Context().run(asyncio.ensure_future, coroutine)
+
+
+async def prewarm_pool(database: Database, size: int) -> None:
+    """
+    Check out `size` connections at once and run a trivial query on each, so
+    startup fails fast on a broken database and the first requests find
+    ready-to-use connections
+    """
+
+    async def ping() -> None:
+        # every task gets its own connection
+        async with database.connection() as connection:
+            await connection.fetch_val("select 1")
+            # hold it until all of them are checked out
+            await barrier.wait()
+
+    barrier = _Barrier(size)
+    await asyncio.gather(*(asyncio.ensure_future(ping()) for _ in range(size)))
+
+
+class _Barrier:
+    def __init__(self, parties: int) -> None:
+        self.parties = parties
+        self._arrived = 0
+        self._event = asyncio.Event()
+
+    async def wait(self) -> None:
+        self._arrived += 1
+        if self._arrived >= self.parties:
+            self._event.set()
+        await self._event.wait()
+
+
+async def recycle_connections(pool: InstrumentedPool, max_lifetime: float) -> None:
+    """
+    asyncpg only retires idle connections: every `max_lifetime` seconds expire
+    them all, idle ones are replaced on their next checkout and busy ones when
+    they are released, so no connection outlives roughly twice that period
+    """
+    while True:
+        await asyncio.sleep(max_lifetime)
+        await pool.expire_connections()
+        logger.info("db pool: connections expired after %ss", max_lifetime)
@@ -0,0 +1,124 @@
+"""
+Background propagation of customer renames to `orders.customer_name`.
+
+`CustomersRepository.update_customer` only enqueues a job; this worker walks the
+orders of each pending job in keyset-ordered chunks, one short transaction per
+chunk, saving its cursor as it goes. Re-running a chunk is harmless (already
+renamed orders are skipped) and an interrupted job resumes from its cursor.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from databases import Database
+from fastapi import FastAPI
+
+from app.core import config
+from app.core.metrics import Counter, Gauge
+from app.db.repositories.customers import CustomersRepository
+
+logger = logging.getLogger(__name__)
+
+PENDING_JOBS = Gauge(
+    "customer_name_propagation_pending_jobs",
+    "Customer renames not yet propagated to their orders",
+)
+PENDING_ORDERS = Gauge(
+    "customer_name_propagation_pending_orders",
+    "Orders still to be visited by pending customer rename jobs",
+)
+LAG = Gauge(
+    "customer_name_propagation_lag_seconds",
+    "Age of the oldest pending customer rename job",
+)
+RENAMED_ORDERS = Counter(
+    "customer_name_propagation_renamed_orders_total",
+    "Orders whose customer name was updated by the propagation worker",
+)
+
+
+class CustomerNamePropagator:
+    def __init__(
+        self,
+        db: Database,
+        *,
+        chunk_size: int = 500,
+        poll_interval: float = 1.0,
+    ) -> None:
+        self.customers_repo = CustomersRepository(db)
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_until_idle(self) -> int:
+        """
+        Process chunks until no job is left (or the remaining ones are being run
+        by other workers). Returns the number of renamed orders.
+        """
+        renamed_orders = 0
+        while True:
+            renamed = await self.customers_repo.propagate_customer_name_chunk(
+                chunk_size=self.chunk_size
+            )
+            if renamed is None:
+                return renamed_orders
+
+            renamed_orders += renamed
+            RENAMED_ORDERS.inc(renamed)
+            # let request handlers run between chunks
+            await asyncio.sleep(0)
+
+    async def refresh_metrics(self) -> None:
+        lag = await self.customers_repo.get_customer_name_propagation_lag()
+        PENDING_JOBS.set(lag.pending_jobs)
+        PENDING_ORDERS.set(lag.pending_orders)
+        LAG.set(lag.lag)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                renamed_orders = await self.run_until_idle()
+                if renamed_orders:
+                    logger.info("customer-names: %s orders renamed", renamed_orders)
+                await self.refresh_metrics()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("customer-names: propagation failed")
+
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self) -> None:
+        # the worker task gets its own connection (databases binds one per task)
+        self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+def start_customer_name_propagation(app: FastAPI) -> None:
+    db = getattr(app.state, "_db", None)
+    if not config.CUSTOMER_NAME_PROPAGATION_ENABLED or db is None:
+        return
+
+    propagator = CustomerNamePropagator(
+        db,
+        chunk_size=config.CUSTOMER_NAME_PROPAGATION_CHUNK_SIZE,
+        poll_interval=config.CUSTOMER_NAME_PROPAGATION_INTERVAL,
+    )
+    propagator.start()
+    app.state._customer_name_propagator = propagator
+
+
+async def stop_customer_name_propagation(app: FastAPI) -> None:
+    propagator = getattr(app.state, "_customer_name_propagator", None)
+    if propagator is not None:
+        await propagator.stop()
@@ -0,0 +1,76 @@
+"""
+Bulk recomputes of order totals, run as background jobs.
+
+`POST /api/admin/orders/recompute-totals` records a job and starts it in a task
+of the worker that received the request. The job row is updated in the
+transaction of every chunk, so `GET /api/admin/orders/recompute-totals/{id}`
+reports its progress from any worker, and its task only holds a connection
+while a chunk runs. A job interrupted by a shutdown is marked failed: posting
+it again with `id_from` past its `last_processed_id` resumes it.
+"""
+import asyncio
+import logging
+from typing import Set
+
+from databases import Database
+from fastapi import FastAPI
+
+from app.core import config
+from app.db.pool import detached_task
+from app.db.repositories.orders import OrdersRepository
+from app.models.order import OrderTotalsRecompute, OrderTotalsRecomputeJob
+
+logger = logging.getLogger(__name__)
+
+
+async def run_order_totals_recompute(
+    db: Database, job: OrderTotalsRecomputeJob, recompute: OrderTotalsRecompute
+) -> None:
+    orders_repo = OrdersRepository(db)
+
+    def log_progress(last_processed_id: int, chunks: int, updated_orders: int):
+        logger.info(
+            "recompute-totals %s: chunk %s, orders up to %s, %s updated",
+            job.id,
+            chunks,
+            last_processed_id,
+            updated_orders,
+        )
+
+    try:
+        job = await orders_repo.recompute_order_totals(
+            job_id=job.id,
+            recompute=recompute,
+            chunk_size=recompute.chunk_size or config.ORDER_TOTALS_CHUNK_SIZE,
+            progress=log_progress,
+        )
+        logger.info(
+            "recompute-totals %s: done, %s orders updated", job.id, job.updated_orders
+        )
+    except asyncio.CancelledError:
+        await orders_repo.finish_order_totals_recompute(
+            job_id=job.id, error="interrupted"
+        )
+        raise
+    except Exception as e:
+        logger.exception("recompute-totals %s: failed", job.id)
+        await orders_repo.finish_order_totals_recompute(
+            job_id=job.id, error=f"{type(e).__name__}: {e}"
+        )
+
+
+def start_order_totals_recompute(
+    app: FastAPI, job: OrderTotalsRecomputeJob, recompute: OrderTotalsRecompute
+) -> None:
+    jobs: Set[asyncio.Task] = app.state._order_totals_recomputes
+    # on a connection of its own, past the end of the request
+    task = detached_task(run_order_totals_recompute(app.state._db, job, recompute))
+    jobs.add(task)
+    task.add_done_callback(jobs.discard)
+
+
+async def stop_order_totals_recomputes(app: FastAPI) -> None:
+    jobs: Set[asyncio.Task] = getattr(app.state, "_order_totals_recomputes", set())
+    for task in jobs:
+        task.cancel()
+    await asyncio.gather(*jobs, return_exceptions=True)
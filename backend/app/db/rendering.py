@@ -0,0 +1,87 @@
+"""
+JSON pages rendered by the database.
+
+`json_page(query)` wraps a page query so that Postgres returns the whole page as
+a JSON array, already UTF-8 encoded (`bytea`): the worker does not build a
+Record, a model or a dict per row, it copies the bytes into the response.
+
+The select list of the page comes from `json_columns(model, table)`, compiled
+once from the response model: same keys in the same order, nested models built
+with `row_to_json` from their prefixed columns, numerics as floats and
+timestamps rendered in UTC the way `datetime.isoformat()` does. Objects are
+rendered by `row_to_json`, compact like orjson (`json_agg` and
+`json_build_object` would add whitespace).
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Type
+
+from pydantic import BaseModel
+from pydantic.utils import lenient_issubclass
+from sqlalchemy import Table, literal_column, select
+from sqlalchemy.sql import Select
+
+SQL_JSON_PAGE = """
+    convert_to(
+        '[' || coalesce(string_agg(cast(row_to_json(page) as text), ','), '') || ']',
+        'UTF8'
+    )
+    """
+
+# microseconds are left out when they are 0, like `datetime.isoformat()` does
+SQL_ISO_TIMESTAMP = """
+    to_char({column} at time zone 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS')
+    || case
+        when cast(date_part('microseconds', {column}) as integer) % 1000000 = 0 then ''
+        else to_char({column} at time zone 'UTC', '.US')
+    end
+    || '+00:00'
+    """
+
+
+def _json_value(column: str, type_) -> str:
+    if type_ is float:
+        return f"cast({column} as float8)"
+    if lenient_issubclass(type_, datetime):
+        return SQL_ISO_TIMESTAMP.format(column=column)
+    return column
+
+
+def json_columns(
+    model: Type[BaseModel], table: Table, *, nested: Optional[Dict[str, str]] = None
+) -> List[str]:
+    """
+    Select list rendering a row of `table` as `model`; `nested`: prefix of the
+    columns of each nested model field
+    """
+    nested = nested or {}
+    columns = {column.name for column in table.columns}
+    select_list = []
+    for name, field in model.__fields__.items():
+        if name in nested:
+            prefix = nested[name]
+            values = ", ".join(
+                f"{_json_value(prefix + key, nested_field.type_)} as {key}"
+                for key, nested_field in field.type_.__fields__.items()
+                if prefix + key in columns
+            )
+            select_list.append(
+                f"(select row_to_json({name}) from (select {values}) as {name}) as {name}"
+            )
+        elif name in columns:
+            value = _json_value(name, field.type_)
+            select_list.append(name if value == name else f"{value} as {name}")
+    return select_list
+
+
+def json_page(query: Select) -> Select:
+    """
+    The rows of `query` as one JSON array (`bytea`, `[]` when there is none)
+    """
+    return select([literal_column(SQL_JSON_PAGE)]).select_from(query.alias("page"))
+
+
+def json_page_query(columns: List[str], table: Table) -> Select:
+    """
+    Page query to filter, limit and hand to `json_page`
+    """
+    return select([literal_column(column) for column in columns]).select_from(table)
@@ -1,6 +1,82 @@
+import functools
+import inspect
+from contextvars import ContextVar
+from time import perf_counter
+
 from databases import Database
+from fastapi import status
+from fastapi.exceptions import HTTPException
+from sqlalchemy import Table, select
+from sqlalchemy.sql import ClauseElement
+
+from app.core.timing import current_request_timings
+from app.core.tracing import span
+
+# set by `app.db.unit_of_work.UnitOfWork` while its block is running
+current_unit_of_work: ContextVar = ContextVar("current_unit_of_work", default=None)
+
+# "OrdersRepository.create_order" while that method runs, used to label queries
+current_repository_method: ContextVar = ContextVar(
+    "current_repository_method", default=None
+)
+
+
+def _track_repository_method(name: str, method):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        timings = current_request_timings.get()
+        # only the outermost repository call adds to the request timings
+        if timings is not None and current_repository_method.get() is None:
+            start = perf_counter()
+        else:
+            timings = None
+
+        token = current_repository_method.set(name)
+        try:
+            with span(name):
+                return await method(*args, **kwargs)
+        finally:
+            current_repository_method.reset(token)
+            if timings is not None:
+                timings.repository += perf_counter() - start
+
+    return wrapper
 
 
 class BaseRepository:
+    # name in metrics, traces and query stats (a subclass may report as the
+    # repository it stands in for)
+    repository_name = "BaseRepository"
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        if "repository_name" not in vars(cls):
+            cls.repository_name = cls.__name__
+
+        for name, attribute in list(vars(cls).items()):
+            if not name.startswith("_") and inspect.iscoroutinefunction(attribute):
+                setattr(
+                    cls,
+                    name,
+                    _track_repository_method(f"{cls.repository_name}.{name}", attribute),
+                )
+
     def __init__(self, db: Database) -> None:
         self.db = db
+
+    @property
+    def unit_of_work(self):
+        return current_unit_of_work.get()
+
+    async def raise_if_modified(self, *, table: Table, whereclause: ClauseElement):
+        """
+        Only called after a conditional UPDATE/DELETE matched no row: if the row
+        still exists, the `updated_at` precondition is what failed
+        """
+        row_id = await self.db.fetch_val(query=select([table.c.id]).where(whereclause))
+
+        if row_id is not None:
+            raise HTTPException(
+                status.HTTP_412_PRECONDITION_FAILED,
+                "Resource was modified by another request",
+            )
@@ -1,22 +1,106 @@
+from datetime import datetime
 from typing import List, Optional, Union
 
 from sqlalchemy import or_, select
 
+from app.db.rendering import json_columns, json_page, json_page_query
 from app.db.repositories.base import BaseRepository
 from app.db.tables.customers import customers_table
-from app.models.customer import CustomerCreateUpdate, CustomerInDB, CustomerUpdate
+from app.models.customer import (
+    Customer,
+    CustomerCreateUpdate,
+    CustomerInDB,
+    CustomerNamePropagationLag,
+    CustomerUpdate,
+)
 from app.models.pagination import Pagination
 
+# rendered as the response model of the list route
+CUSTOMER_JSON_COLUMNS = json_columns(Customer, customers_table)
+
+# orders keep a copy of the customer name: a rename only enqueues a job (when
+# some order is actually stale), the orders are updated in the background
+SQL_ENQUEUE_CUSTOMER_NAME_PROPAGATION = """
+    insert into customer_name_propagations (customer_id, customer_name)
+    select
+        :customer_id, :customer_name
+    where
+        exists (
+            select 1
+            from orders
+            where customer_id = :customer_id and customer_name <> :customer_name
+        )
+    on conflict (customer_id) do update set
+        customer_name = excluded.customer_name,
+        last_order_id = 0
+    """
+
+# takes the oldest job no other worker is running and renames the next chunk of
+# its orders (keyset on orders.id); the job row stays locked until the caller
+# saves the cursor, so a rename meanwhile waits and then restarts the job
+SQL_PROPAGATE_CUSTOMER_NAME_CHUNK = """
+    with job as (
+        select
+            customer_id, customer_name, last_order_id
+        from
+            customer_name_propagations
+        order by
+            enqueued_at
+        limit 1
+        for update skip locked
+    ), chunk as (
+        select
+            o.id
+        from
+            orders as o
+            join job on job.customer_id = o.customer_id
+        where
+            o.id > job.last_order_id
+        order by
+            o.id
+        limit :chunk_size
+    ), renamed as (
+        update orders as o set
+            customer_name = job.customer_name
+        from
+            chunk, job
+        where
+            o.id = chunk.id
+            and o.customer_name <> job.customer_name
+        returning
+            o.id
+    )
+    select
+        job.customer_id,
+        (select max(id) from chunk) as last_order_id,
+        (select count(*) from renamed) as renamed_orders
+    from
+        job
+    """
+
+SQL_GET_CUSTOMER_NAME_PROPAGATION_LAG = """
+    select
+        count(*) as pending_jobs,
+        coalesce(sum(pending.orders), 0) as pending_orders,
+        min(p.enqueued_at) as oldest_enqueued_at,
+        coalesce(extract(epoch from now() - min(p.enqueued_at)), 0) as lag
+    from
+        customer_name_propagations as p
+        cross join lateral (
+            select count(*) as orders
+            from orders as o
+            where o.customer_id = p.customer_id and o.id > p.last_order_id
+        ) as pending
+    """
+
 
 class CustomersRepository(BaseRepository):
     """ "
     All database actions associated with the Customer resource
     """
 
-    async def get_all_customers(
-        self, *, search: str = None, pagination: Pagination
-    ) -> Optional[List[CustomerInDB]]:
-        query = select([customers_table])
+    @staticmethod
+    def _filter_customers(query, *, search: Optional[str], pagination: Pagination):
         if search:
             query = query.where(
                 or_(
@@ -25,9 +109,29 @@ class CustomersRepository(BaseRepository):
                 )
             )
 
-        query = query.limit(pagination.limit).offset(pagination.skip)
+        return query.limit(pagination.limit).offset(pagination.skip)
+
+    async def get_all_customers(
+        self, *, search: str = None, pagination: Pagination
+    ) -> Optional[List[CustomerInDB]]:
+        query = self._filter_customers(
+            select([customers_table]), search=search, pagination=pagination
+        )
         customers = await self.db.fetch_all(query=query)
-        return [CustomerInDB(**customer) for customer in customers]
+        return [CustomerInDB.from_db(customer) for customer in customers]
+
+    async def get_all_customers_json(
+        self, *, search: str = None, pagination: Pagination
+    ) -> bytes:
+        """
+        Same page as `get_all_customers`, rendered as JSON by the database
+        """
+        query = self._filter_customers(
+            json_page_query(CUSTOMER_JSON_COLUMNS, customers_table),
+            search=search,
+            pagination=pagination,
+        )
+        return await self.db.fetch_val(query=json_page(query))
 
     async def get_customer_by_id(self, *, customer_id: int) -> Optional[CustomerInDB]:
         customer = await self.db.fetch_one(
@@ -35,7 +139,7 @@ class CustomersRepository(BaseRepository):
         )
 
         if not customer is None:
-            return CustomerInDB(**customer)
+            return CustomerInDB.from_db(customer)
 
     async def create_customer(
         self, *, new_customer: CustomerCreateUpdate
@@ -48,7 +152,7 @@ class CustomersRepository(BaseRepository):
                 values=query_values,
             )
 
-            return CustomerInDB(**customer)
+            return CustomerInDB.from_db(customer)
 
     async def update_customer(
         self,
@@ -56,38 +160,90 @@ class CustomersRepository(BaseRepository):
         customer_id: int,
         customer_update: Union[CustomerCreateUpdate, CustomerUpdate],
         patching: bool,
+        expected_updated_at: Optional[datetime] = None,
     ) -> Optional[CustomerInDB]:
-        customer = await self.get_customer_by_id(customer_id=customer_id)
-
-        if customer is None:
-            return
-
         query_values = customer_update.dict(exclude_unset=patching)
 
+        whereclause = customers_table.c.id == customer_id
+        query = customers_table.update().where(whereclause)
+        if expected_updated_at is not None:
+            query = query.where(customers_table.c.updated_at == expected_updated_at)
+
         async with self.db.transaction():
             customer = await self.db.fetch_one(
-                query=customers_table.update()
-                .where(customers_table.c.id == customer_id)
-                .returning(*customers_table.columns),
+                query=query.returning(*customers_table.columns),
                 values=query_values,
             )
 
-            return CustomerInDB(**customer)
+            if customer is None:
+                if expected_updated_at is not None:
+                    await self.raise_if_modified(
+                        table=customers_table, whereclause=whereclause
+                    )
+                return
+
+            if "name" in query_values:
+                await self.db.execute(
+                    query=SQL_ENQUEUE_CUSTOMER_NAME_PROPAGATION,
+                    values=dict(customer_id=customer_id, customer_name=customer["name"]),
+                )
+
+            return CustomerInDB.from_db(customer)
+
+    async def propagate_customer_name_chunk(self, *, chunk_size: int) -> Optional[int]:
+        """
+        Advance one propagation job by (at most) `chunk_size` orders, in its own
+        short transaction. Finished jobs are removed.
+
+        Returns how many orders were renamed, or None when no job is pending.
+        """
+        async with self.db.transaction():
+            chunk = await self.db.fetch_one(
+                query=SQL_PROPAGATE_CUSTOMER_NAME_CHUNK,
+                values=dict(chunk_size=chunk_size),
+            )
+            if chunk is None:
+                return
+
+            if chunk["last_order_id"] is None:
+                await self.db.execute(
+                    query="delete from customer_name_propagations where customer_id = :customer_id",
+                    values=dict(customer_id=chunk["customer_id"]),
+                )
+            else:
+                await self.db.execute(
+                    query="update customer_name_propagations set last_order_id = :last_order_id where customer_id = :customer_id",
+                    values=dict(
+                        customer_id=chunk["customer_id"],
+                        last_order_id=chunk["last_order_id"],
+                    ),
+                )
+
+            return chunk["renamed_orders"]
+
+    async def get_customer_name_propagation_lag(self) -> CustomerNamePropagationLag:
+        lag = await self.db.fetch_one(query=SQL_GET_CUSTOMER_NAME_PROPAGATION_LAG)
+        return CustomerNamePropagationLag(**lag)
 
     async def delete_customer_by_id(
-        self, *, customer_id: int
+        self, *, customer_id: int, expected_updated_at: Optional[datetime] = None
     ) -> Optional[CustomerInDB]:
+        whereclause = customers_table.c.id == customer_id
+        query = customers_table.delete().where(whereclause)
+        if expected_updated_at is not None:
+            query = query.where(customers_table.c.updated_at == expected_updated_at)
+
+        # Apply validations for customer deletion
+
         customer = await self.db.fetch_one(
-            query=select([customers_table]).where(customers_table.c.id == customer_id)
+            query=query.returning(*customers_table.columns)
         )
 
         if customer is None:
+            if expected_updated_at is not None:
+                await self.raise_if_modified(
+                    table=customers_table, whereclause=whereclause
+                )
             return
 
-        # Apply validations for customer deletion
-
-        await self.db.execute(
-            query=customers_table.delete().where(customers_table.c.id == customer_id)
-        )
-
-        return CustomerInDB(**customer)
+        return CustomerInDB.from_db(customer)
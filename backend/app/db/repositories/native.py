@@ -0,0 +1,249 @@
+"""
+Repositories of the "asyncpg" backend (`DB_BACKEND`).
+
+The hottest methods run their statements on the asyncpg connection itself (see
+`app.db.native`) and build the models straight from the asyncpg Records;
+everything else is inherited from the `databases` repositories, whose names they
+keep in metrics and traces.
+"""
+from typing import Dict, List, Optional, Type
+
+from fastapi import HTTPException, status
+from sqlalchemy import Table
+
+from app.db.native import NativeQuery, native_connection
+from app.db.repositories.base import BaseRepository
+from app.db.repositories.orders import (
+    ORDER_ROW_ADAPTER,
+    SQL_INSERT_ORDER_ITEMS_BATCH,
+    OrdersRepository,
+)
+from app.db.repositories.products import ProductsRepository
+from app.db.tables.orders_item import order_items_table
+from app.db.tables.orders import orders_table
+from app.db.tables.products import products_table
+from app.models.order import OrderCreateUpdate, OrderInDB, OrderWithItemsInDB
+from app.models.order_item import OrderItemInDB
+from app.models.pagination import Pagination
+from app.models.product import ProductInDB
+
+
+def _columns(table: Table) -> str:
+    return ", ".join(column.name for column in table.columns)
+
+
+# every column but the generated ones, in table order
+ORDER_INSERT_COLUMNS = tuple(
+    column.name
+    for column in orders_table.columns
+    if column.name not in ("id", "created_at", "updated_at")
+)
+
+SQL_SELECT_PRODUCT_BY_ID = NativeQuery(
+    f"""
+    select
+        {_columns(products_table)}
+    from
+        products
+    where
+        id = :product_id
+    """,
+    "product_id",
+)
+
+SQL_SELECT_PRODUCTS = NativeQuery(
+    f"""
+    select
+        {_columns(products_table)}
+    from
+        products
+    limit :limit offset :skip
+    """,
+    "limit",
+    "skip",
+)
+
+SQL_SEARCH_PRODUCTS = NativeQuery(
+    f"""
+    select
+        {_columns(products_table)}
+    from
+        products
+    where
+        name ilike :search
+    limit :limit offset :skip
+    """,
+    "search",
+    "limit",
+    "skip",
+)
+
+SQL_SELECT_CUSTOMER_NAME = NativeQuery(
+    """
+    select name from customers where id = :customer_id
+    """,
+    "customer_id",
+)
+
+SQL_INSERT_ORDER = NativeQuery(
+    f"""
+    insert into orders (
+        {", ".join(ORDER_INSERT_COLUMNS)}
+    )
+    values (
+        {", ".join(f":{column}" for column in ORDER_INSERT_COLUMNS)}
+    )
+    returning
+        id
+    """,
+    *ORDER_INSERT_COLUMNS,
+)
+
+SQL_INSERT_ORDER_ITEMS = NativeQuery(
+    SQL_INSERT_ORDER_ITEMS_BATCH, "order_ids", "product_ids", "qtys"
+)
+
+SQL_SELECT_ORDER_BY_ID = NativeQuery(
+    f"""
+    select
+        {_columns(orders_table)}
+    from
+        orders
+    where
+        id = :order_id
+    """,
+    "order_id",
+)
+
+# the new total and the order row in one round trip
+SQL_UPDATE_ORDER_TOTAL = NativeQuery(
+    f"""
+    update orders set
+        total = (
+            select coalesce(sum(it.total), 0)
+            from order_items as it
+            where it.order_id = orders.id
+        )
+    where
+        id = :order_id
+    returning
+        {_columns(orders_table)}
+    """,
+    "order_id",
+)
+
+SQL_SELECT_ORDER_ITEMS = NativeQuery(
+    f"""
+    select
+        {_columns(order_items_table)}
+    from
+        order_items
+    where
+        order_id = :order_id
+    limit :limit offset :skip
+    """,
+    "order_id",
+    "limit",
+    "skip",
+)
+
+
+class NativeProductsRepository(ProductsRepository):
+    repository_name = "ProductsRepository"
+
+    async def get_all_products(
+        self, *, search: str = None, pagination: Pagination
+    ) -> Optional[List[ProductInDB]]:
+        async with native_connection(self.db) as connection:
+            if search:
+                products = await connection.fetch(
+                    SQL_SEARCH_PRODUCTS,
+                    f"%{search}%",
+                    pagination.limit,
+                    pagination.skip,
+                )
+            else:
+                products = await connection.fetch(
+                    SQL_SELECT_PRODUCTS, pagination.limit, pagination.skip
+                )
+
+        return [ProductInDB.from_db(product) for product in products]
+
+    async def get_product_by_id(self, *, product_id: int) -> Optional[ProductInDB]:
+        async with native_connection(self.db) as connection:
+            product = await connection.fetchrow(SQL_SELECT_PRODUCT_BY_ID, product_id)
+
+        if not product is None:
+            return ProductInDB.from_db(product)
+
+
+class NativeOrdersRepository(OrdersRepository):
+    repository_name = "OrdersRepository"
+
+    async def get_order_by_id(self, *, order_id: int) -> Optional[OrderInDB]:
+        async with native_connection(self.db) as connection:
+            order = await connection.fetchrow(SQL_SELECT_ORDER_BY_ID, order_id)
+
+        if not order is None:
+            return OrderInDB.from_db(ORDER_ROW_ADAPTER.to_model(order))
+
+    async def create_order(self, *, new_order: OrderCreateUpdate) -> OrderWithItemsInDB:
+        async with native_connection(self.db) as connection:
+            customer_name = await connection.fetchval(
+                SQL_SELECT_CUSTOMER_NAME, new_order.customer_id
+            )
+            if customer_name is None:
+                raise HTTPException(status.HTTP_400_BAD_REQUEST, "Customer not found")
+
+            values = ORDER_ROW_ADAPTER.to_row(new_order, exclude={"items"})
+            values.update(customer_name=customer_name, total=0)
+
+            async with self.db.transaction():
+                order_id = await connection.fetchval(
+                    SQL_INSERT_ORDER, *(values[column] for column in ORDER_INSERT_COLUMNS)
+                )
+
+                # all the items in one statement, priced from the products
+                items = []
+                if new_order.items:
+                    order_items = [
+                        dict(order_id=order_id, product_id=item.product_id, qty=item.qty)
+                        for item in new_order.items
+                    ]
+                    items = await connection.fetch(
+                        SQL_INSERT_ORDER_ITEMS,
+                        [order_id] * len(order_items),
+                        [item["product_id"] for item in order_items],
+                        [item["qty"] for item in order_items],
+                    )
+                    self._raise_if_products_missing(order_items, items)
+
+                # inside a unit of work the total is recomputed at commit time
+                unit_of_work = self.unit_of_work
+                if unit_of_work is None:
+                    order = await connection.fetchrow(SQL_UPDATE_ORDER_TOTAL, order_id)
+                else:
+                    unit_of_work.touch_order(order_id)
+                    order = await connection.fetchrow(SQL_SELECT_ORDER_BY_ID, order_id)
+
+        return OrderWithItemsInDB.from_db(
+            ORDER_ROW_ADAPTER.to_model(order),
+            items=[OrderItemInDB.from_db(item) for item in items],
+        )
+
+    async def get_all_order_items(
+        self, *, order_id: int, pagination: Pagination
+    ) -> Optional[List[OrderItemInDB]]:
+        async with native_connection(self.db) as connection:
+            order_items = await connection.fetch(
+                SQL_SELECT_ORDER_ITEMS, order_id, pagination.limit, pagination.skip
+            )
+
+        return [OrderItemInDB.from_db(order_item) for order_item in order_items]
+
+
+# repository used in place of each `databases` one by the "asyncpg" backend
+NATIVE_REPOSITORIES: Dict[Type[BaseRepository], Type[BaseRepository]] = {
+    ProductsRepository: NativeProductsRepository,
+    OrdersRepository: NativeOrdersRepository,
+}
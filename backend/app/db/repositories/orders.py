@@ -1,15 +1,23 @@
-from typing import Mapping, Optional, List, Union
+from datetime import datetime
+from typing import Callable, Iterable, Mapping, Optional, List, Tuple, Union
 
 from fastapi import status, HTTPException
 from fastapi.exceptions import HTTPException
 from sqlalchemy import select, and_
 
+from app.db.adapters import FlattenedRowAdapter
+from app.core import config
+from app.db.contention import ADVISORY_LOCK_ORDERS, serialized_by_order
+from app.db.rendering import json_columns, json_page, json_page_query
 from app.db.repositories.base import BaseRepository
 from app.db.tables.orders import orders_table
 from app.db.tables.orders_item import order_items_table
 from app.models.order import (
+    Order,
     OrderCreateUpdate,
     OrderInDB,
+    OrderTotalsRecompute,
+    OrderTotalsRecomputeJob,
     OrderUpdate,
     OrderWithItemsInDB,
 )
@@ -19,9 +27,19 @@ from app.models.order_item import (
     OrderItemUpdate,
 )
 from app.models.pagination import Pagination
-from app.utils import dict_include_prefix, dict_remove_prefix
 from .customers import CustomersRepository
 
+ORDER_ROW_ADAPTER = FlattenedRowAdapter(
+    orders_table,
+    fields=("id", "customer_id", "customer_name", "total", "created_at", "updated_at"),
+    nested=dict(billing_address="billing_", shipping_address="shipping_"),
+)
+# rendered as the response model of the list route
+ORDER_JSON_COLUMNS = json_columns(
+    Order,
+    orders_table,
+    nested=dict(billing_address="billing_", shipping_address="shipping_"),
+)
 
 SQL_INSERT_ORDER_ITEMS = """
     insert into order_items (
@@ -55,6 +73,230 @@ SQL_INSERT_ORDER_ITEMS = """
         updated_at
     """
 
+# same as above for many items at once (and possibly many orders): the
+# ordinality keeps the returned rows in the same order as the input arrays
+SQL_INSERT_ORDER_ITEMS_BATCH = """
+    insert into order_items (
+        order_id,
+        product_id,
+        product_name,
+        price,
+        qty,
+        total
+    )
+    select
+        it.order_id,
+        p.id as product_id,
+        p.name as product_name,
+        p.price,
+        it.qty,
+        p.price * it.qty as total
+    from
+        unnest(
+            cast(:order_ids as integer[]),
+            cast(:product_ids as integer[]),
+            cast(:qtys as integer[])
+        ) with ordinality as it(order_id, product_id, qty, position)
+        join products as p on p.id = it.product_id
+    order by
+        it.position
+    returning
+        id,
+        order_id,
+        product_id,
+        product_name,
+        price,
+        qty,
+        total,
+        created_at,
+        updated_at
+    """
+
+SQL_UPDATE_ORDER_TOTALS = """
+    update orders set
+        total = (
+            select coalesce(sum(it.total), 0)
+            from order_items as it
+            where it.order_id = orders.id
+        )
+    where
+        id = any(cast(:order_ids as integer[]))
+    """
+
+SQL_INSERT_ORDER_TOTALS_RECOMPUTE = """
+    insert into order_totals_recomputes default values
+    returning *
+    """
+
+SQL_START_ORDER_TOTALS_RECOMPUTE = """
+    update order_totals_recomputes set
+        first_id = :first_id,
+        last_id = :last_id,
+        updated_at = now()
+    where
+        id = :job_id
+    """
+
+# in the transaction of the chunk: the progress is saved with its work
+SQL_RECORD_ORDER_TOTALS_CHUNK = """
+    update order_totals_recomputes set
+        last_processed_id = :last_processed_id,
+        chunks = chunks + 1,
+        updated_orders = updated_orders + :updated_orders,
+        updated_at = now()
+    where
+        id = :job_id
+    """
+
+SQL_FINISH_ORDER_TOTALS_RECOMPUTE = """
+    update order_totals_recomputes set
+        status = :status,
+        error = :error,
+        updated_at = now(),
+        finished_at = now()
+    where
+        id = :job_id
+    returning
+        *
+    """
+
+# the next chunk of matching order ids after :after_id (keyset paging)
+SQL_NEXT_ORDER_IDS = """
+    select
+        o.id
+    from
+        orders as o
+    where
+        o.id > :after_id
+        and o.id <= :last_id
+        {filters}
+    order by
+        o.id
+    limit :chunk_size
+    """
+
+# in id order, like every other caller locking several orders
+SQL_LOCK_ORDERS = """
+    select
+        id
+    from
+        orders
+    where
+        id = any(cast(:order_ids as integer[]))
+    order by
+        id
+    for update
+    """
+
+SQL_LOCK_ORDER_ITEMS = """
+    select
+        id
+    from
+        order_items
+    where
+        order_id = any(cast(:order_ids as integer[]))
+    order by
+        id
+    for update
+    """
+
+SQL_ADVISORY_LOCK_ORDERS = """
+    select
+        pg_advisory_xact_lock(:lock_class, order_id)
+    from
+        unnest(cast(:order_ids as integer[])) as order_id
+    """
+
+# one grouped statement over orders locked by an earlier statement of the
+# transaction (orders without items get 0)
+SQL_RECOMPUTE_LOCKED_ORDER_TOTALS = """
+    with totals as (
+        select
+            o.id as order_id,
+            coalesce(sum(it.total), 0) as total
+        from
+            orders as o
+            left join order_items as it on it.order_id = o.id
+        where
+            o.id = any(cast(:order_ids as integer[]))
+        group by
+            o.id
+    ), updated as (
+        update orders set
+            total = totals.total
+        from
+            totals
+        where
+            orders.id = totals.order_id
+            {only_mismatched}
+        returning
+            orders.id
+    )
+    select count(*) from updated
+    """
+
+# orders of the id window whose total differs from the sum of their items,
+# or holding items whose total is not price * qty
+SQL_FIND_ORDER_TOTAL_MISMATCHES = """
+    select
+        o.id as order_id,
+        o.total as stored_total,
+        coalesce(it.items_total, 0) as items_total,
+        coalesce(it.expected_total, 0) as expected_total,
+        coalesce(it.bad_items, 0) as bad_items
+    from
+        orders as o
+        left join (
+            select
+                order_id,
+                sum(total) as items_total,
+                sum(price * qty) as expected_total,
+                count(*) filter (where total <> price * qty) as bad_items
+            from
+                order_items
+            where
+                order_id >= :id_from
+                and order_id < :id_to
+            group by
+                order_id
+        ) as it on it.order_id = o.id
+    where
+        o.id >= :id_from
+        and o.id < :id_to
+        and (
+            o.total <> coalesce(it.items_total, 0)
+            or coalesce(it.bad_items, 0) > 0
+        )
+    order by
+        o.id
+    """
+
+SQL_REPAIR_ORDER_ITEM_TOTALS = """
+    update order_items set
+        total = price * qty
+    where
+        order_id = any(cast(:order_ids as integer[]))
+        and total <> price * qty
+    """
+
+# items go away in the same statement as their order, and only when the order
+# itself matched (missing ids and stale preconditions delete nothing)
+SQL_DELETE_ORDER = """
+    with deleted_order as (
+        delete from orders
+        where
+            id = :order_id
+            {precondition}
+        returning
+            *
+    ), deleted_items as (
+        delete from order_items
+        where
+            order_id in (select id from deleted_order)
+    )
+    select * from deleted_order
+    """
+
 
 class OrdersRepository(BaseRepository):
     """ "
@@ -68,16 +310,24 @@ class OrdersRepository(BaseRepository):
         query = query.limit(pagination.limit).offset(pagination.skip)
         orders = await self.db.fetch_all(query=query)
         return [
-            OrderInDB(**self.adapt_order_flatten_to_model(order)) for order in orders
+            OrderInDB.from_db(self.adapt_order_flatten_to_model(order)) for order in orders
         ]
 
+    async def get_all_orders_json(self, *, pagination: Pagination) -> bytes:
+        """
+        Same page as `get_all_orders`, rendered as JSON by the database
+        """
+        query = json_page_query(ORDER_JSON_COLUMNS, orders_table)
+        query = query.limit(pagination.limit).offset(pagination.skip)
+        return await self.db.fetch_val(query=json_page(query))
+
     async def get_order_by_id(self, *, order_id: int) -> Optional[OrderInDB]:
         order = await self.db.fetch_one(
             query=select([orders_table]).where(orders_table.c.id == order_id)
         )
 
         if not order is None:
-            return OrderInDB(**self.adapt_order_flatten_to_model(order))
+            return OrderInDB.from_db(self.adapt_order_flatten_to_model(order))
 
     async def create_order(self, *, new_order: OrderCreateUpdate) -> OrderWithItemsInDB:
         customers_repo = CustomersRepository(self.db)
@@ -97,26 +347,12 @@ class OrdersRepository(BaseRepository):
                 values=query_values,
             )
 
-            # TODO: turn the code below into a few SQLs for better performance
-            # right now we're doing a ugly loop against the items
-
-            items = []
-
-            for item in new_order.items:
-                item_db = await self.db.fetch_one(
-                    query=SQL_INSERT_ORDER_ITEMS,
-                    values=dict(
-                        order_id=order_id, product_id=item.product_id, qty=item.qty
-                    ),
-                )
-
-                if item_db is None:
-                    raise HTTPException(
-                        status.HTTP_422_UNPROCESSABLE_ENTITY,
-                        f"There is no product with id: {item.product_id}",
-                    )
-
-                items.append(item_db)
+            items = await self.insert_order_items(
+                order_items=[
+                    dict(order_id=order_id, product_id=item.product_id, qty=item.qty)
+                    for item in new_order.items
+                ]
+            )
 
             await self.update_order_total(order_id)
             order = await self.db.fetch_one(
@@ -126,11 +362,11 @@ class OrdersRepository(BaseRepository):
             if order is None:
                 raise Exception("Something went really wrong")
 
-            return OrderWithItemsInDB(
-                items=items,
-                **self.adapt_order_flatten_to_model(order),
+            return OrderWithItemsInDB.from_db(
+                self.adapt_order_flatten_to_model(order), items=items
             )
 
+    @serialized_by_order
     async def update_order(
         self,
         *,
@@ -189,22 +425,14 @@ class OrdersRepository(BaseRepository):
                 )
 
             if isinstance(order_update, OrderCreateUpdate):
-
-                for item in order_update.items:
-                    item_db = await self.db.fetch_one(
-                        query=SQL_INSERT_ORDER_ITEMS,
-                        values=dict(
+                items = await self.insert_order_items(
+                    order_items=[
+                        dict(
                             order_id=order_id, product_id=item.product_id, qty=item.qty
-                        ),
-                    )
-
-                    if item_db is None:
-                        raise HTTPException(
-                            status.HTTP_422_UNPROCESSABLE_ENTITY,
-                            f"There is no product with id: {item.product_id}",
                         )
-
-                    items.append(item_db)
+                        for item in order_update.items
+                    ]
+                )
 
                 await self.update_order_total(order_id)
 
@@ -216,33 +444,35 @@ class OrdersRepository(BaseRepository):
                 raise Exception("Something went really wrong here")
 
             if isinstance(order_update, OrderCreateUpdate):
-                return OrderWithItemsInDB(
-                    items=items, **self.adapt_order_flatten_to_model(order)
+                return OrderWithItemsInDB.from_db(
+                    self.adapt_order_flatten_to_model(order), items=items
                 )
 
-            return OrderInDB(**self.adapt_order_flatten_to_model(order))
+            return OrderInDB.from_db(self.adapt_order_flatten_to_model(order))
+
+    async def delete_order_by_id(
+        self, *, order_id: int, expected_updated_at: Optional[datetime] = None
+    ) -> Optional[OrderInDB]:
+        query_values = dict(order_id=order_id)
+        precondition = ""
+        if expected_updated_at is not None:
+            query_values["expected_updated_at"] = expected_updated_at
+            precondition = "and updated_at = :expected_updated_at"
 
-    async def delete_order_by_id(self, *, order_id: int) -> Optional[OrderInDB]:
+        # Apply validations for order deletion
         order = await self.db.fetch_one(
-            query=select([orders_table]).where(orders_table.c.id == order_id)
+            query=SQL_DELETE_ORDER.format(precondition=precondition),
+            values=query_values,
         )
 
         if order is None:
-            return
-
-        # Apply validations for order deletion
-        async with self.db.transaction():
-
-            await self.db.execute(
-                query=order_items_table.delete().where(
-                    order_items_table.c.order_id == order_id
+            if expected_updated_at is not None:
+                await self.raise_if_modified(
+                    table=orders_table, whereclause=orders_table.c.id == order_id
                 )
-            )
-            await self.db.fetch_one(
-                query=orders_table.delete().where(orders_table.c.id == order_id)
-            )
+            return
 
-            return OrderInDB(**self.adapt_order_flatten_to_model(order))
+        return OrderInDB.from_db(self.adapt_order_flatten_to_model(order))
 
     def adapt_order_model_to_flatten(
         self, order: Union[OrderCreateUpdate, OrderUpdate], exclude_unset: bool = False
@@ -250,52 +480,20 @@ class OrdersRepository(BaseRepository):
         """
         Convert nested dict structure to a flatten dict (only billing and shipping addresses)
         """
-        flatten = dict(
-            **order.dict(
-                exclude={"billing_address", "shipping_address", "items"},
-                exclude_unset=exclude_unset,
-            ),
-            **dict_include_prefix(
-                order.dict(
-                    include={"billing_address"}, exclude_unset=exclude_unset
-                ).get("billing_address", {}),
-                "billing_",
-            ),
-            **dict_include_prefix(
-                order.dict(
-                    include={"shipping_address"}, exclude_unset=exclude_unset
-                ).get("shipping_address", {}),
-                "shipping_",
-            ),
+        return ORDER_ROW_ADAPTER.to_row(
+            order, exclude={"items"}, exclude_unset=exclude_unset
         )
-        return flatten
 
     def adapt_order_flatten_to_model(self, flatten: Mapping):
-        model = {
-            k: v
-            for k, v in flatten.items()
-            if k
-            in (
-                "id",
-                "customer_id",
-                "customer_name",
-                "total",
-                "created_at",
-                "updated_at",
-            )
-        }
-
-        aux = dict_remove_prefix(flatten, "billing_")
-        if aux:
-            model["billing_address"] = aux
-
-        aux = dict_remove_prefix(flatten, "shipping_")
-        if aux:
-            model["shipping_address"] = aux
-
-        return model
+        return ORDER_ROW_ADAPTER.to_model(flatten)
 
     async def update_order_total(self, order_id):
+        # inside a unit of work the total is recomputed once, at commit time
+        unit_of_work = self.unit_of_work
+        if unit_of_work is not None:
+            unit_of_work.touch_order(order_id)
+            return
+
         await self.db.execute(
             query="""
         update orders set
@@ -310,6 +508,235 @@ class OrdersRepository(BaseRepository):
             values=dict(order_id=order_id),
         )
 
+    async def update_order_totals(self, *, order_ids: Iterable[int]) -> None:
+        """
+        Recompute the total of several orders with a single statement
+        """
+        # sorted ids: concurrent callers lock the order rows in the same order
+        await self.db.execute(
+            query=SQL_UPDATE_ORDER_TOTALS,
+            values=dict(order_ids=sorted(set(order_ids))),
+        )
+
+    async def lock_orders(
+        self, *, order_ids: List[int], with_items: bool = False
+    ) -> List[int]:
+        """
+        Lock the rows of the orders for the rest of the transaction, after their
+        advisory locks with ORDER_LOCK_MODE=advisory and the rows of their items
+        (`with_items`, before updating items): the order item mutations take
+        them in the same order. Returns the ids of the orders that still exist.
+
+        A statement computing totals from order items must come after this one:
+        its snapshot then holds every item mutation of these orders committed
+        meanwhile, and no other can commit before this transaction does.
+        """
+        order_ids = sorted(order_ids)
+        if config.ORDER_LOCK_MODE == "advisory":
+            await self.db.fetch_all(
+                query=SQL_ADVISORY_LOCK_ORDERS,
+                values=dict(lock_class=ADVISORY_LOCK_ORDERS, order_ids=order_ids),
+            )
+        if with_items:
+            await self.db.fetch_all(
+                query=SQL_LOCK_ORDER_ITEMS, values=dict(order_ids=order_ids)
+            )
+
+        rows = await self.db.fetch_all(
+            query=SQL_LOCK_ORDERS, values=dict(order_ids=order_ids)
+        )
+        return [row["id"] for row in rows]
+
+    async def insert_order_items(
+        self, *, order_items: List[Mapping]
+    ) -> List[Mapping]:
+        """
+        Insert many items (`order_id`, `product_id` and `qty` keys) in one round trip.
+
+        Order totals are NOT updated here.
+        """
+        if not order_items:
+            return []
+
+        items_db = await self.db.fetch_all(
+            query=SQL_INSERT_ORDER_ITEMS_BATCH,
+            values=dict(
+                order_ids=[item["order_id"] for item in order_items],
+                product_ids=[item["product_id"] for item in order_items],
+                qtys=[item["qty"] for item in order_items],
+            ),
+        )
+
+        self._raise_if_products_missing(order_items, items_db)
+        return items_db
+
+    @staticmethod
+    def _raise_if_products_missing(
+        order_items: List[Mapping], items_db: List[Mapping]
+    ) -> None:
+        if len(items_db) != len(order_items):
+            missing = {item["product_id"] for item in order_items} - {
+                item_db["product_id"] for item_db in items_db
+            }
+            raise HTTPException(
+                status.HTTP_422_UNPROCESSABLE_ENTITY,
+                f"There is no product with id: {', '.join(map(str, sorted(missing)))}",
+            )
+
+    async def create_order_totals_recompute(self) -> OrderTotalsRecomputeJob:
+        job = await self.db.fetch_one(query=SQL_INSERT_ORDER_TOTALS_RECOMPUTE)
+        return OrderTotalsRecomputeJob(**job)
+
+    async def get_order_totals_recompute(
+        self, *, job_id: int
+    ) -> Optional[OrderTotalsRecomputeJob]:
+        job = await self.db.fetch_one(
+            query="select * from order_totals_recomputes where id = :job_id",
+            values=dict(job_id=job_id),
+        )
+        if job is not None:
+            return OrderTotalsRecomputeJob(**job)
+
+    async def finish_order_totals_recompute(
+        self, *, job_id: int, error: Optional[str] = None
+    ) -> OrderTotalsRecomputeJob:
+        job = await self.db.fetch_one(
+            query=SQL_FINISH_ORDER_TOTALS_RECOMPUTE,
+            values=dict(
+                job_id=job_id, status="done" if error is None else "failed", error=error
+            ),
+        )
+        return OrderTotalsRecomputeJob(**job)
+
+    async def recompute_order_totals(
+        self,
+        *,
+        job_id: int,
+        recompute: OrderTotalsRecompute,
+        chunk_size: int,
+        progress: Optional[Callable[[int, int, int], None]] = None,
+    ) -> OrderTotalsRecomputeJob:
+        """
+        Recompute the totals of every order matching the filters, walking the
+        matching order ids in chunks of `chunk_size`, one short transaction per
+        chunk resuming after the last id of the previous one. The progress of
+        job `job_id` is saved with every chunk, `progress` is called with the
+        last id, the chunks and the orders updated so far.
+        """
+        filters, values = self._recompute_filters(recompute)
+
+        bounds = await self.db.fetch_one(
+            query=f"select min(o.id) as first_id, max(o.id) as last_id "
+            f"from orders as o where true {filters}",
+            values=values,
+        )
+        if bounds is None or bounds["first_id"] is None:
+            return await self.finish_order_totals_recompute(job_id=job_id)
+
+        # orders created meanwhile are left out
+        first_id, last_id = bounds["first_id"], bounds["last_id"]
+        await self.db.execute(
+            query=SQL_START_ORDER_TOTALS_RECOMPUTE,
+            values=dict(job_id=job_id, first_id=first_id, last_id=last_id),
+        )
+        next_ids_query = SQL_NEXT_ORDER_IDS.format(filters=filters)
+        recompute_query = SQL_RECOMPUTE_LOCKED_ORDER_TOTALS.format(
+            only_mismatched="and orders.total <> totals.total"
+            if recompute.only_mismatched
+            else ""
+        )
+
+        chunks = updated_orders = 0
+        after_id = first_id - 1
+        while after_id < last_id:
+            async with self.db.transaction():
+                rows = await self.db.fetch_all(
+                    query=next_ids_query,
+                    values=dict(
+                        values,
+                        after_id=after_id,
+                        last_id=last_id,
+                        chunk_size=chunk_size,
+                    ),
+                )
+                if not rows:
+                    # the remaining orders were deleted meanwhile
+                    break
+
+                order_ids = await self.lock_orders(
+                    order_ids=[row["id"] for row in rows]
+                )
+                chunk_updated_orders = await self.db.fetch_val(
+                    query=recompute_query, values=dict(order_ids=order_ids)
+                )
+                after_id = rows[-1]["id"]
+                await self.db.execute(
+                    query=SQL_RECORD_ORDER_TOTALS_CHUNK,
+                    values=dict(
+                        job_id=job_id,
+                        last_processed_id=after_id,
+                        updated_orders=chunk_updated_orders,
+                    ),
+                )
+
+            chunks += 1
+            updated_orders += chunk_updated_orders
+            if progress is not None:
+                progress(after_id, chunks, updated_orders)
+
+        return await self.finish_order_totals_recompute(job_id=job_id)
+
+    async def find_order_total_mismatches(
+        self, *, id_from: int, id_to: int
+    ) -> List[Mapping]:
+        """
+        Orders with ids in [id_from, id_to) whose totals are inconsistent
+        """
+        return await self.db.fetch_all(
+            query=SQL_FIND_ORDER_TOTAL_MISMATCHES,
+            values=dict(id_from=id_from, id_to=id_to),
+        )
+
+    async def repair_order_totals(self, *, order_ids: List[int]) -> int:
+        """
+        Fix item totals, then order totals, of the orders (locked first, so
+        that concurrent item mutations are never overwritten). Returns how many
+        orders were updated.
+        """
+        async with self.db.transaction():
+            order_ids = await self.lock_orders(order_ids=order_ids, with_items=True)
+            await self.db.execute(
+                query=SQL_REPAIR_ORDER_ITEM_TOTALS, values=dict(order_ids=order_ids)
+            )
+            return await self.db.fetch_val(
+                query=SQL_RECOMPUTE_LOCKED_ORDER_TOTALS.format(
+                    only_mismatched="and orders.total <> totals.total"
+                ),
+                values=dict(order_ids=order_ids),
+            )
+
+    def _recompute_filters(self, recompute: OrderTotalsRecompute) -> Tuple[str, dict]:
+        filters = []
+        values = {}
+
+        if recompute.id_from is not None:
+            filters.append("and o.id >= :id_from")
+            values["id_from"] = recompute.id_from
+        if recompute.id_to is not None:
+            filters.append("and o.id <= :id_to")
+            values["id_to"] = recompute.id_to
+        if recompute.created_from is not None:
+            filters.append("and o.created_at >= :created_from")
+            values["created_from"] = recompute.created_from
+        if recompute.created_to is not None:
+            filters.append("and o.created_at < :created_to")
+            values["created_to"] = recompute.created_to
+        if recompute.customer_id is not None:
+            filters.append("and o.customer_id = :customer_id")
+            values["customer_id"] = recompute.customer_id
+
+        return " ".join(filters), values
+
     # ===================================================================
     # OrderItem routines
     # ===================================================================
@@ -327,7 +754,7 @@ class OrdersRepository(BaseRepository):
             .offset(pagination.skip)
         )
         order_items = await self.db.fetch_all(query=query)
-        return [OrderItemInDB(**order_item) for order_item in order_items]
+        return [OrderItemInDB.from_db(order_item) for order_item in order_items]
 
     async def get_order_item_by_id(
         self, *, order_id: int, order_item_id: int
@@ -342,8 +769,9 @@ class OrdersRepository(BaseRepository):
         )
 
         if not order_item is None:
-            return OrderItemInDB(**order_item)
+            return OrderItemInDB.from_db(order_item)
 
+    @serialized_by_order
     async def create_order_item(
         self, *, order_id: int, new_order_item: OrderItemCreateUpdate
     ) -> OrderItemInDB:
@@ -358,8 +786,9 @@ class OrdersRepository(BaseRepository):
 
             await self.update_order_total(order_id)
 
-            return OrderItemInDB(**item_db)
+            return OrderItemInDB.from_db(item_db)
 
+    @serialized_by_order
     async def update_order_item(
         self,
         *,
@@ -367,68 +796,71 @@ class OrdersRepository(BaseRepository):
         order_item_id: int,
         order_item_update: Union[OrderItemCreateUpdate, OrderItemUpdate],
         patching: bool,
+        expected_updated_at: Optional[datetime] = None,
     ) -> Optional[OrderItemInDB]:
+        query_values = order_item_update.dict(exclude_unset=patching)
 
-        # order = await self.get_order_by_id(order_id=order_id)
-
-        order_item = await self.get_order_item_by_id(
-            order_id=order_id, order_item_id=order_item_id
+        whereclause = and_(
+            order_items_table.c.order_id == order_id,
+            order_items_table.c.id == order_item_id,
         )
-
-        if order_item is None:
-            return
-
-        query_values = order_item_update.dict(exclude_unset=patching)
+        query = order_items_table.update().where(whereclause)
+        if expected_updated_at is not None:
+            query = query.where(order_items_table.c.updated_at == expected_updated_at)
 
         async with self.db.transaction():
             item_db = await self.db.fetch_one(
-                query=order_items_table.update()
-                .where(
-                    and_(
-                        order_items_table.c.order_id == order_id,
-                        order_items_table.c.id == order_item_id,
-                    )
-                )
-                .returning(*order_items_table.columns),
+                query=query.returning(*order_items_table.columns),
                 values=query_values,
             )
 
+            if item_db is None:
+                if expected_updated_at is not None:
+                    await self.raise_if_modified(
+                        table=order_items_table, whereclause=whereclause
+                    )
+                return
+
             await self.update_order_total(order_id)
 
-            return OrderItemInDB(**item_db)
+            return OrderItemInDB.from_db(item_db)
 
     # ---
 
+    @serialized_by_order
     async def delete_order_item_by_id(
         self,
         *,
         order_id: int,
         order_item_id: int,
+        expected_updated_at: Optional[datetime] = None,
     ) -> Optional[OrderItemInDB]:
 
-        # order = await self.get_order_by_id(order_id=order_id)
-
-        order_item = await self.get_order_item_by_id(
-            order_id=order_id, order_item_id=order_item_id
+        whereclause = and_(
+            order_items_table.c.order_id == order_id,
+            order_items_table.c.id == order_item_id,
         )
-
-        if order_item is None:
-            return
+        query = order_items_table.delete().where(whereclause)
+        if expected_updated_at is not None:
+            query = query.where(order_items_table.c.updated_at == expected_updated_at)
 
         async with self.db.transaction():
             item_db = await self.db.fetch_one(
-                query=order_items_table.delete().where(
-                    and_(
-                        order_items_table.c.order_id == order_id,
-                        order_items_table.c.id == order_item_id,
-                    )
-                )
+                query=query.returning(*order_items_table.columns)
             )
 
+            if item_db is None:
+                if expected_updated_at is not None:
+                    await self.raise_if_modified(
+                        table=order_items_table, whereclause=whereclause
+                    )
+                return
+
             await self.update_order_total(order_id)
 
-            return order_item
+            return OrderItemInDB.from_db(item_db)
 
+    @serialized_by_order
     async def delete_order_items(
         self,
         *,
@@ -456,6 +888,4 @@ class OrdersRepository(BaseRepository):
             if order is None:
                 raise Exception("Something went really wrong")
 
-            return OrderInDB(
-                **self.adapt_order_flatten_to_model(order),
-            )
+            return OrderInDB.from_db(self.adapt_order_flatten_to_model(order))
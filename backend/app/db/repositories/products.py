@@ -1,11 +1,16 @@
+from datetime import datetime
 from typing import List, Optional, Union
 
 from sqlalchemy import select
 
+from app.db.rendering import json_columns, json_page, json_page_query
 from app.db.repositories.base import BaseRepository
 from app.db.tables.products import products_table
 from app.models.pagination import Pagination
-from app.models.product import ProductCreateUpdate, ProductInDB, ProductUpdate
+from app.models.product import Product, ProductCreateUpdate, ProductInDB, ProductUpdate
+
+# rendered as the response model of the list route
+PRODUCT_JSON_COLUMNS = json_columns(Product, products_table)
 
 
 class ProductsRepository(BaseRepository):
@@ -13,16 +18,34 @@ class ProductsRepository(BaseRepository):
     All database actions associated with the Product resource
     """
 
-    async def get_all_products(
-        self, *, search: str = None, pagination: Pagination
-    ) -> Optional[List[ProductInDB]]:
-        query = select([products_table])
+    @staticmethod
+    def _filter_products(query, *, search: Optional[str], pagination: Pagination):
         if search:
             query = query.where(products_table.c.name.ilike(f"%{search}%"))
 
-        query = query.limit(pagination.limit).offset(pagination.skip)
+        return query.limit(pagination.limit).offset(pagination.skip)
+
+    async def get_all_products(
+        self, *, search: str = None, pagination: Pagination
+    ) -> Optional[List[ProductInDB]]:
+        query = self._filter_products(
+            select([products_table]), search=search, pagination=pagination
+        )
         products = await self.db.fetch_all(query=query)
-        return [ProductInDB(**product) for product in products]
+        return [ProductInDB.from_db(product) for product in products]
+
+    async def get_all_products_json(
+        self, *, search: str = None, pagination: Pagination
+    ) -> bytes:
+        """
+        Same page as `get_all_products`, rendered as JSON by the database
+        """
+        query = self._filter_products(
+            json_page_query(PRODUCT_JSON_COLUMNS, products_table),
+            search=search,
+            pagination=pagination,
+        )
+        return await self.db.fetch_val(query=json_page(query))
 
     async def get_product_by_id(self, *, product_id: int) -> Optional[ProductInDB]:
         product = await self.db.fetch_one(
@@ -30,7 +53,7 @@ class ProductsRepository(BaseRepository):
         )
 
         if not product is None:
-            return ProductInDB(**product)
+            return ProductInDB.from_db(product)
 
     async def create_product(self, *, new_product: ProductCreateUpdate) -> ProductInDB:
         query_values = new_product.dict()
@@ -41,7 +64,7 @@ class ProductsRepository(BaseRepository):
                 values=query_values,
             )
 
-            return ProductInDB(**product)
+            return ProductInDB.from_db(product)
 
     async def update_product(
         self,
@@ -49,36 +72,48 @@ class ProductsRepository(BaseRepository):
         product_id: int,
         product_update: Union[ProductCreateUpdate, ProductUpdate],
         patching: bool,
+        expected_updated_at: Optional[datetime] = None,
     ) -> Optional[ProductInDB]:
-        product = await self.get_product_by_id(product_id=product_id)
-
-        if product is None:
-            return
-
         query_values = product_update.dict(exclude_unset=patching)
 
-        async with self.db.transaction():
-            product = await self.db.fetch_one(
-                query=products_table.update()
-                .where(products_table.c.id == product_id)
-                .returning(*products_table.columns),
-                values=query_values,
-            )
-
-            return ProductInDB(**product)
+        whereclause = products_table.c.id == product_id
+        query = products_table.update().where(whereclause)
+        if expected_updated_at is not None:
+            query = query.where(products_table.c.updated_at == expected_updated_at)
 
-    async def delete_product_by_id(self, *, product_id: int) -> Optional[ProductInDB]:
         product = await self.db.fetch_one(
-            query=select([products_table]).where(products_table.c.id == product_id)
+            query=query.returning(*products_table.columns),
+            values=query_values,
         )
 
         if product is None:
+            if expected_updated_at is not None:
+                await self.raise_if_modified(
+                    table=products_table, whereclause=whereclause
+                )
             return
 
+        return ProductInDB.from_db(product)
+
+    async def delete_product_by_id(
+        self, *, product_id: int, expected_updated_at: Optional[datetime] = None
+    ) -> Optional[ProductInDB]:
+        whereclause = products_table.c.id == product_id
+        query = products_table.delete().where(whereclause)
+        if expected_updated_at is not None:
+            query = query.where(products_table.c.updated_at == expected_updated_at)
+
         # Apply validations for product deletion
 
-        await self.db.execute(
-            query=products_table.delete().where(products_table.c.id == product_id)
+        product = await self.db.fetch_one(
+            query=query.returning(*products_table.columns)
         )
 
-        return ProductInDB(**product)
+        if product is None:
+            if expected_updated_at is not None:
+                await self.raise_if_modified(
+                    table=products_table, whereclause=whereclause
+                )
+            return
+
+        return ProductInDB.from_db(product)
@@ -0,0 +1,22 @@
+from sqlalchemy import TIMESTAMP, Column, ForeignKey, Integer, String, Table, func
+
+from .base import metadata
+
+customer_name_propagations_table = Table(
+    "customer_name_propagations",
+    metadata,
+    Column(
+        "customer_id",
+        Integer,
+        ForeignKey("customers.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column("customer_name", String, nullable=False),
+    Column("last_order_id", Integer, nullable=False, server_default="0"),
+    Column(
+        "enqueued_at",
+        TIMESTAMP(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    ),
+)
@@ -0,0 +1,18 @@
+from sqlalchemy import TIMESTAMP, Column, Integer, String, Table
+
+from .base import metadata, default_timestamps_auditing
+
+order_totals_recomputes_table = Table(
+    "order_totals_recomputes",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("status", String, nullable=False, server_default="running"),
+    Column("first_id", Integer),
+    Column("last_id", Integer),
+    Column("last_processed_id", Integer),
+    Column("chunks", Integer, nullable=False, server_default="0"),
+    Column("updated_orders", Integer, nullable=False, server_default="0"),
+    Column("error", String),
+    *default_timestamps_auditing(),
+    Column("finished_at", TIMESTAMP(timezone=True)),
+)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Table, String, Numeric, ForeignKey
+from sqlalchemy import Column, ForeignKey, Index, Integer, Numeric, String, Table
 
 
 from .base import metadata, default_timestamps_auditing
@@ -24,4 +24,5 @@ orders_table = Table(
     #
     Column("total", Numeric(15, 2), nullable=False, default=0, server_default="0"),
     *default_timestamps_auditing(),
+    Index("ix_orders_customer_id_id", "customer_id", "id"),
 )
@@ -6,7 +6,7 @@ order_items_table = Table(
     "order_items",
     metadata,
     Column("id", Integer, primary_key=True),
-    Column("order_id", Integer, ForeignKey("orders.id"), nullable=False),
+    Column("order_id", Integer, ForeignKey("orders.id"), nullable=False, index=True),
     Column("product_id", Integer, ForeignKey("product.id"), nullable=False),
     Column("product_name", String, nullable=False),
     Column("price", Numeric(10, 2), nullable=False),
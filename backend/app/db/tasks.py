@@ -1,29 +1,85 @@
+import asyncio
 import logging
 import os
 
 from databases import Database
 from fastapi import FastAPI
 
+from app.core import config
 from app.core.config import DATABASE_URL
+from app.db.instrumentation import InstrumentedDatabase
+from app.db.pool import (
+    get_pool_options,
+    instrument_pool,
+    prewarm_pool,
+    recycle_connections,
+)
 
 logger = logging.getLogger(__name__)
 
+DB_BACKENDS = ("databases", "asyncpg")
+
+
+def get_database_url() -> str:
+    database_url = DATABASE_URL
+    if config.DB_PGBOUNCER:
+        # migrations keep using DATABASE_URL: DDL and CREATE DATABASE go straight
+        # to postgres, only the application goes through PgBouncer
+        database_url = database_url.replace(
+            hostname=config.PGBOUNCER_HOST, port=config.PGBOUNCER_PORT
+        )
+
+    return f"""{database_url}{os.environ.get("DB_SUFFIX", "")}"""
+
 
 async def connect_to_db(app: FastAPI) -> None:
+    if config.DB_BACKEND not in DB_BACKENDS:
+        raise RuntimeError(f"Invalid DB_BACKEND: {config.DB_BACKEND}")
 
-    db_url = f"""{DATABASE_URL}{os.environ.get("DB_SUFFIX", "")}"""
-    database = Database(db_url, min_size=2, max_size=10)
+    db_url = get_database_url()
+    pool_options = get_pool_options()
 
-    try:
-        await database.connect()
-        app.state._db = database
-    except Exception as e:
-        logger.warn("--- DB CONNECTION ERROR ---")
-        logger.warn(e)
-        logger.warn("--- DB CONNECTION ERROR ---")
+    # the database may still be starting (compose, k8s): retry with backoff, but
+    # never start serving without a pool
+    attempt = 0
+    while True:
+        database = Database(db_url, **pool_options)
+        try:
+            await database.connect()
+            pool = instrument_pool(database)
+            await prewarm_pool(database, pool_options["min_size"])
+            break
+        except Exception as e:
+            if database.is_connected:
+                await database.disconnect()
+
+            attempt += 1
+            if attempt > config.DB_CONNECT_RETRIES:
+                logger.error("--- DB CONNECTION ERROR ---")
+                raise
+
+            delay = config.DB_CONNECT_RETRY_DELAY * 2 ** (attempt - 1)
+            logger.warning(
+                "--- DB CONNECTION ERROR (attempt %s, retrying in %.1fs) --- %s",
+                attempt,
+                delay,
+                e,
+            )
+            await asyncio.sleep(delay)
+
+    app.state._db = InstrumentedDatabase(database)
+    app.state._db_backend = config.DB_BACKEND
+    if config.DB_MAX_LIFETIME:
+        app.state._db_recycler = asyncio.ensure_future(
+            recycle_connections(pool, config.DB_MAX_LIFETIME)
+        )
 
 
 async def close_db_connection(app: FastAPI) -> None:
+    recycler = getattr(app.state, "_db_recycler", None)
+    if recycler is not None:
+        recycler.cancel()
+
     try:
         await app.state._db.disconnect()
     except Exception as e:
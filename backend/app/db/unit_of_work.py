@@ -0,0 +1,96 @@
+from typing import Dict, List, Mapping, Set, Type
+
+from databases import Database
+from sqlalchemy import Table
+
+from app.db.repositories.base import BaseRepository, current_unit_of_work
+from app.db.repositories.orders import OrdersRepository
+
+# rows per multi-row INSERT when flushing queued inserts
+FLUSH_BATCH_SIZE = 1000
+
+
+class UnitOfWork:
+    """
+    Run many repository calls inside a single transaction.
+
+        async with UnitOfWork(db) as uow:
+            customer = await uow.repository(CustomersRepository).create_customer(...)
+            order = await uow.repository(OrdersRepository).create_order(...)
+            uow.queue_order_item(order_id=order.id, product_id=1, qty=3)
+
+    Repositories need no changes: their own `db.transaction()` blocks become
+    savepoints of the outer transaction. Order totals are recomputed once per
+    touched order when the block exits, so totals read back *inside* the block
+    may be stale. Queued inserts are flushed as multi-row statements at the same
+    point (or earlier through `flush()`).
+    """
+
+    def __init__(self, db: Database) -> None:
+        self.db = db
+        self._transaction = None
+        self._token = None
+        self._touched_order_ids: Set[int] = set()
+        self._queued_inserts: Dict[Table, List[Mapping]] = {}
+        self._queued_order_items: List[Mapping] = []
+
+    def repository(self, repository_type: Type[BaseRepository]) -> BaseRepository:
+        return repository_type(self.db)
+
+    def touch_order(self, order_id: int) -> None:
+        self._touched_order_ids.add(order_id)
+
+    def queue_insert(self, table: Table, values: Mapping) -> None:
+        self._queued_inserts.setdefault(table, []).append(values)
+
+    def queue_order_item(self, *, order_id: int, product_id: int, qty: int) -> None:
+        self._queued_order_items.append(
+            dict(order_id=order_id, product_id=product_id, qty=qty)
+        )
+
+    async def flush(self) -> None:
+        queued_inserts, self._queued_inserts = self._queued_inserts, {}
+        for table, rows in queued_inserts.items():
+            for start in range(0, len(rows), FLUSH_BATCH_SIZE):
+                await self.db.execute(
+                    query=table.insert().values(rows[start : start + FLUSH_BATCH_SIZE])
+                )
+
+        orders_repo = OrdersRepository(self.db)
+
+        queued_order_items, self._queued_order_items = self._queued_order_items, []
+        for start in range(0, len(queued_order_items), FLUSH_BATCH_SIZE):
+            batch = queued_order_items[start : start + FLUSH_BATCH_SIZE]
+            await orders_repo.insert_order_items(order_items=batch)
+            self._touched_order_ids.update(item["order_id"] for item in batch)
+
+        touched_order_ids, self._touched_order_ids = self._touched_order_ids, set()
+        if touched_order_ids:
+            await orders_repo.update_order_totals(order_ids=touched_order_ids)
+
+    async def __aenter__(self) -> "UnitOfWork":
+        if current_unit_of_work.get() is not None:
+            raise RuntimeError("A unit of work is already in progress")
+
+        self._transaction = self.db.transaction()
+        await self._transaction.start()
+        self._token = current_unit_of_work.set(self)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            if exc_type is None:
+                await self.flush()
+        except BaseException:
+            await self._transaction.rollback()
+            raise
+        else:
+            if exc_type is None:
+                await self._transaction.commit()
+            else:
+                await self._transaction.rollback()
+        finally:
+            current_unit_of_work.reset(self._token)
+            self._queued_inserts.clear()
+            self._queued_order_items.clear()
+            self._touched_order_ids.clear()
@@ -0,0 +1,37 @@
+from typing import Any, Dict, List, Optional
+
+from pydantic import validator
+
+from app.models.core import BaseModel
+
+BATCH_METHODS = ("GET", "POST", "PUT", "PATCH", "DELETE")
+
+
+class BatchSubRequest(BaseModel):
+    method: str
+    path: str  # e.g. "/api/products/1" or "/api/products/?search=chair"
+    body: Optional[Any]
+    headers: Optional[Dict[str, str]]
+
+    @validator("method")
+    def method_must_be_supported(cls, v):
+        v = v.upper()
+        if v not in BATCH_METHODS:
+            raise ValueError(f"method must be one of {', '.join(BATCH_METHODS)}")
+        return v
+
+    @validator("path")
+    def path_must_be_absolute(cls, v):
+        if not v.startswith("/"):
+            raise ValueError("path must start with /")
+        return v
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchSubRequest]
+    transaction: bool = False
+
+
+class BatchSubResponse(BaseModel):
+    status: int
+    body: Any
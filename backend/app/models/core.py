@@ -1,6 +1,17 @@
+from copy import deepcopy
 from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Mapping, Optional, Type, TypeVar
 
 from pydantic import BaseModel, PositiveInt
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON
+from pydantic.utils import lenient_issubclass
+
+from app.core import config
+
+Model = TypeVar("Model", bound=BaseModel)
+
+_MISSING = object()
 
 
 class IDModelMixin(BaseModel):
@@ -10,3 +21,66 @@ class IDModelMixin(BaseModel):
 class DateTimeModelMixin(BaseModel):
     created_at: datetime
     updated_at: datetime
+
+
+class DBModelMixin(BaseModel):
+    @classmethod
+    def from_db(cls: Type[Model], row: Optional[Mapping] = None, **values) -> Model:
+        """
+        The model of a row of our own schema (`values` add to or override its
+        columns), built without validation: columns already have the declared
+        types, except numerics converted to float, and nested models (dicts
+        or rows) are built the same way. With `VALIDATE_DB_ROWS`, the same as
+        `cls(**row, **values)`.
+        """
+        if config.VALIDATE_DB_ROWS:
+            return cls(**{**(row or {}), **values})
+        return _constructor(cls)(row or {}, values)
+
+
+def _nested(model: Type[BaseModel]) -> Callable:
+    construct = _constructor(model)
+
+    def nested(value: Any) -> Any:
+        return construct(value, {}) if isinstance(value, Mapping) else value
+
+    return nested
+
+
+@lru_cache(maxsize=None)
+def _constructor(model: Type[Model]) -> Callable[[Mapping, Mapping], Model]:
+    """
+    Compiled once per model: (name, conversion, default) of each field
+    """
+    fields = []
+    for name, field in model.__fields__.items():
+        convert = None
+        if lenient_issubclass(field.type_, BaseModel):
+            nested = _nested(field.type_)
+            if field.shape == SHAPE_SINGLETON:
+                convert = nested
+            elif field.shape == SHAPE_LIST:
+                convert = lambda items, nested=nested: [nested(item) for item in items]
+        elif field.type_ is float:
+            convert = float
+        fields.append((name, convert, None if field.required else field.default))
+
+    def construct(row: Mapping, values: Mapping) -> Model:
+        data, fields_set = {}, set()
+        for name, convert, default in fields:
+            value = values.get(name, _MISSING)
+            if value is _MISSING:
+                value = row.get(name, _MISSING)
+                if value is _MISSING:
+                    data[name] = deepcopy(default)
+                    continue
+
+            fields_set.add(name)
+            data[name] = value if convert is None or value is None else convert(value)
+
+        instance = model.__new__(model)
+        object.__setattr__(instance, "__dict__", data)
+        object.__setattr__(instance, "__fields_set__", fields_set)
+        return instance
+
+    return construct
@@ -1,6 +1,7 @@
+from datetime import datetime
 from typing import Optional
 
-from app.models.core import BaseModel, DateTimeModelMixin, IDModelMixin
+from app.models.core import BaseModel, DateTimeModelMixin, DBModelMixin, IDModelMixin
 from pydantic import EmailStr
 
 
@@ -34,7 +35,7 @@ class Customer(IDModelMixin, DateTimeModelMixin, CustomerBase):
     pass
 
 
-class CustomerInDB(IDModelMixin, DateTimeModelMixin, CustomerBase):
+class CustomerInDB(DBModelMixin, IDModelMixin, DateTimeModelMixin, CustomerBase):
     name: str
     email: EmailStr
     phone: str
@@ -43,3 +44,10 @@ class CustomerInDB(IDModelMixin, DateTimeModelMixin, CustomerBase):
     state: str
     zip: str
     country: str
+
+
+class CustomerNamePropagationLag(BaseModel):
+    pending_jobs: int
+    pending_orders: int
+    oldest_enqueued_at: Optional[datetime]
+    lag: float
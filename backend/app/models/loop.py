@@ -0,0 +1,12 @@
+from datetime import datetime
+from typing import List, Optional
+
+from app.models.core import BaseModel
+
+
+class LoopBlock(BaseModel):
+    task: Optional[str]
+    # innermost frame first
+    stack: List[str]
+    blocked_for: float
+    captured_at: datetime
@@ -1,8 +1,11 @@
+from datetime import datetime
 from typing import List, Optional
 
 from click.core import Option
 
-from app.models.core import BaseModel, DateTimeModelMixin, IDModelMixin
+from pydantic import PositiveInt
+
+from app.models.core import BaseModel, DateTimeModelMixin, DBModelMixin, IDModelMixin
 from .address import AddressBase, AddressCreateUpdate
 from .order_item import OrderItem, OrderItemCreateUpdate, OrderItemInDB
 
@@ -35,7 +38,7 @@ class OrderWithItems(Order):
     items: List[OrderItem]
 
 
-class OrderInDB(IDModelMixin, DateTimeModelMixin, OrderBase):
+class OrderInDB(DBModelMixin, IDModelMixin, DateTimeModelMixin, OrderBase):
     customer_id: int
     billing_address: AddressBase
     shipping_address: AddressBase
@@ -44,3 +47,28 @@ class OrderInDB(IDModelMixin, DateTimeModelMixin, OrderBase):
 
 class OrderWithItemsInDB(OrderInDB):
     items: List[OrderItemInDB]
+
+
+class OrderTotalsRecompute(BaseModel):
+    id_from: Optional[int]
+    id_to: Optional[int]
+    created_from: Optional[datetime]
+    created_to: Optional[datetime]
+    customer_id: Optional[int]
+    only_mismatched: bool = True
+    chunk_size: Optional[PositiveInt]
+
+
+class OrderTotalsRecomputeJob(BaseModel):
+    id: int
+    # "running", "done" or "failed"
+    status: str
+    first_id: Optional[int]
+    last_id: Optional[int]
+    last_processed_id: Optional[int]
+    chunks: int
+    updated_orders: int
+    error: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime]
@@ -2,7 +2,7 @@ from typing import List, Optional
 
 from pydantic.types import PositiveInt
 
-from app.models.core import BaseModel, DateTimeModelMixin, IDModelMixin
+from app.models.core import BaseModel, DateTimeModelMixin, DBModelMixin, IDModelMixin
 
 
 class OrderItemBase(BaseModel):
@@ -26,10 +26,10 @@ class OrderItem(IDModelMixin, DateTimeModelMixin, OrderItemBase):
     total: Optional[float]
 
 
-class OrderItemInDB(IDModelMixin, DateTimeModelMixin, OrderItemBase):
+class OrderItemInDB(DBModelMixin, IDModelMixin, DateTimeModelMixin, OrderItemBase):
     order_id: int
-    product_id: int
+    product_id: PositiveInt
     product_name: str
     price: float
-    qty: int
+    qty: PositiveInt
     total: float
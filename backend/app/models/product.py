@@ -3,7 +3,7 @@ from typing import Optional
 from pydantic import validator
 from pydantic.errors import NumberNotGtError
 
-from app.models.core import BaseModel, DateTimeModelMixin, IDModelMixin
+from app.models.core import BaseModel, DateTimeModelMixin, DBModelMixin, IDModelMixin
 
 
 class ProductBase(BaseModel):
@@ -33,7 +33,7 @@ class Product(IDModelMixin, DateTimeModelMixin, ProductBase):
     pass
 
 
-class ProductInDB(IDModelMixin, DateTimeModelMixin, ProductBase):
+class ProductInDB(DBModelMixin, IDModelMixin, DateTimeModelMixin, ProductBase):
     name: str
     available: bool
     price: float  # = price_validation
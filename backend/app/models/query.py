@@ -0,0 +1,13 @@
+from datetime import datetime
+from typing import Dict, Optional
+
+from app.models.core import BaseModel
+
+
+class QueryPlan(BaseModel):
+    method: str
+    sql: str
+    parameters: Dict[str, str]
+    duration: float
+    captured_at: datetime
+    plan: Optional[str]
@@ -0,0 +1,110 @@
+"""
+Order row adapters microbenchmark: the prefix-scanning adapters the orders
+repository used against the ones compiled from `orders_table`
+(`app.db.adapters`).
+
+    python -m benchmarks.order_adapters [--orders 1000] [--repeat 20]
+"""
+import argparse
+from datetime import datetime, timezone
+from decimal import Decimal
+from timeit import repeat
+
+from app.db.repositories.orders import ORDER_ROW_ADAPTER as ADAPTER
+from app.models.address import AddressCreateUpdate
+from app.models.order import OrderCreateUpdate
+from app.models.order_item import OrderItemCreateUpdate
+from app.utils import dict_include_prefix, dict_remove_prefix
+
+
+def prefix_flatten_to_model(flatten):
+    model = {
+        k: v
+        for k, v in flatten.items()
+        if k in ("id", "customer_id", "customer_name", "total", "created_at", "updated_at")
+    }
+    aux = dict_remove_prefix(flatten, "billing_")
+    if aux:
+        model["billing_address"] = aux
+    aux = dict_remove_prefix(flatten, "shipping_")
+    if aux:
+        model["shipping_address"] = aux
+    return model
+
+
+def prefix_model_to_flatten(order):
+    return dict(
+        **order.dict(exclude={"billing_address", "shipping_address", "items"}),
+        **dict_include_prefix(
+            order.dict(include={"billing_address"}).get("billing_address", {}),
+            "billing_",
+        ),
+        **dict_include_prefix(
+            order.dict(include={"shipping_address"}).get("shipping_address", {}),
+            "shipping_",
+        ),
+    )
+
+
+def make_rows(count: int):
+    now = datetime.now(timezone.utc)
+    address = dict(street="1 Main St", city="Springfield", state="IL", zip="62701", country="US")
+    rows = []
+    for order_id in range(1, count + 1):
+        row = dict(
+            id=order_id,
+            customer_id=order_id % 50 + 1,
+            customer_name=f"Customer {order_id % 50}",
+            total=Decimal("123.45"),
+            created_at=now,
+            updated_at=now,
+        )
+        for prefix in ("billing_", "shipping_"):
+            row.update({f"{prefix}{key}": value for key, value in address.items()})
+        rows.append(row)
+    return rows
+
+
+def main(args: argparse.Namespace) -> None:
+    rows = make_rows(args.orders)
+    address = AddressCreateUpdate(
+        street="1 Main St", city="Springfield", state="IL", zip="62701", country="US"
+    )
+    order = OrderCreateUpdate(
+        customer_id=1,
+        billing_address=address,
+        shipping_address=address,
+        items=[OrderItemCreateUpdate(product_id=1, qty=1)],
+    )
+
+    assert [prefix_flatten_to_model(row) for row in rows] == [
+        ADAPTER.to_model(row) for row in rows
+    ]
+    assert prefix_model_to_flatten(order) == ADAPTER.to_row(order, exclude={"items"})
+
+    cases = [
+        (
+            f"row -> model x{args.orders}",
+            lambda: [prefix_flatten_to_model(row) for row in rows],
+            lambda: [ADAPTER.to_model(row) for row in rows],
+        ),
+        (
+            f"model -> row x{args.orders}",
+            lambda: [prefix_model_to_flatten(order) for _ in rows],
+            lambda: [ADAPTER.to_row(order, exclude={"items"}) for _ in rows],
+        ),
+    ]
+    for name, prefix, compiled in cases:
+        before = min(repeat(prefix, number=1, repeat=args.repeat))
+        after = min(repeat(compiled, number=1, repeat=args.repeat))
+        print(
+            f"{name:<24} prefix scans {before * 1000:8.2f} ms"
+            f"   compiled {after * 1000:8.2f} ms   x{before / after:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    main(parser.parse_args())
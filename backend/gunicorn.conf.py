@@ -0,0 +1,38 @@
+"""
+Production server: gunicorn managing uvicorn workers (uvloop, httptools).
+
+    gunicorn -c gunicorn.conf.py app.api.server:app
+
+The application is imported once, before the workers are forked; each worker
+then runs the startup handlers (database pool, background tasks...) on its own
+and, when stopped or recycled, drains its connections and runs the shutdown
+handlers (see `app.core.tasks`). Settings come from `app.core.config`.
+"""
+import os
+
+from app.core import config
+from app.core.workers import WORKERS_ENV, worker_count
+
+bind = config.SERVER_BIND
+workers = worker_count()
+worker_class = "app.core.uvicorn_worker.UvicornWorker"
+preload_app = True
+
+max_requests = config.WORKER_MAX_REQUESTS
+max_requests_jitter = config.WORKER_MAX_REQUESTS_JITTER
+graceful_timeout = config.WORKER_GRACEFUL_TIMEOUT
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    # workers size their share of DB_POOL_BUDGET from the actual worker count
+    # (`-w` included), inherited when they are forked
+    os.environ[WORKERS_ENV] = str(server.cfg.workers)
+
+
+def nworkers_changed(server, new_value, old_value):
+    # TTIN/TTOU: only the workers forked from now on use the new count
+    os.environ[WORKERS_ENV] = str(new_value)
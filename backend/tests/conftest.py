@@ -58,10 +58,15 @@ def postgres_container(docker: pydocker.APIClient) -> Any:
         docker.remove_container(container["Id"])
 
 
-# Create a new application for testing
-@pytest.fixture
-def app() -> FastAPI:
+# Create a new application for testing, once per repository backend
+@pytest.fixture(params=["databases", "asyncpg"])
+def app(request, monkeypatch) -> FastAPI:
     from app.api.server import get_application
+    from app.core import config
+
+    # rows are validated as any other input, so that tests catch bad data
+    monkeypatch.setattr(config, "VALIDATE_DB_ROWS", True)
+    monkeypatch.setattr(config, "DB_BACKEND", request.param)
 
     return get_application()
 
@@ -75,6 +80,9 @@ def db(app: FastAPI) -> Database:
 # Make requests in our tests
 @pytest.fixture
 async def client(app: FastAPI) -> Iterator[AsyncClient]:
+    # requests over their query budget (or with N+1 patterns) fail the test
+    app.state.query_budget_raise = True
+
     async with LifespanManager(app):
         async with AsyncClient(
             app=app,
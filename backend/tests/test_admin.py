@@ -0,0 +1,367 @@
+import asyncio
+import json
+
+import pytest
+from databases import Database
+from fastapi import FastAPI
+from httpx import AsyncClient
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_202_ACCEPTED,
+    HTTP_403_FORBIDDEN,
+    HTTP_404_NOT_FOUND,
+)
+
+from app.core import config
+from app.db.instrumentation import is_read_only
+from app.db.pool import detached_task
+from app.db.propagation import CustomerNamePropagator
+from app.db.repositories.orders import OrdersRepository
+from app.models.order import OrderTotalsRecompute
+from app.models.order_item import OrderItemCreateUpdate
+from .customers_fixtures import test_customer
+from .orders_fixtures import test_10_orders
+from .products_fixtures import test_10_products
+
+ADMIN_HEADERS = {"X-Admin-Token": str(config.ADMIN_TOKEN)}
+
+
+async def wait_for_lock_waiters(db: Database) -> None:
+    """
+    Until a statement (of another connection) waits for a lock
+    """
+    for _ in range(500):
+        if await db.fetch_val(query="select count(*) from pg_locks where not granted"):
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("no statement waits for a lock")
+
+
+async def run_recompute(app: FastAPI, client: AsyncClient, **recompute) -> dict:
+    """
+    Start a recompute job and poll it until it is over
+    """
+    r = await client.post(
+        app.url_path_for("admin:recompute-order-totals"),
+        json=recompute,
+        headers=ADMIN_HEADERS,
+    )
+    assert r.status_code == HTTP_202_ACCEPTED, r.text
+    assert r.json()["status"] == "running"
+
+    for _ in range(500):
+        job = await client.get(r.headers["location"], headers=ADMIN_HEADERS)
+        assert job.status_code == HTTP_200_OK, job.text
+        if job.json()["status"] != "running":
+            return job.json()
+        await asyncio.sleep(0.01)
+    raise AssertionError("the recompute job is still running")
+
+
+class TestRecomputeOrderTotals:
+    @pytest.mark.asyncio
+    async def test_admin_token_is_required(self, app: FastAPI, client: AsyncClient):
+        r = await client.post(app.url_path_for("admin:recompute-order-totals"), json={})
+        assert r.status_code == HTTP_403_FORBIDDEN
+
+    @pytest.mark.asyncio
+    async def test_recompute_only_mismatched(
+        self, app: FastAPI, client: AsyncClient, db: Database, test_10_orders
+    ):
+        broken_ids = [order.id for order in test_10_orders[:3]]
+        await db.execute(
+            query="update orders set total = 0 where id = any(cast(:ids as integer[]))",
+            values=dict(ids=broken_ids),
+        )
+
+        job = await run_recompute(
+            app,
+            client,
+            id_from=test_10_orders[0].id,
+            id_to=test_10_orders[-1].id,
+            chunk_size=4,
+        )
+        assert job["status"] == "done", job
+        assert job["updated_orders"] == len(broken_ids)
+        assert job["chunks"] == 3
+        assert job["first_id"] == test_10_orders[0].id
+        assert job["last_processed_id"] == job["last_id"] == test_10_orders[-1].id
+
+        for order in test_10_orders[:3]:
+            r = await client.get(
+                app.url_path_for("orders:get-order-by-id", order_id=str(order.id))
+            )
+            assert r.json()["total"] == pytest.approx(order.total)
+
+    @pytest.mark.asyncio
+    async def test_chunks_skip_id_gaps(
+        self, app: FastAPI, client: AsyncClient, db: Database, test_10_orders
+    ):
+        deleted_ids = [order.id for order in test_10_orders[1:8]]
+        await db.execute(
+            query="delete from order_items where order_id = any(cast(:ids as integer[]))",
+            values=dict(ids=deleted_ids),
+        )
+        await db.execute(
+            query="delete from orders where id = any(cast(:ids as integer[]))",
+            values=dict(ids=deleted_ids),
+        )
+
+        job = await run_recompute(
+            app,
+            client,
+            id_from=test_10_orders[0].id,
+            id_to=test_10_orders[-1].id,
+            only_mismatched=False,
+            chunk_size=2,
+        )
+        # 3 orders left: 2 chunks, none of them empty
+        assert job["chunks"] == 2
+        assert job["updated_orders"] == 3
+        assert job["last_processed_id"] == test_10_orders[-1].id
+
+    @pytest.mark.asyncio
+    async def test_nothing_to_recompute(self, app: FastAPI, client: AsyncClient):
+        job = await run_recompute(app, client, customer_id=987654321)
+        assert job["status"] == "done"
+        assert job["chunks"] == 0
+        assert job["first_id"] is None
+
+    @pytest.mark.asyncio
+    async def test_unknown_job(self, app: FastAPI, client: AsyncClient):
+        r = await client.get(
+            app.url_path_for("admin:get-order-totals-recompute", job_id="987654321"),
+            headers=ADMIN_HEADERS,
+        )
+        assert r.status_code == HTTP_404_NOT_FOUND
+
+    @pytest.mark.asyncio
+    async def test_recompute_waits_for_concurrent_item_mutations(
+        self, client: AsyncClient, db: Database, test_10_orders, test_10_products
+    ):
+        order = test_10_orders[0]
+        orders_repo = OrdersRepository(db)
+        job = await orders_repo.create_order_totals_recompute()
+
+        async with db.transaction():
+            await orders_repo.create_order_item(
+                order_id=order.id,
+                new_order_item=OrderItemCreateUpdate(
+                    product_id=test_10_products[5].id, qty=7
+                ),
+            )
+            # its own connection: waits for the order row this transaction updated
+            recompute = detached_task(
+                orders_repo.recompute_order_totals(
+                    job_id=job.id,
+                    recompute=OrderTotalsRecompute(id_from=order.id, id_to=order.id),
+                    chunk_size=10,
+                )
+            )
+            await wait_for_lock_waiters(db)
+
+        # the new item is counted: the total updated with it is kept
+        job = await recompute
+        assert job.updated_orders == 0
+        total = await db.fetch_val(
+            query="select total from orders where id = :order_id",
+            values=dict(order_id=order.id),
+        )
+        items_total = await db.fetch_val(
+            query="select sum(total) from order_items where order_id = :order_id",
+            values=dict(order_id=order.id),
+        )
+        assert total == items_total
+
+
+@pytest.fixture
+def no_propagation_worker(monkeypatch):
+    # requested before `client`, so the app starts without its background worker
+    monkeypatch.setattr(config, "CUSTOMER_NAME_PROPAGATION_ENABLED", False)
+
+
+class TestCustomerNamePropagation:
+    @pytest.mark.asyncio
+    async def test_rename_is_propagated_in_chunks(
+        self,
+        no_propagation_worker,
+        app: FastAPI,
+        client: AsyncClient,
+        db: Database,
+        test_customer,
+        test_10_orders,
+    ):
+        r = await client.patch(
+            app.url_path_for(
+                "customers:partial-update-customer", customer_id=str(test_customer.id)
+            ),
+            json=dict(name="Renamed Customer"),
+        )
+        assert r.status_code == HTTP_200_OK, r.text
+
+        r = await client.get(
+            app.url_path_for("admin:customer-name-propagation"), headers=ADMIN_HEADERS
+        )
+        assert r.status_code == HTTP_200_OK, r.text
+        assert r.json()["pending_jobs"] >= 1
+        assert r.json()["pending_orders"] >= len(test_10_orders)
+
+        propagator = CustomerNamePropagator(db, chunk_size=3)
+        assert await propagator.run_until_idle() >= len(test_10_orders)
+        # nothing left to do: running again is a no-op
+        assert await propagator.run_until_idle() == 0
+
+        names = await db.fetch_all(
+            query="select distinct customer_name from orders where customer_id = :customer_id",
+            values=dict(customer_id=test_customer.id),
+        )
+        assert [row["customer_name"] for row in names] == ["Renamed Customer"]
+
+        r = await client.get(
+            app.url_path_for("admin:customer-name-propagation"), headers=ADMIN_HEADERS
+        )
+        assert r.json()["pending_jobs"] == 0
+
+
+class TestQueryPlans:
+    @pytest.mark.asyncio
+    async def test_slow_queries_are_explained(
+        self, app: FastAPI, client: AsyncClient, monkeypatch
+    ):
+        monkeypatch.setattr(config, "SLOW_QUERY_THRESHOLD", 1e-9)
+        monkeypatch.setattr(config, "SLOW_QUERY_EXPLAIN_RATE", 1.0)
+        db = app.state._db
+
+        # one statement explained at a time (in the background): background
+        # workers' statements may take the turn of the one we look for
+        for _ in range(10):
+            r = await client.get(app.url_path_for("products:get-all-products"))
+            assert r.status_code == HTTP_200_OK
+            if db._slow_query_explain is not None:
+                await db._slow_query_explain
+
+            r = await client.get(
+                app.url_path_for("admin:slow-queries"), headers=ADMIN_HEADERS
+            )
+            assert r.status_code == HTTP_200_OK
+            slow_queries = [
+                q
+                for q in r.json()
+                if q["method"] == "ProductsRepository.get_all_products"
+            ]
+            if slow_queries:
+                break
+        slow_query = slow_queries[0]
+        assert slow_query["sql"].startswith("SELECT")
+        assert "actual time" in slow_query["plan"]
+        # shapes only, never values
+        assert set(slow_query["parameters"].values()) <= {"int", "str", "NoneType"}
+
+    @pytest.mark.asyncio
+    async def test_debug_header_returns_the_request_plans(
+        self, app: FastAPI, client: AsyncClient
+    ):
+        url = app.url_path_for("products:get-all-products")
+
+        r = await client.get(url, headers={"X-Debug-Explain": "1"})
+        assert "x-query-plans" not in r.headers
+
+        r = await client.get(url, headers={"X-Debug-Explain": "1", **ADMIN_HEADERS})
+        plans = json.loads(r.headers["x-query-plans"])
+        assert [plan["method"] for plan in plans] == [
+            "ProductsRepository.get_all_products"
+        ]
+        assert "actual time" in plans[0]["plan"]
+
+
+    @pytest.mark.parametrize(
+        "sql, read_only",
+        [
+            ("select * from orders where id = :id", True),
+            ("with totals as (select sum(total) from orders) select * from totals", True),
+            ("update orders set total = 0", False),
+            ("with deleted as (delete from orders returning id) select 1", False),
+            ("select pg_advisory_xact_lock(:lock_class, :order_id)", False),
+            ("select nextval('orders_id_seq')", False),
+        ],
+    )
+    def test_only_read_only_statements_are_explained(self, sql, read_only):
+        assert is_read_only(sql) is read_only
+
+
+class TestRequestProfiles:
+    @pytest.mark.asyncio
+    async def test_profile_header_stores_a_profile(
+        self, app: FastAPI, client: AsyncClient, tmp_path, monkeypatch
+    ):
+        monkeypatch.setattr(config, "PROFILE_DIR", str(tmp_path))
+        monkeypatch.setattr(config, "PROFILE_INTERVAL", 0.0005)
+        url = app.url_path_for("orders:get-all-orders")
+
+        r = await client.get(url, headers={"X-Profile": "1"})
+        assert "x-profile-id" not in r.headers
+
+        r = await client.get(url, headers={"X-Profile": "1", **ADMIN_HEADERS})
+        assert r.status_code == HTTP_200_OK
+        profile_id = r.headers["x-profile-id"]
+
+        r = await client.get(
+            app.url_path_for("admin:get-profile", profile_id=profile_id),
+            headers=ADMIN_HEADERS,
+        )
+        assert r.status_code == HTTP_200_OK
+        assert "attachment" in r.headers["content-disposition"]
+        speedscope = r.json()
+        assert speedscope["name"] == "GET orders:get-all-orders"
+        assert speedscope["profiles"][0]["type"] == "sampled"
+
+        r = await client.get(
+            app.url_path_for("admin:get-profile", profile_id=profile_id),
+            params=dict(format="collapsed"),
+            headers=ADMIN_HEADERS,
+        )
+        assert r.status_code == HTTP_200_OK
+        assert r.headers["content-type"].startswith("text/plain")
+
+    @pytest.mark.asyncio
+    async def test_unknown_profile(self, app: FastAPI, client: AsyncClient):
+        r = await client.get(
+            app.url_path_for("admin:get-profile", profile_id="0" * 32),
+            headers=ADMIN_HEADERS,
+        )
+        assert r.status_code == HTTP_404_NOT_FOUND
+
+
+class TestContinuousProfiler:
+    @pytest.fixture
+    def profiler_enabled(self, monkeypatch):
+        # before the client fixture starts the app
+        monkeypatch.setattr(config, "PROFILER_ENABLED", True)
+        monkeypatch.setattr(config, "PROFILER_INTERVAL", 0.001)
+
+    @pytest.mark.asyncio
+    async def test_recent_stacks(
+        self, profiler_enabled, app: FastAPI, client: AsyncClient, test_10_orders
+    ):
+        for _ in range(20):
+            await client.get(app.url_path_for("orders:get-all-orders"))
+
+        r = await client.get(
+            app.url_path_for("admin:get-profiler-stacks"),
+            params=dict(minutes=1, format="collapsed"),
+            headers=ADMIN_HEADERS,
+        )
+        assert r.status_code == HTTP_200_OK
+        stacks = {}
+        for line in r.text.splitlines():
+            stack, samples = line.rsplit(" ", 1)
+            stacks[stack] = int(samples)
+        assert any("get_all_orders (" in stack for stack in stacks)
+        assert all(samples > 0 for samples in stacks.values())
+
+    @pytest.mark.asyncio
+    async def test_disabled_by_default(self, app: FastAPI, client: AsyncClient):
+        r = await client.get(
+            app.url_path_for("admin:get-profiler-stacks"), headers=ADMIN_HEADERS
+        )
+        assert r.status_code == HTTP_404_NOT_FOUND
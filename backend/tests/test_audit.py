@@ -0,0 +1,134 @@
+import asyncio
+import io
+import json
+
+import pytest
+from databases import Database
+from httpx import AsyncClient
+
+from app.db.audit import audit_order_totals
+from app.db.pool import detached_task
+from app.db.repositories.orders import OrdersRepository
+from app.models.order_item import OrderItemCreateUpdate
+from .customers_fixtures import test_customer
+from .orders_fixtures import test_10_orders
+from .products_fixtures import test_10_products
+
+
+async def wait_for_lock_waiters(db: Database) -> None:
+    """
+    Until a statement (of another connection) waits for a lock
+    """
+    for _ in range(500):
+        if await db.fetch_val(query="select count(*) from pg_locks where not granted"):
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("no statement waits for a lock")
+
+
+class TestAuditOrderTotals:
+    @pytest.mark.asyncio
+    async def test_partitions_run_on_their_own_connections(
+        self, client: AsyncClient, db: Database, test_10_orders, monkeypatch
+    ):
+        # this task already holds a connection
+        await db.fetch_val(query="select 1")
+
+        connections = set()
+        find_mismatches = OrdersRepository.find_order_total_mismatches
+
+        async def find_order_total_mismatches(self, **kwargs):
+            # the databases connection bound to the partition's task
+            connections.add(id(self.db.connection()))
+            return await find_mismatches(self, **kwargs)
+
+        monkeypatch.setattr(
+            OrdersRepository, "find_order_total_mismatches", find_order_total_mismatches
+        )
+
+        await audit_order_totals(
+            db,
+            report=io.StringIO(),
+            id_from=test_10_orders[0].id,
+            id_to=test_10_orders[-1].id,
+            concurrency=3,
+            chunk_size=2,
+        )
+        assert len(connections) == 3
+
+    @pytest.mark.asyncio
+    async def test_report_and_repair(
+        self, client: AsyncClient, db: Database, test_10_orders
+    ):
+        broken_ids = [order.id for order in test_10_orders[2:4]]
+        await db.execute(
+            query="update orders set total = total + 1 where id = any(cast(:ids as integer[]))",
+            values=dict(ids=broken_ids),
+        )
+
+        report = io.StringIO()
+        summary = await audit_order_totals(
+            db,
+            report=report,
+            id_from=test_10_orders[0].id,
+            id_to=test_10_orders[-1].id,
+            concurrency=3,
+            chunk_size=2,
+            repair=True,
+        )
+
+        assert summary.scanned_ids == len(test_10_orders)
+        assert summary.mismatched_orders == len(broken_ids)
+        assert summary.repaired_orders == len(broken_ids)
+        assert sorted(
+            json.loads(line)["order_id"] for line in report.getvalue().splitlines()
+        ) == sorted(broken_ids)
+
+        orders_repo = OrdersRepository(db)
+        for order in test_10_orders[2:4]:
+            repaired = await orders_repo.get_order_by_id(order_id=order.id)
+            assert repaired.total == pytest.approx(order.total)
+
+    @pytest.mark.asyncio
+    async def test_repair_waits_for_concurrent_item_mutations(
+        self, client: AsyncClient, db: Database, test_10_orders, test_10_products
+    ):
+        order = test_10_orders[0]
+        await db.execute(
+            query="update orders set total = 0 where id = :order_id",
+            values=dict(order_id=order.id),
+        )
+
+        async with db.transaction():
+            # fixes the total while adding an item
+            await OrdersRepository(db).create_order_item(
+                order_id=order.id,
+                new_order_item=OrderItemCreateUpdate(
+                    product_id=test_10_products[5].id, qty=7
+                ),
+            )
+            audit = detached_task(
+                audit_order_totals(
+                    db,
+                    report=io.StringIO(),
+                    id_from=order.id,
+                    id_to=order.id,
+                    concurrency=1,
+                    repair=True,
+                )
+            )
+            # found the mismatch, waits to repair it
+            await wait_for_lock_waiters(db)
+
+        summary = await audit
+        assert summary.mismatched_orders == 1
+        assert summary.repaired_orders == 0
+        total = await db.fetch_val(
+            query="select total from orders where id = :order_id",
+            values=dict(order_id=order.id),
+        )
+        items_total = await db.fetch_val(
+            query="select sum(total) from order_items where order_id = :order_id",
+            values=dict(order_id=order.id),
+        )
+        assert total == items_total
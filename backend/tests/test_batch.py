@@ -0,0 +1,152 @@
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
+    HTTP_422_UNPROCESSABLE_ENTITY,
+    HTTP_424_FAILED_DEPENDENCY,
+)
+
+from app.models.product import ProductInDB
+from .products_fixtures import test_10_products, test_product
+
+
+class TestBatch:
+    @pytest.mark.asyncio
+    async def test_batch_returns_responses_in_order(
+        self, app: FastAPI, client: AsyncClient, test_10_products
+    ):
+        requests = [
+            dict(
+                method="GET",
+                path=app.url_path_for("products:get-product-by-id", product_id=str(p.id)),
+            )
+            for p in test_10_products[:3]
+        ]
+        requests.append(
+            dict(
+                method="PATCH",
+                path=app.url_path_for(
+                    "products:partial-update-product",
+                    product_id=str(test_10_products[0].id),
+                ),
+                body=dict(name="batched name"),
+            )
+        )
+        requests.append(
+            dict(
+                method="GET",
+                path=app.url_path_for("products:get-product-by-id", product_id="987654321"),
+            )
+        )
+
+        r = await client.post(app.url_path_for("batch:execute"), json=dict(requests=requests))
+        assert r.status_code == HTTP_200_OK, r.text
+
+        responses = r.json()
+        assert [response["status"] for response in responses] == [200, 200, 200, 200, 404]
+        assert [response["body"]["id"] for response in responses[:3]] == [
+            p.id for p in test_10_products[:3]
+        ]
+        assert responses[3]["body"]["name"] == "batched name"
+
+    @pytest.mark.asyncio
+    async def test_invalid_sub_request_reports_validation_errors(
+        self, app: FastAPI, client: AsyncClient, test_product: ProductInDB
+    ):
+        requests = [
+            dict(
+                method="PATCH",
+                path=app.url_path_for(
+                    "products:partial-update-product", product_id=str(test_product.id)
+                ),
+                body=dict(price=-1),
+            )
+        ]
+
+        r = await client.post(app.url_path_for("batch:execute"), json=dict(requests=requests))
+        assert r.status_code == HTTP_200_OK, r.text
+        assert r.json()[0]["status"] == HTTP_422_UNPROCESSABLE_ENTITY
+
+    @pytest.mark.asyncio
+    async def test_transaction_is_rolled_back_on_failure(
+        self, app: FastAPI, client: AsyncClient, test_product: ProductInDB
+    ):
+        requests = [
+            dict(
+                method="PATCH",
+                path=app.url_path_for(
+                    "products:partial-update-product", product_id=str(test_product.id)
+                ),
+                body=dict(name="should be rolled back"),
+            ),
+            dict(
+                method="DELETE",
+                path=app.url_path_for(
+                    "products:delete-product-by-id", product_id="987654321"
+                ),
+            ),
+            dict(
+                method="GET",
+                path=app.url_path_for(
+                    "products:get-product-by-id", product_id=str(test_product.id)
+                ),
+            ),
+        ]
+
+        r = await client.post(
+            app.url_path_for("batch:execute"),
+            json=dict(requests=requests, transaction=True),
+        )
+        assert r.status_code == HTTP_200_OK, r.text
+        assert [response["status"] for response in r.json()] == [
+            HTTP_200_OK,
+            HTTP_404_NOT_FOUND,
+            HTTP_424_FAILED_DEPENDENCY,
+        ]
+
+        r = await client.get(
+            app.url_path_for("products:get-product-by-id", product_id=str(test_product.id))
+        )
+        assert r.json()["name"] == test_product.name
+
+    @pytest.mark.asyncio
+    async def test_batches_can_not_be_nested(self, app: FastAPI, client: AsyncClient):
+        batch_url = app.url_path_for("batch:execute")
+        requests = [
+            dict(method="POST", path=batch_url, body=dict(requests=[])),
+            dict(method="POST", path=batch_url + "?x=1", body=dict(requests=[])),
+        ]
+
+        r = await client.post(batch_url, json=dict(requests=requests))
+        assert r.status_code == HTTP_200_OK, r.text
+        assert [response["status"] for response in r.json()] == [
+            HTTP_400_BAD_REQUEST,
+            HTTP_400_BAD_REQUEST,
+        ]
+
+    @pytest.mark.asyncio
+    async def test_sub_requests_are_counted_in_metrics(
+        self, app: FastAPI, client: AsyncClient
+    ):
+        requests = [
+            dict(
+                method="GET",
+                path=app.url_path_for(
+                    "customers:get-customer-by-id", customer_id="987654321"
+                ),
+            )
+        ]
+
+        r = await client.post(
+            app.url_path_for("batch:execute"), json=dict(requests=requests)
+        )
+        assert r.json()[0]["status"] == HTTP_404_NOT_FOUND
+
+        r = await client.get("/metrics")
+        assert (
+            'http_requests_total{route="customers:get-customer-by-id",method="GET",status="404"}'
+            in r.text
+        )
@@ -0,0 +1,138 @@
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from starlette.status import HTTP_200_OK
+
+from app.api.middleware.compression import CompressedBodies
+from app.api.negotiation import choose_encoding, prefers_msgpack
+from app.core import config
+from .customers_fixtures import test_customer
+from .orders_fixtures import test_10_orders
+from .products_fixtures import test_10_products
+
+
+class TestNegotiation:
+    @pytest.mark.parametrize(
+        "accept, expected",
+        [
+            (None, False),
+            ("application/json", False),
+            ("application/msgpack", True),
+            ("application/x-msgpack", True),
+            ("application/msgpack, */*;q=0.1", True),
+            ("*/*, application/msgpack", True),
+            ("application/msgpack, application/json", True),
+            ("application/json, application/msgpack", False),
+            ("application/msgpack;q=0.5, application/json", False),
+            ("application/msgpack;q=0", False),
+        ],
+    )
+    def test_prefers_msgpack(self, accept, expected):
+        assert prefers_msgpack(accept) is expected
+
+    @pytest.mark.parametrize(
+        "accept_encoding, expected",
+        [
+            (None, None),
+            ("identity", None),
+            ("gzip", "gzip"),
+            ("gzip, deflate, br", "br"),
+            ("br;q=0.5, gzip", "gzip"),
+            ("*", "br"),
+            ("*, br;q=0", "gzip"),
+        ],
+    )
+    def test_choose_encoding(self, accept_encoding, expected):
+        assert choose_encoding(accept_encoding, ("br", "gzip")) == expected
+
+
+class TestCompressedBodies:
+    def test_least_recently_used_are_evicted(self):
+        cache = CompressedBodies(max_bytes=10)
+        cache.put((b"a", "gzip"), b"12345")
+        cache.put((b"b", "gzip"), b"12345")
+        assert cache.get((b"a", "gzip")) == b"12345"
+
+        cache.put((b"c", "gzip"), b"123")
+        assert cache.get((b"b", "gzip")) is None
+        assert cache.get((b"a", "gzip")) == b"12345"
+        assert cache.size == 8
+
+        # never cached: bigger than the whole cache
+        cache.put((b"d", "gzip"), b"x" * 11)
+        assert cache.get((b"d", "gzip")) is None
+
+
+class TestMessagePack:
+    @pytest.mark.asyncio
+    async def test_same_content_as_json(
+        self, app: FastAPI, client: AsyncClient, test_10_orders
+    ):
+        msgpack = pytest.importorskip("msgpack")
+        url = app.url_path_for("orders:get-all-orders")
+
+        json_response = await client.get(url)
+        msgpack_response = await client.get(url, headers={"Accept": "application/msgpack"})
+
+        assert msgpack_response.status_code == HTTP_200_OK
+        assert msgpack_response.headers["content-type"] == "application/msgpack"
+        assert "Accept" in msgpack_response.headers["vary"]
+        assert msgpack.unpackb(msgpack_response.content) == json_response.json()
+
+    @pytest.mark.asyncio
+    async def test_vary_keeps_every_negotiated_header(
+        self, app: FastAPI, client: AsyncClient, test_10_orders
+    ):
+        r = await client.get(
+            app.url_path_for("orders:get-all-orders"),
+            headers={"Accept": "application/json", "Accept-Encoding": "gzip"},
+        )
+        assert r.headers["content-encoding"] == "gzip"
+        vary = {value.strip() for value in r.headers["vary"].split(",")}
+        assert {"Accept", "Accept-Encoding"} <= vary
+
+
+class TestCompression:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("encoding", ["gzip", "br"])
+    async def test_large_responses_are_compressed(
+        self, app: FastAPI, client: AsyncClient, test_10_orders, encoding
+    ):
+        if encoding == "br":
+            pytest.importorskip("brotli")
+        url = app.url_path_for("orders:get-all-orders")
+
+        plain = await client.get(url, headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in plain.headers
+        assert len(plain.content) >= config.COMPRESSION_MIN_SIZE
+
+        compressed = await client.get(url, headers={"Accept-Encoding": encoding})
+        assert compressed.status_code == HTTP_200_OK
+        assert compressed.headers["content-encoding"] == encoding
+        assert "Accept-Encoding" in compressed.headers["vary"]
+        assert compressed.json() == plain.json()
+
+    @pytest.mark.asyncio
+    async def test_compressed_bodies_are_cached(
+        self, app: FastAPI, client: AsyncClient, test_10_orders
+    ):
+        url = app.url_path_for("orders:get-all-orders")
+        for _ in range(2):
+            r = await client.get(url, headers={"Accept-Encoding": "gzip"})
+            assert r.headers["content-encoding"] == "gzip"
+
+        r = await client.get("/metrics", headers={"Accept-Encoding": "identity"})
+        assert 'http_compressed_responses_total{encoding="gzip",cache="hit"}' in r.text
+
+    @pytest.mark.asyncio
+    async def test_small_responses_are_not_compressed(
+        self, app: FastAPI, client: AsyncClient, test_10_products
+    ):
+        r = await client.get(
+            app.url_path_for(
+                "products:get-product-by-id", product_id=test_10_products[0].id
+            ),
+            headers={"Accept-Encoding": "gzip"},
+        )
+        assert r.status_code == HTTP_200_OK
+        assert "content-encoding" not in r.headers
@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from starlette.status import HTTP_200_OK, HTTP_201_CREATED
+
+from app.core import config
+from app.db import contention
+from app.db.contention import run_order_mutation
+from app.models.order import OrderWithItemsInDB
+from .customers_fixtures import test_customer
+from .orders_fixtures import test_order
+from .products_fixtures import test_10_products
+
+
+class TestConcurrentOrderItems:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("lock_mode", ("local", "advisory"))
+    async def test_concurrent_item_creation_keeps_total_consistent(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        test_order: OrderWithItemsInDB,
+        test_10_products,
+        lock_mode: str,
+        monkeypatch,
+    ):
+        monkeypatch.setattr(config, "ORDER_LOCK_MODE", lock_mode)
+
+        responses = await asyncio.gather(
+            *(
+                client.post(
+                    app.url_path_for("orders:create-order-item", order_id=test_order.id),
+                    json=dict(product_id=product.id, qty=3),
+                )
+                for product in test_10_products
+            )
+        )
+        assert all(r.status_code == HTTP_201_CREATED for r in responses)
+
+        r = await client.get(
+            app.url_path_for("orders:get-all-order-items", order_id=str(test_order.id))
+        )
+        items_total = sum(item["total"] for item in r.json())
+
+        r = await client.get(
+            app.url_path_for("orders:get-order-by-id", order_id=str(test_order.id))
+        )
+        assert r.status_code == HTTP_200_OK
+        assert r.json()["total"] == pytest.approx(items_total)
+
+        r = await client.get("/metrics")
+        assert f'order_lock_wait_seconds_count{{mode="{lock_mode}"}}' in r.text
+
+
+class ConflictError(Exception):
+    def __init__(self, sqlstate: str) -> None:
+        super().__init__(f"sqlstate {sqlstate}")
+        self.sqlstate = sqlstate
+
+
+def failing_mutation(error: Exception, failures: int):
+    """
+    A mutation raising `error` on its first `failures` calls
+    """
+
+    async def mutation():
+        mutation.calls += 1
+        if mutation.calls <= failures:
+            raise error
+        return "done"
+
+    mutation.calls = 0
+    return mutation
+
+
+class TestConflictRetries:
+    @pytest.fixture(autouse=True)
+    def no_delay(self, monkeypatch):
+        monkeypatch.setattr(config, "ORDER_LOCK_MODE", "none")
+        monkeypatch.setattr(config, "DB_CONFLICT_RETRIES", 3)
+        monkeypatch.setattr(config, "DB_CONFLICT_RETRY_BASE_DELAY", 0.0)
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("sqlstate", ("40P01", "40001"))
+    async def test_conflicts_are_retried(self, sqlstate: str):
+        retries = contention.DB_CONFLICT_RETRIES.labels(sqlstate)
+        retries_before = retries.value
+        mutation = failing_mutation(ConflictError(sqlstate), failures=1)
+
+        assert await run_order_mutation(None, 1, mutation) == "done"
+        assert mutation.calls == 2
+        assert retries.value == retries_before + 1
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "error", (ConflictError("23505"), ValueError("not a database error"))
+    )
+    async def test_other_errors_are_raised_at_once(self, error: Exception):
+        mutation = failing_mutation(error, failures=1)
+
+        with pytest.raises(type(error)):
+            await run_order_mutation(None, 1, mutation)
+        assert mutation.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_last_conflict_is_raised_once_retries_are_exhausted(self):
+        mutation = failing_mutation(ConflictError("40P01"), failures=10)
+
+        with pytest.raises(ConflictError):
+            await run_order_mutation(None, 1, mutation)
+        assert mutation.calls == config.DB_CONFLICT_RETRIES + 1
+
+    def test_backoff_is_capped(self, monkeypatch):
+        monkeypatch.setattr(config, "DB_CONFLICT_RETRY_BASE_DELAY", 0.05)
+        monkeypatch.setattr(config, "DB_CONFLICT_RETRY_MAX_DELAY", 0.3)
+
+        for attempt in range(8):
+            ceiling = min(0.3, 0.05 * 2 ** attempt)
+            assert all(
+                0 <= contention._backoff(attempt) <= ceiling for _ in range(20)
+            )
+
+    @pytest.mark.asyncio
+    async def test_advisory_lock_wait_is_observed(
+        self, client: AsyncClient, db, monkeypatch
+    ):
+        monkeypatch.setattr(config, "ORDER_LOCK_MODE", "advisory")
+        waits = contention.ORDER_LOCK_WAIT.labels("advisory")
+        waits_before = sum(waits.counts)
+
+        async def mutation():
+            return await db.fetch_val(query="select 1")
+
+        assert await run_order_mutation(db, 1, mutation) == 1
+        assert sum(waits.counts) == waits_before + 1
@@ -7,6 +7,7 @@ from starlette.status import (
     HTTP_200_OK,
     HTTP_201_CREATED,
     HTTP_404_NOT_FOUND,
+    HTTP_412_PRECONDITION_FAILED,
     HTTP_422_UNPROCESSABLE_ENTITY,
 )
 
@@ -23,6 +24,8 @@ from .customers_fixtures import (
 
 from app.models.customer import CustomerCreateUpdate, CustomerInDB
 
+STALE_UPDATED_AT = "2000-01-01T00:00:00+00:00"
+
 
 class TestCreateCustomer:
     """
@@ -151,6 +154,48 @@ class TestPartialUpdateCustomer:
         )
         assert r.status_code == HTTP_404_NOT_FOUND
 
+    @pytest.mark.asyncio
+    async def test_partial_update_with_if_match(
+        self, app: FastAPI, client: AsyncClient, test_customer: CustomerInDB
+    ):
+        url = app.url_path_for(
+            "customers:partial-update-customer", customer_id=str(test_customer.id)
+        )
+
+        r = await client.patch(
+            url,
+            json=dict(name="first update"),
+            headers={"If-Match": test_customer.updated_at.isoformat()},
+        )
+        assert r.status_code == HTTP_200_OK, r.text
+        last_seen_updated_at = r.json()["updated_at"]
+
+        # the customer was modified since `test_customer` was read
+        r = await client.patch(
+            url,
+            json=dict(name="second update"),
+            headers={"If-Match": test_customer.updated_at.isoformat()},
+        )
+        assert r.status_code == HTTP_412_PRECONDITION_FAILED, r.text
+
+        r = await client.patch(
+            url,
+            json=dict(name="second update"),
+            headers={"If-Match": last_seen_updated_at},
+        )
+        assert r.status_code == HTTP_200_OK, r.text
+
+    @pytest.mark.asyncio
+    async def test_partial_update_nonexistent_customer_with_if_match(
+        self, app: FastAPI, client: AsyncClient, test_customer: CustomerInDB
+    ):
+        r = await client.patch(
+            app.url_path_for("customers:partial-update-customer", customer_id="999999"),
+            json=dict(name="new name"),
+            headers={"If-Match": test_customer.updated_at.isoformat()},
+        )
+        assert r.status_code == HTTP_404_NOT_FOUND
+
 
 class TestGetCustomer:
     """
@@ -288,3 +333,29 @@ class TestDeleteCustomer:
             app.url_path_for("customers:delete-customer-by-id", customer_id=wrong_id)
         )
         assert r.status_code == expected_status
+
+    @pytest.mark.asyncio
+    async def test_delete_customer_with_if_match(
+        self, app: FastAPI, client: AsyncClient, test_customer: CustomerInDB
+    ):
+        url = app.url_path_for(
+            "customers:delete-customer-by-id", customer_id=str(test_customer.id)
+        )
+
+        r = await client.delete(url, headers={"If-Match": STALE_UPDATED_AT})
+        assert r.status_code == HTTP_412_PRECONDITION_FAILED, r.text
+
+        # still there
+        r = await client.get(url)
+        assert r.status_code == HTTP_200_OK
+
+        r = await client.delete(
+            url, headers={"If-Match": test_customer.updated_at.isoformat()}
+        )
+        assert r.status_code == HTTP_200_OK, r.text
+
+        # already deleted: not a precondition failure
+        r = await client.delete(
+            url, headers={"If-Match": test_customer.updated_at.isoformat()}
+        )
+        assert r.status_code == HTTP_404_NOT_FOUND
@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from starlette.status import HTTP_200_OK
+
+from app.core import config
+from app.core.loop_monitor import LoopMonitor, loop_blocks
+
+
+def blocking_validation():
+    time.sleep(0.3)
+
+
+class TestLoopMonitor:
+    @pytest.mark.asyncio
+    async def test_blocking_step_is_captured(self):
+        monitor = LoopMonitor(interval=0.01, threshold=0.1)
+        monitor.start()
+        try:
+            await asyncio.sleep(0.05)
+            blocking_validation()
+            await asyncio.sleep(0.05)
+        finally:
+            monitor.stop()
+
+        block = loop_blocks[-1]
+        assert block["stack"][0].startswith("blocking_validation ")
+        assert block["blocked_for"] >= 0.2
+
+    @pytest.mark.asyncio
+    async def test_admin_endpoint(self, app: FastAPI, client: AsyncClient):
+        r = await client.get(
+            app.url_path_for("admin:loop-blocks"),
+            headers={"X-Admin-Token": str(config.ADMIN_TOKEN)},
+        )
+        assert r.status_code == HTTP_200_OK
+        assert isinstance(r.json(), list)
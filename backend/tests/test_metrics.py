@@ -0,0 +1,149 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from starlette.status import HTTP_200_OK
+
+from app.core import config
+from app.core.metrics import (
+    Counter,
+    Gauge,
+    Registry,
+    generate_latest,
+    retire_snapshot,
+    snapshot,
+    write_snapshot,
+)
+
+
+class TestMetricsEndpoint:
+    @pytest.mark.asyncio
+    async def test_request_and_query_metrics(self, app: FastAPI, client: AsyncClient):
+        r = await client.get(app.url_path_for("products:get-all-products"))
+        assert r.status_code == HTTP_200_OK
+
+        r = await client.get("/metrics")
+        assert r.status_code == HTTP_200_OK
+        assert r.headers["content-type"].startswith("text/plain")
+
+        assert (
+            'http_request_duration_seconds_count{route="products:get-all-products",method="GET"}'
+            in r.text
+        )
+        assert (
+            'http_requests_total{route="products:get-all-products",method="GET",status="200"}'
+            in r.text
+        )
+        assert 'http_response_size_bytes_count{route="products:get-all-products"}' in r.text
+        assert (
+            'db_query_duration_seconds_count{method="ProductsRepository.get_all_products"}'
+            in r.text
+        )
+        assert 'db_query_rows_count{method="ProductsRepository.get_all_products"}' in r.text
+        assert "http_requests_in_flight" in r.text
+
+    @pytest.mark.asyncio
+    async def test_unmatched_paths_are_not_labels(
+        self, app: FastAPI, client: AsyncClient
+    ):
+        await client.get("/no/such/path/42")
+
+        r = await client.get("/metrics")
+        assert 'route="unmatched"' in r.text
+        assert "/no/such/path" not in r.text
+
+
+class TestSnapshots:
+    def test_workers_snapshots_are_added_up(self, tmp_path):
+        registry = Registry()
+        requests = Counter("requests_total", "Requests", ("route",), registry=registry)
+        requests.labels("a").inc(2)
+
+        # another worker's snapshot
+        with open(os.path.join(tmp_path, "1.json"), "w") as f:
+            json.dump(
+                {
+                    "requests_total": dict(
+                        type="counter",
+                        documentation="Requests",
+                        samples=[
+                            ["requests_total", {"route": "a"}, 3],
+                            ["requests_total", {"route": "b"}, 1],
+                        ],
+                    )
+                },
+                f,
+            )
+        # our own snapshot is ignored in favour of the live values
+        write_snapshot(str(tmp_path), registry)
+
+        text = generate_latest(registry, snapshot_dir=str(tmp_path))
+        assert 'requests_total{route="a"} 5.0' in text
+        assert 'requests_total{route="b"} 1.0' in text
+
+    def test_counters_survive_workers(self, tmp_path):
+        registry = Registry()
+        requests = Counter("requests_total", "Requests", registry=registry)
+        in_flight = Gauge("in_flight", "In flight", registry=registry)
+        requests.inc(3)
+        in_flight.set(2)
+
+        # a worker killed without retiring its snapshot
+        killed_pid = subprocess.Popen([sys.executable, "-c", "pass"])
+        killed_pid.wait()
+        with open(os.path.join(tmp_path, f"{killed_pid.pid}.json"), "w") as f:
+            json.dump(snapshot(registry), f)
+
+        # a worker that exited gracefully
+        retire_snapshot(str(tmp_path), registry)
+
+        text = generate_latest(Registry(), snapshot_dir=str(tmp_path))
+        assert "requests_total 6.0" in text
+        assert "in_flight" not in text
+        assert sorted(os.listdir(tmp_path)) == [".lock", "dead-workers.json"]
+
+        # still there on the next scrape
+        text = generate_latest(Registry(), snapshot_dir=str(tmp_path))
+        assert "requests_total 6.0" in text
+
+    def test_stale_gauges_are_left_out(self, tmp_path):
+        registry = Registry()
+        Counter("requests_total", "Requests", registry=registry).inc(3)
+        Gauge("in_flight", "In flight", registry=registry).set(2)
+
+        # a live worker (the test runner's parent) that stopped writing
+        path = os.path.join(tmp_path, f"{os.getppid()}.json")
+        with open(path, "w") as f:
+            json.dump(snapshot(registry), f)
+        os.utime(path, (0, 0))
+
+        text = generate_latest(Registry(), snapshot_dir=str(tmp_path), stale_after=15)
+        assert "requests_total 3.0" in text
+        assert "in_flight" not in text
+
+
+class TestServerTiming:
+    @pytest.mark.asyncio
+    async def test_disabled_by_default(self, app: FastAPI, client: AsyncClient):
+        r = await client.get(app.url_path_for("orders:get-all-orders"))
+        assert "server-timing" not in r.headers
+
+    @pytest.mark.asyncio
+    async def test_phases(self, app: FastAPI, client: AsyncClient, monkeypatch):
+        monkeypatch.setattr(config, "SERVER_TIMING", True)
+
+        r = await client.get(app.url_path_for("orders:get-all-orders"))
+        assert r.status_code == HTTP_200_OK
+
+        phases = dict(
+            entry.strip().split(";dur=") for entry in r.headers["server-timing"].split(",")
+        )
+        assert list(phases) == ["pool", "db", "validation", "app", "serialization", "total"]
+        assert float(phases["db"]) > 0
+        assert float(phases["total"]) >= sum(
+            float(phases[name]) for name in ("pool", "db", "serialization")
+        )
@@ -0,0 +1,110 @@
+import pytest
+from databases import Database
+from fastapi import HTTPException
+from httpx import AsyncClient
+
+from app.db.native import NativeQuery
+from app.db.repositories.native import NativeOrdersRepository, NativeProductsRepository
+from app.db.repositories.orders import OrdersRepository
+from app.db.repositories.products import ProductsRepository
+from app.models.order import OrderCreateUpdate
+from app.models.pagination import Pagination
+from .customers_fixtures import test_customer
+from .orders_fixtures import test_order
+from .products_fixtures import test_10_products
+
+
+def new_order(customer_id: int, items) -> OrderCreateUpdate:
+    address = dict(street="street", city="city", state="st", zip="1", country="c")
+    return OrderCreateUpdate(
+        customer_id=customer_id,
+        billing_address=address,
+        shipping_address=address,
+        items=items,
+    )
+
+
+class TestNativeQuery:
+    def test_named_placeholders_become_positional(self):
+        query = NativeQuery(
+            "select * from t where a = :order_id and b = any(:order_ids) "
+            "and c = cast(:order_id as integer)",
+            "order_ids",
+            "order_id",
+        )
+        assert query.sql == (
+            "select * from t where a = $2 and b = any($1) and c = cast($2 as integer)"
+        )
+        assert query.values([[1, 2], 3]) == dict(order_ids=[1, 2], order_id=3)
+
+
+class TestNativeRepositories:
+    @pytest.mark.asyncio
+    async def test_same_models_as_databases(
+        self, client: AsyncClient, db: Database, test_order, test_10_products
+    ):
+        order = await NativeOrdersRepository(db).get_order_by_id(order_id=test_order.id)
+        assert order == await OrdersRepository(db).get_order_by_id(order_id=test_order.id)
+
+        pagination = Pagination(skip=0, limit=100)
+        items = await NativeOrdersRepository(db).get_all_order_items(
+            order_id=test_order.id, pagination=pagination
+        )
+        assert items == await OrdersRepository(db).get_all_order_items(
+            order_id=test_order.id, pagination=pagination
+        )
+
+        product_id = test_10_products[0].id
+        product = await NativeProductsRepository(db).get_product_by_id(
+            product_id=product_id
+        )
+        assert product == await ProductsRepository(db).get_product_by_id(
+            product_id=product_id
+        )
+
+        products = await NativeProductsRepository(db).get_all_products(
+            search="product", pagination=pagination
+        )
+        assert products == await ProductsRepository(db).get_all_products(
+            search="product", pagination=pagination
+        )
+
+    @pytest.mark.asyncio
+    async def test_create_order(
+        self, client: AsyncClient, db: Database, test_customer, test_10_products
+    ):
+        created = await NativeOrdersRepository(db).create_order(
+            new_order=new_order(
+                test_customer.id,
+                [
+                    dict(product_id=test_10_products[0].id, qty=2),
+                    dict(product_id=test_10_products[1].id, qty=3),
+                ],
+            )
+        )
+
+        assert created.customer_id == test_customer.id
+        assert [item.qty for item in created.items] == [2, 3]
+        assert created.total == pytest.approx(sum(item.total for item in created.items))
+        assert created == await OrdersRepository(db).get_order_by_id(order_id=created.id)
+
+    @pytest.mark.asyncio
+    async def test_create_order_with_missing_product(
+        self, client: AsyncClient, db: Database, test_customer, test_10_products
+    ):
+        orders_before = await db.fetch_val("select count(*) from orders")
+
+        with pytest.raises(HTTPException) as e:
+            await NativeOrdersRepository(db).create_order(
+                new_order=new_order(
+                    test_customer.id,
+                    [
+                        dict(product_id=test_10_products[0].id, qty=1),
+                        dict(product_id=999_999_999, qty=1),
+                    ],
+                )
+            )
+
+        assert e.value.status_code == 422
+        # the order was rolled back with its items
+        assert await db.fetch_val("select count(*) from orders") == orders_before
@@ -0,0 +1,82 @@
+import contextvars
+import copy
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from starlette.status import HTTP_200_OK, HTTP_201_CREATED, HTTP_422_UNPROCESSABLE_ENTITY
+
+from app.core import config
+from app.core.offload import run_offloaded
+from .customers_fixtures import test_customer
+from .orders_fixtures import INVALID_NEW_ORDERS, VALID_NEW_ORDERS, test_10_orders
+from .products_fixtures import test_10_products
+
+
+@pytest.fixture
+def offload_everything(monkeypatch):
+    monkeypatch.setattr(config, "OFFLOAD_REQUEST_BYTES", 1)
+    monkeypatch.setattr(config, "OFFLOAD_RESPONSE_ITEMS", 1)
+
+
+def with_ids(payload, customer, products):
+    payload = copy.deepcopy(payload)
+    if payload.get("customer_id") == ...:
+        payload["customer_id"] = customer.id
+    for item, product in zip(payload.get("items") or [], products):
+        if item.get("product_id") == ...:
+            item["product_id"] = product.id
+    return payload
+
+
+class TestOffloadedPayloads:
+    @pytest.mark.asyncio
+    async def test_offloaded_create_order(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        test_customer,
+        test_10_products,
+        offload_everything,
+    ):
+        payload = with_ids(VALID_NEW_ORDERS[0], test_customer, test_10_products)
+
+        r = await client.post(app.url_path_for("orders:create-order"), json=payload)
+        assert r.status_code == HTTP_201_CREATED, r.text
+        assert len(r.json()["items"]) == len(payload["items"])
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("payload", INVALID_NEW_ORDERS)
+    async def test_offloaded_validation_errors(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        test_customer,
+        test_10_products,
+        offload_everything,
+        payload,
+    ):
+        payload = with_ids(payload, test_customer, test_10_products)
+
+        r = await client.post(app.url_path_for("orders:create-order"), json=payload)
+        assert r.status_code == HTTP_422_UNPROCESSABLE_ENTITY, r.text
+
+    @pytest.mark.asyncio
+    async def test_offloaded_response_is_identical(
+        self, app: FastAPI, client: AsyncClient, test_10_orders, monkeypatch
+    ):
+        url = app.url_path_for("orders:get-all-orders")
+        inline = await client.get(url)
+
+        monkeypatch.setattr(config, "OFFLOAD_RESPONSE_ITEMS", 1)
+        offloaded = await client.get(url)
+
+        assert offloaded.status_code == HTTP_200_OK
+        assert offloaded.content == inline.content
+
+    @pytest.mark.asyncio
+    async def test_offloaded_function_sees_the_callers_context(self):
+        var = contextvars.ContextVar("var", default=None)
+        var.set("request")
+
+        assert await run_offloaded(var.get) == "request"
@@ -5,6 +5,7 @@ from starlette.status import (
     HTTP_200_OK,
     HTTP_201_CREATED,
     HTTP_404_NOT_FOUND,
+    HTTP_412_PRECONDITION_FAILED,
     HTTP_422_UNPROCESSABLE_ENTITY,
 )
 
@@ -146,6 +147,58 @@ class TestPartialUpdateOrderItem:
             )
 
 
+    @pytest.mark.asyncio
+    async def test_partial_update_with_if_match(
+        self, app: FastAPI, client: AsyncClient, test_order: OrderWithItemsInDB
+    ):
+        url = app.url_path_for(
+            "orders:partial-update-order-item",
+            order_id=test_order.id,
+            order_item_id=test_order.items[0].id,
+        )
+        r = await client.get(
+            app.url_path_for(
+                "orders:get-order-item-by-id",
+                order_id=test_order.id,
+                order_item_id=test_order.items[0].id,
+            )
+        )
+        first_seen_updated_at = r.json()["updated_at"]
+
+        r = await client.patch(
+            url, json=dict(qty=50), headers={"If-Match": first_seen_updated_at}
+        )
+        assert r.status_code == HTTP_200_OK, r.text
+        last_seen_updated_at = r.json()["updated_at"]
+        assert last_seen_updated_at != first_seen_updated_at
+
+        # the item was modified since it was first read
+        r = await client.patch(
+            url, json=dict(qty=60), headers={"If-Match": first_seen_updated_at}
+        )
+        assert r.status_code == HTTP_412_PRECONDITION_FAILED, r.text
+
+        r = await client.patch(
+            url, json=dict(qty=60), headers={"If-Match": last_seen_updated_at}
+        )
+        assert r.status_code == HTTP_200_OK, r.text
+
+    @pytest.mark.asyncio
+    async def test_partial_update_nonexistent_order_item_with_if_match(
+        self, app: FastAPI, client: AsyncClient, test_order: OrderWithItemsInDB
+    ):
+        r = await client.patch(
+            app.url_path_for(
+                "orders:partial-update-order-item",
+                order_id=test_order.id,
+                order_item_id=987654321,
+            ),
+            json=dict(qty=50),
+            headers={"If-Match": test_order.items[0].updated_at.isoformat()},
+        )
+        assert r.status_code == HTTP_404_NOT_FOUND
+
+
 class TestGetOrderItem:
     """
     Testing GET calls
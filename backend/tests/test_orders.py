@@ -8,6 +8,7 @@ from starlette.status import (
     HTTP_200_OK,
     HTTP_201_CREATED,
     HTTP_404_NOT_FOUND,
+    HTTP_412_PRECONDITION_FAILED,
     HTTP_422_UNPROCESSABLE_ENTITY,
 )
 
@@ -25,6 +26,8 @@ from .orders_fixtures import (
 from .customers_fixtures import test_customer
 from .products_fixtures import test_10_products
 
+STALE_UPDATED_AT = "2000-01-01T00:00:00+00:00"
+
 
 class TestCreateOrder:
     """
@@ -336,3 +339,30 @@ class TestDeleteOrder:
             app.url_path_for("orders:delete-order-by-id", order_id=wrong_id)
         )
         assert r.status_code == expected_status
+
+    @pytest.mark.asyncio
+    async def test_delete_order_with_if_match(
+        self, app: FastAPI, client: AsyncClient, test_order: OrderWithItemsInDB
+    ):
+        url = app.url_path_for(
+            "orders:delete-order-by-id", order_id=str(test_order.id)
+        )
+        r = await client.get(url)
+        assert r.status_code == HTTP_200_OK
+        updated_at = r.json()["updated_at"]
+
+        r = await client.delete(url, headers={"If-Match": STALE_UPDATED_AT})
+        assert r.status_code == HTTP_412_PRECONDITION_FAILED, r.text
+
+        # neither the order nor its items were deleted
+        r = await client.get(
+            app.url_path_for("orders:get-all-order-items", order_id=str(test_order.id))
+        )
+        assert len(r.json()) == len(test_order.items)
+
+        r = await client.delete(url, headers={"If-Match": updated_at})
+        assert r.status_code == HTTP_200_OK, r.text
+
+        # already deleted: not a precondition failure
+        r = await client.delete(url, headers={"If-Match": updated_at})
+        assert r.status_code == HTTP_404_NOT_FOUND
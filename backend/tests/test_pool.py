@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+from databases import Database
+from fastapi import FastAPI
+from httpx import AsyncClient
+from starlette.status import HTTP_200_OK, HTTP_503_SERVICE_UNAVAILABLE
+
+from app.core import config
+
+
+class TestConnectionPool:
+    @pytest.mark.asyncio
+    async def test_pool_metrics_are_exposed(self, app: FastAPI, client: AsyncClient):
+        r = await client.get(app.url_path_for("products:get-all-products"))
+        assert r.status_code == HTTP_200_OK
+
+        r = await client.get("/metrics")
+        assert 'db_pool_connections{state="in_use"}' in r.text
+        assert "db_pool_acquire_seconds_count" in r.text
+        assert f"db_pool_max_size {float(config.DB_MAX_SIZE)}" in r.text
+
+    @pytest.mark.asyncio
+    async def test_exhausted_pool_answers_503(
+        self, app: FastAPI, client: AsyncClient, db: Database
+    ):
+        pool = db._backend._pool
+        pool.acquire_timeout = 0.1
+
+        release = asyncio.Event()
+
+        async def hold_connection():
+            async with db.connection() as connection:
+                await connection.fetch_val("select 1")
+                await release.wait()
+
+        holders = [
+            asyncio.ensure_future(hold_connection()) for _ in range(config.DB_MAX_SIZE)
+        ]
+        while pool.in_use < config.DB_MAX_SIZE:
+            await asyncio.sleep(0.01)
+
+        try:
+            r = await client.get(app.url_path_for("products:get-all-products"))
+            assert r.status_code == HTTP_503_SERVICE_UNAVAILABLE
+            assert r.headers["retry-after"] == "1"
+        finally:
+            release.set()
+            await asyncio.gather(*holders)
+
+        r = await client.get(app.url_path_for("products:get-all-products"))
+        assert r.status_code == HTTP_200_OK
+
+
+class TestPgBouncerMode:
+    def test_no_prepared_statement_cache_nor_session_reset(self, monkeypatch):
+        from app.db.pool import PgBouncerConnection, get_pool_options
+        from app.db.tasks import get_database_url
+
+        monkeypatch.setattr(config, "DB_PGBOUNCER", True)
+        monkeypatch.setattr(config, "PGBOUNCER_HOST", "bouncer.local")
+        monkeypatch.setattr(config, "PGBOUNCER_PORT", 6432)
+
+        options = get_pool_options()
+        assert options["statement_cache_size"] == 0
+        assert options["connection_class"] is PgBouncerConnection
+
+        assert "@bouncer.local:6432/" in get_database_url()
+
+
+class TestPoolBudget:
+    @pytest.mark.parametrize(
+        "budget, workers, expected",
+        [(0, 4, (2, 10)), (40, 4, (2, 10)), (20, 8, (2, 2)), (10, 16, (1, 1))],
+    )
+    def test_budget_is_split_across_workers(
+        self, monkeypatch, budget, workers, expected
+    ):
+        from app.db.pool import get_pool_options
+
+        monkeypatch.setattr(config, "DB_MIN_SIZE", 2)
+        monkeypatch.setattr(config, "DB_MAX_SIZE", 10)
+        monkeypatch.setattr(config, "DB_POOL_BUDGET", budget)
+        monkeypatch.setattr(config, "WEB_CONCURRENCY", workers)
+
+        options = get_pool_options()
+        assert (options["min_size"], options["max_size"]) == expected
+
+    def test_one_worker_per_cpu_at_most_max_workers(self, monkeypatch):
+        from app.core import workers
+
+        monkeypatch.setattr(config, "WEB_CONCURRENCY", 0)
+        monkeypatch.setattr(config, "MAX_WORKERS", 4)
+        monkeypatch.setattr(workers, "cpu_count", lambda: 2)
+        assert workers.worker_count() == 2
+
+        monkeypatch.setattr(workers, "cpu_count", lambda: 32)
+        assert workers.worker_count() == 4
+
+    def test_worker_count_of_the_running_server(self, monkeypatch):
+        from app.core import workers
+
+        monkeypatch.setattr(config, "WEB_CONCURRENCY", 4)
+        monkeypatch.setenv(workers.WORKERS_ENV, "6")
+        assert workers.worker_count() == 6
@@ -7,6 +7,7 @@ from starlette.status import (
     HTTP_200_OK,
     HTTP_201_CREATED,
     HTTP_404_NOT_FOUND,
+    HTTP_412_PRECONDITION_FAILED,
     HTTP_422_UNPROCESSABLE_ENTITY,
 )
 
@@ -148,6 +149,37 @@ class TestPartialUpdateProduct:
         )
         assert r.status_code == HTTP_404_NOT_FOUND
 
+    @pytest.mark.asyncio
+    async def test_partial_update_with_if_match(
+        self, app: FastAPI, client: AsyncClient, test_product: ProductInDB
+    ):
+        url = app.url_path_for(
+            "products:partial-update-product", product_id=str(test_product.id)
+        )
+
+        r = await client.patch(
+            url,
+            json=dict(name="first update"),
+            headers={"If-Match": test_product.updated_at.isoformat()},
+        )
+        assert r.status_code == HTTP_200_OK, r.text
+        last_seen_updated_at = r.json()["updated_at"]
+
+        # the product was modified since `test_product` was read
+        r = await client.patch(
+            url,
+            json=dict(name="second update"),
+            headers={"If-Match": test_product.updated_at.isoformat()},
+        )
+        assert r.status_code == HTTP_412_PRECONDITION_FAILED, r.text
+
+        r = await client.patch(
+            url,
+            json=dict(name="second update"),
+            headers={"If-Match": last_seen_updated_at},
+        )
+        assert r.status_code == HTTP_200_OK, r.text
+
 
 class TestGetProduct:
     """
@@ -0,0 +1,81 @@
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from starlette.status import HTTP_200_OK, HTTP_201_CREATED
+
+from app.api.middleware.query_budget import QueryBudgetExceeded, QueryBudgetMiddleware
+from app.core import config
+from app.db.instrumentation import current_request_stats
+from .customers_fixtures import test_customer
+from .products_fixtures import test_10_products
+
+
+class TestQueryBudget:
+    @pytest.mark.asyncio
+    async def test_order_items_are_not_inserted_one_by_one(
+        self, app: FastAPI, client: AsyncClient, test_customer, test_10_products
+    ):
+        address = dict(street="street", city="city", state="st", zip="1", country="c")
+
+        # the budget check raises in the tests: a per-item loop fails here
+        r = await client.post(
+            app.url_path_for("orders:create-order"),
+            json=dict(
+                customer_id=test_customer.id,
+                billing_address=address,
+                shipping_address=address,
+                items=[dict(product_id=p.id, qty=1) for p in test_10_products],
+            ),
+        )
+        assert r.status_code == HTTP_201_CREATED, r.text
+        assert len(r.json()["items"]) == len(test_10_products)
+
+    @pytest.mark.asyncio
+    async def test_repeated_statements_raise_in_tests(
+        self, app: FastAPI, client: AsyncClient, monkeypatch
+    ):
+        monkeypatch.setattr(config, "N_PLUS_ONE_THRESHOLD", 1)
+
+        with pytest.raises(QueryBudgetExceeded, match="ProductsRepository.get_all_products"):
+            await client.get(app.url_path_for("products:get-all-products"))
+
+    @pytest.mark.asyncio
+    async def test_violations_are_only_logged_in_production(
+        self, app: FastAPI, client: AsyncClient, monkeypatch
+    ):
+        app.state.query_budget_raise = False
+        monkeypatch.setattr(
+            config, "QUERY_BUDGETS", {"products:get-all-products": 1}
+        )
+        monkeypatch.setattr(config, "N_PLUS_ONE_THRESHOLD", 1)
+
+        r = await client.get(app.url_path_for("products:get-all-products"))
+        assert r.status_code == HTTP_200_OK
+
+        r = await client.get("/metrics")
+        assert (
+            'query_budget_violations_total{route="products:get-all-products",kind="n_plus_one"}'
+            in r.text
+        )
+
+    @pytest.mark.asyncio
+    async def test_violations_raise_before_the_response_is_sent(
+        self, app: FastAPI, client: AsyncClient, monkeypatch
+    ):
+        monkeypatch.setattr(config, "QUERY_BUDGETS", {"test:route": 1})
+
+        async def route(scope, receive, send):
+            for _ in range(2):
+                current_request_stats.get().record(0.001, 1, "test (test.py:1)")
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"{}"})
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = dict(type="http", method="GET", route_name="test:route", app=app)
+        with pytest.raises(QueryBudgetExceeded, match="2 queries"):
+            await QueryBudgetMiddleware(route)(scope, None, send)
+        assert sent == []
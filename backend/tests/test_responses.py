@@ -0,0 +1,250 @@
+import json
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import List
+
+import pytest
+from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+from httpx import AsyncClient
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+from starlette.status import HTTP_200_OK, HTTP_201_CREATED
+
+from app.api.responses import ORJSONResponse, to_content
+from app.core import config
+from .customers_fixtures import test_customer
+from .orders_fixtures import test_10_orders
+from .products_fixtures import test_10_products
+
+
+ADDRESS = dict(
+    street="1 Main Street", city="Springfield", state="IL", zip="62701", country="US"
+)
+
+
+class Line(BaseModel):
+    price: Decimal
+    qty: int
+
+
+class Document(BaseModel):
+    id: int
+    name: str
+    email: str
+    created_at: datetime
+    lines: List[Line]
+    note: str = None
+
+
+DOCUMENTS = [
+    Document(
+        id=1,
+        name="Çà et là",
+        email="someone@example.com",
+        created_at=datetime(2020, 10, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+        lines=[Line(price=Decimal("10.50"), qty=3), Line(price=Decimal("0.1"), qty=1)],
+    ),
+    Document(
+        id=2,
+        name="plain",
+        email="other@example.com",
+        created_at=datetime(2020, 10, 1, 9, 0, tzinfo=timezone(timedelta(hours=-3))),
+        lines=[],
+        note="with a note",
+    ),
+]
+
+
+class TestORJSONResponse:
+    def test_same_bytes_as_jsonable_encoder(self):
+        expected = JSONResponse(jsonable_encoder(DOCUMENTS)).body
+
+        assert ORJSONResponse(to_content(DOCUMENTS)).body == expected
+        assert ORJSONResponse(jsonable_encoder(DOCUMENTS)).body == expected
+
+    def test_options(self):
+        expected = JSONResponse(
+            jsonable_encoder(DOCUMENTS, exclude={"lines"}, exclude_none=True)
+        ).body
+
+        assert (
+            ORJSONResponse(
+                to_content(DOCUMENTS, exclude={"lines"}, exclude_none=True)
+            ).body
+            == expected
+        )
+        assert json.loads(expected)[0].keys() == {"id", "name", "email", "created_at"}
+
+    @pytest.mark.parametrize(
+        "options",
+        [
+            dict(exclude={"lines"}),
+            dict(include={"documents"}, exclude={"documents", "count"}),
+            dict(exclude_none=True),
+            dict(exclude_unset=True, exclude_defaults=True),
+        ],
+    )
+    def test_dict_content(self, options):
+        content = dict(
+            documents=DOCUMENTS,
+            by_id={document.id: document for document in DOCUMENTS},
+            lines=(line for line in DOCUMENTS[0].lines),
+            count=len(DOCUMENTS),
+            empty=None,
+        )
+        expected = JSONResponse(
+            jsonable_encoder(
+                dict(content, lines=list(DOCUMENTS[0].lines)), **options
+            )
+        ).body
+
+        assert ORJSONResponse(to_content(content, **options)).body == expected
+
+
+class TestTrustedRows:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "route_name",
+        [
+            "orders:get-all-orders",
+            "products:get-all-products",
+            "customers:get-all-customers",
+        ],
+    )
+    async def test_same_responses_without_validation(
+        self, app: FastAPI, client: AsyncClient, test_10_orders, monkeypatch, route_name
+    ):
+        url = app.url_path_for(route_name)
+        validated = await client.get(url)
+        assert validated.status_code == HTTP_200_OK
+
+        monkeypatch.setattr(config, "VALIDATE_DB_ROWS", False)
+        trusted = await client.get(url)
+
+        assert trusted.content == validated.content
+
+    @pytest.mark.asyncio
+    async def test_created_and_updated_orders_without_validation(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        test_customer,
+        test_10_products,
+        monkeypatch,
+    ):
+        async def assert_same_as_validated(trusted, order_id):
+            monkeypatch.setattr(config, "VALIDATE_DB_ROWS", True)
+            order = await client.get(
+                app.url_path_for("orders:get-order-by-id", order_id=order_id)
+            )
+            items = await client.get(
+                app.url_path_for("orders:get-all-order-items", order_id=order_id)
+            )
+            monkeypatch.setattr(config, "VALIDATE_DB_ROWS", False)
+
+            trusted = trusted.json()
+            by_id = lambda item: item["id"]
+            assert sorted(trusted.pop("items"), key=by_id) == sorted(items.json(), key=by_id)
+            assert trusted == order.json()
+
+        payload = dict(
+            customer_id=test_customer.id,
+            billing_address=ADDRESS,
+            shipping_address=ADDRESS,
+            items=[dict(product_id=product.id, qty=2) for product in test_10_products[:3]],
+        )
+        monkeypatch.setattr(config, "VALIDATE_DB_ROWS", False)
+
+        created = await client.post(app.url_path_for("orders:create-order"), json=payload)
+        assert created.status_code == HTTP_201_CREATED, created.text
+        order_id = created.json()["id"]
+        await assert_same_as_validated(created, order_id)
+
+        payload["items"] = [dict(product_id=test_10_products[5].id, qty=7)]
+        updated = await client.put(
+            app.url_path_for("orders:full-update-order", order_id=order_id), json=payload
+        )
+        assert updated.status_code == HTTP_200_OK, updated.text
+        await assert_same_as_validated(updated, order_id)
+
+        item_url = app.url_path_for(
+            "orders:partial-update-order-item",
+            order_id=order_id,
+            order_item_id=updated.json()["items"][0]["id"],
+        )
+        updated_item = await client.patch(item_url, json=dict(qty=5))
+        assert updated_item.status_code == HTTP_200_OK, updated_item.text
+
+        order_url = app.url_path_for("orders:partial-update-order", order_id=order_id)
+        updated_order = await client.patch(
+            order_url, json=dict(shipping_address=dict(ADDRESS, city="Elsewhere"))
+        )
+        assert updated_order.status_code == HTTP_200_OK, updated_order.text
+
+        monkeypatch.setattr(config, "VALIDATE_DB_ROWS", True)
+        assert (await client.get(item_url)).content == updated_item.content
+        assert (await client.get(order_url)).content == updated_order.content
+
+    def test_fields_of_other_types_are_validated(self):
+        from app.api.routing import _same_fields
+
+        class Row(BaseModel):
+            id: int
+            total: str
+
+        class Response(BaseModel):
+            id: int
+            total: float
+
+        class SameResponse(BaseModel):
+            id: int
+            total: str
+
+        assert not _same_fields(Row, Response)
+        assert _same_fields(Row, SameResponse)
+
+
+class TestDatabaseRenderedJSON:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "route_name, params",
+        [
+            ("orders:get-all-orders", {}),
+            ("orders:get-all-orders", {"skip": 3, "limit": 4}),
+            ("products:get-all-products", {}),
+            ("products:get-all-products", {"search": "1"}),
+            ("customers:get-all-customers", {}),
+        ],
+    )
+    async def test_same_pages_as_the_models(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        test_10_orders,
+        monkeypatch,
+        route_name,
+        params,
+    ):
+        url = app.url_path_for(route_name)
+        expected = await client.get(url, params=params)
+        assert expected.status_code == HTTP_200_OK
+
+        monkeypatch.setattr(config, "DB_RENDERED_JSON", True)
+        rendered = await client.get(url, params=params)
+
+        assert rendered.status_code == HTTP_200_OK
+        assert rendered.headers["content-type"] == "application/json"
+        # same JSON, floats aside (postgres renders 10.0 as 10)
+        assert rendered.json() == expected.json()
+
+    @pytest.mark.asyncio
+    async def test_empty_page(
+        self, app: FastAPI, client: AsyncClient, test_10_orders, monkeypatch
+    ):
+        monkeypatch.setattr(config, "DB_RENDERED_JSON", True)
+        res = await client.get(
+            app.url_path_for("orders:get-all-orders"), params={"skip": 1000}
+        )
+        assert res.status_code == HTTP_200_OK
+        assert res.content == b"[]"
@@ -0,0 +1,103 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from starlette.status import HTTP_200_OK
+
+from app.core import config
+from app.core.tracing import exporter, parse_traceparent
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+# requested before `client`: the exporter is started with the app
+@pytest.fixture
+def traces(tmp_path, monkeypatch):
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(config, "TRACING_EXPORTER", "file")
+    monkeypatch.setattr(config, "TRACING_FILE", str(path))
+    monkeypatch.setattr(config, "TRACING_SAMPLE_RATE", 0.0)
+    return path
+
+
+async def exported_spans(path):
+    await exporter.flush()
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+class TestTraceparent:
+    def test_valid_header(self):
+        assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01") == (
+            TRACE_ID,
+            PARENT_ID,
+            True,
+        )
+        assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-00") == (
+            TRACE_ID,
+            PARENT_ID,
+            False,
+        )
+
+    @pytest.mark.parametrize(
+        "value",
+        [
+            None,
+            "",
+            "garbage",
+            f"01-{TRACE_ID}-{PARENT_ID}-01",
+            f"00-{'0' * 32}-{PARENT_ID}-01",
+            f"00-{TRACE_ID}-{'0' * 16}-01",
+        ],
+    )
+    def test_invalid_header(self, value):
+        assert parse_traceparent(value) is None
+
+
+class TestTracing:
+    @pytest.mark.asyncio
+    async def test_sampled_request_is_traced(
+        self, traces, app: FastAPI, client: AsyncClient
+    ):
+        r = await client.get(
+            app.url_path_for("orders:get-all-orders"),
+            headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"},
+        )
+        assert r.status_code == HTTP_200_OK
+        assert r.headers["traceparent"].startswith(f"00-{TRACE_ID}-")
+
+        spans = await exported_spans(traces)
+        assert {span["trace_id"] for span in spans} == {TRACE_ID}
+
+        by_name = {span["name"]: span for span in spans}
+        root = by_name["GET orders:get-all-orders"]
+        assert root["parent_id"] == PARENT_ID
+        assert root["attributes"]["http.status_code"] == HTTP_200_OK
+        assert by_name["handler"]["parent_id"] == root["span_id"]
+        assert by_name["get_repository"]["attributes"]["repository"] == "OrdersRepository"
+
+        method = by_name["OrdersRepository.get_all_orders"]
+        statements = [span for span in spans if span["name"] == "statement"]
+        assert statements
+        assert all(span["parent_id"] == method["span_id"] for span in statements)
+        assert statements[0]["attributes"]["db.statement"].lower().startswith("select")
+
+    @pytest.mark.asyncio
+    async def test_unsampled_request_is_not_traced(
+        self, traces, app: FastAPI, client: AsyncClient
+    ):
+        r = await client.get(
+            app.url_path_for("orders:get-all-orders"),
+            headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-00"},
+        )
+        assert r.status_code == HTTP_200_OK
+        assert "traceparent" not in r.headers
+
+        r = await client.get(app.url_path_for("orders:get-all-orders"))
+        assert "traceparent" not in r.headers
+
+        assert await exported_spans(traces) == []
@@ -0,0 +1,59 @@
+import pytest
+from databases import Database
+from httpx import AsyncClient
+
+from app.db.repositories.orders import OrdersRepository
+from app.db.unit_of_work import UnitOfWork
+from app.models.order import OrderCreateUpdate
+from .customers_fixtures import test_customer
+from .orders_fixtures import test_order
+from .products_fixtures import test_10_products
+
+
+class TestUnitOfWork:
+    @pytest.mark.asyncio
+    async def test_totals_are_recomputed_on_commit(
+        self, client: AsyncClient, db: Database, test_order, test_10_products
+    ):
+        orders_repo = OrdersRepository(db)
+
+        async with UnitOfWork(db) as uow:
+            for product in test_10_products[:3]:
+                uow.queue_order_item(order_id=test_order.id, product_id=product.id, qty=2)
+
+            # nothing was written yet
+            order = await orders_repo.get_order_by_id(order_id=test_order.id)
+            assert order.total == test_order.total
+
+        expected_total = test_order.total + sum(
+            round(product.price * 2, 2) for product in test_10_products[:3]
+        )
+        order = await orders_repo.get_order_by_id(order_id=test_order.id)
+        assert order.total == pytest.approx(expected_total)
+
+    @pytest.mark.asyncio
+    async def test_rollback_on_error(
+        self, client: AsyncClient, db: Database, test_customer, test_10_products
+    ):
+        orders_repo = OrdersRepository(db)
+        created_order_id = None
+
+        with pytest.raises(ZeroDivisionError):
+            async with UnitOfWork(db) as uow:
+                order = await uow.repository(OrdersRepository).create_order(
+                    new_order=OrderCreateUpdate(
+                        customer_id=test_customer.id,
+                        billing_address=dict(
+                            street="street", city="city", state="st", zip="1", country="c"
+                        ),
+                        shipping_address=dict(
+                            street="street", city="city", state="st", zip="1", country="c"
+                        ),
+                        items=[dict(product_id=test_10_products[0].id, qty=1)],
+                    )
+                )
+                created_order_id = order.id
+                1 / 0
+
+        assert created_order_id is not None
+        assert await orders_repo.get_order_by_id(order_id=created_order_id) is None